@@ -3,7 +3,7 @@
 
 # # A Python Script for Stock Price Analysis of TSM with APO Indicator
 
-# This script uses Python libraries like pandas and yfinance to download historical stock data for a company called TSM from Yahoo Finance. The data is saved in a file called "tsm_data.pkl" to avoid redownloading it if it already exists.
+# This script uses Python libraries like pandas and yfinance to download historical stock data for a company called TSM from Yahoo Finance. The data is kept in a local price store in the "price_cache" directory, so only dates that have not been downloaded before are fetched again.
 # 
 # After downloading the data, the script calculates the Absolute Price Oscillator (APO), which is a technical indicator used to determine the momentum of a stock's price trend. It does this by calculating the difference between two exponential moving averages (EMAs) of different lengths, a "Fast" and a "Slow" EMA.
 # 
@@ -15,8 +15,9 @@
 
 
 import pandas as pd
-import yfinance as yf
 import matplotlib.pyplot as plt
+from financial_indicators.ema import apo
+from financial_indicators.store import PriceStore
 
 
 # In[3]:
@@ -24,17 +25,13 @@ import matplotlib.pyplot as plt
 
 start_date = "2019-01-01"
 end_date = "2023-04-13"
-DATA_SRC_FILENAME = 'tsm_data.pkl'
+DATA_DIR = 'price_cache' # local price store, only missing dates are downloaded
 
 
 # In[4]:
 
 
-try:
-    tsm_data2 = pd.read_pickle(DATA_SRC_FILENAME)
-except FileNotFoundError:
-    tsm_data2 = yf.download('TSM', start_date, end_date)
-    tsm_data2.to_pickle(DATA_SRC_FILENAME)
+tsm_data2 = PriceStore(DATA_DIR).get('TSM', start_date, end_date)
 
 
 # In[5]:
@@ -66,48 +63,19 @@ close = tsm_data['Close']
 # In[9]:
 
 
-num_periods_fast = 20 # time period for the fast EMA
-num_periods_slow = 50 # time period for slow EMA
-
-
-# In[10]:
-
-
-K_fast = 2 / (num_periods_fast + 1) # smoothing factor for fast EMA
-K_slow = 2 / (num_periods_slow + 1) # smoothing factor for slow EMA
+num_periods_fast = 10 # time period for the fast EMA
+num_periods_slow = 40 # time period for slow EMA
 
 
 # The smoothing factor, also known as the weighting factor, determines the degree of weighting decrease applied to each past price in the moving average calculation. The larger the value of the smoothing factor, the more weight is given to the most recent price data, resulting in a faster response to the price changes. In contrast, a smaller smoothing factor gives more weight to the historical price data, resulting in a slower response to the price changes.
 # 
-# The values of K_fast and K_slow in the code are calculated using the formula for exponential smoothing, which is a popular method for calculating the moving average. The formula uses the number of periods in the moving average to calculate the smoothing factor. A common value for the number of periods in a moving average is 20 for fast EMA and 50 for slow EMA. The smoothing factor is calculated as 2 divided by the number of periods plus 1. The resulting value is then used in the exponential smoothing formula to calculate the EMA for each period.
-
-# In[28]:
-
-
-# calculate Exponential Moving Averages and Absolute Price Oscillator
-close = tsm_data['Close']
-ema_fast_values = []
-ema_slow_values = []
-apo_values = []
-K_fast = 2 / (10 + 1)
-K_slow = 2 / (40 + 1)
-ema_fast = 0
-ema_slow = 0
-
+# apo() calculates the smoothing factors K_fast and K_slow from the number of periods with the formula for exponential smoothing, which is a popular method for calculating the moving average: 2 divided by the number of periods plus 1. The resulting value is then used in the exponential smoothing formula to calculate the EMA for each period.
 
 # In[29]:
 
 
-for close_price in close:
-    if ema_fast == 0:  # first observation
-        ema_fast = close_price
-        ema_slow = close_price
-    else:
-        ema_fast = (close_price - ema_fast) * K_fast + ema_fast
-        ema_slow = (close_price - ema_slow) * K_slow + ema_slow
-    ema_fast_values.append(ema_fast)
-    ema_slow_values.append(ema_slow)
-    apo_values.append(ema_fast - ema_slow)
+# calculate Exponential Moving Averages and Absolute Price Oscillator
+ema_fast_values, ema_slow_values, apo_values = apo(close.values, num_periods_fast, num_periods_slow)
 
 
 # ema_fast = (Close - EMA(previous)) x K_fast + EMA(previous)
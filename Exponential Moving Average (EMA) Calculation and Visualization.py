@@ -8,10 +8,11 @@
 # In[ ]:
 
 
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from financial_indicators.ema import ema
+from financial_indicators.store import PriceStore
 
 
 # In[ ]:
@@ -21,8 +22,8 @@ import matplotlib.pyplot as plt
 start_date = '2022-04-17'
 end_date = '2023-04-17'
 
-# Fetch the data using yfinance
-nvda_data = yf.download('NVDA', start=start_date, end=end_date)
+# Fetch the data, only dates missing from the local price store are downloaded
+nvda_data = PriceStore('price_cache').get('NVDA', start_date, end_date)
 
 # Extract the closing price
 close = nvda_data['Close']
@@ -33,15 +34,7 @@ close = nvda_data['Close']
 
 # Calculate the Exponential Moving Average (EMA)
 num_periods = 20 # number of days over which to average
-K = 2 / (num_periods + 1) # smoothing constant
-ema_p = 0
-ema_values = [] # to hold computed EMA values
-for close_price in close:
-    if (ema_p == 0): # first observation, EMA = current-price
-        ema_p = close_price
-    else:
-        ema_p = (close_price - ema_p) * K + ema_p
-    ema_values.append(ema_p)
+ema_values = ema(close.values, num_periods) # first observation, EMA = current-price
 
 
 # The EMA is calculated using the following formula:
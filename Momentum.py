@@ -20,15 +20,15 @@
 # In[ ]:
 
 
-import yfinance as yf
 import pandas as pd
 import matplotlib.pyplot as plt
+from financial_indicators.store import PriceStore
 
 
 # In[ ]:
 
 
-nvidia_data = yf.download('NVDA', start='2022-04-20', end='2023-04-20')
+nvidia_data = PriceStore('price_cache').get('NVDA', '2022-04-20', '2023-04-20')
 
 close = nvidia_data['Close']
 
@@ -16,17 +16,20 @@
 # In[20]:
 
 
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from financial_indicators.ema import macd
+from financial_indicators.store import PriceStore
 
 
 # In[21]:
 
 
 # Download the data for NVIDIA from the last year up to now
-nvda = yf.download('NVDA', period='1y')
+end_date = pd.Timestamp.today().normalize() + pd.Timedelta(days=1)
+start_date = end_date - pd.DateOffset(years=1)
+nvda = PriceStore('price_cache').get('NVDA', start_date, end_date)
 
 # Define the parameters for the MACD indicator
 fast_ema = 12
@@ -37,20 +40,8 @@ signal_ema = 9
 # In[22]:
 
 
-# Calculate the fast and slow EMA
-ema_fast = nvda['Adj Close'].ewm(span=fast_ema, adjust=False).mean()
-ema_slow = nvda['Adj Close'].ewm(span=slow_ema, adjust=False).mean()
-
-
-# In[23]:
-
-
-# Calculate the MACD line and signal line
-macd_line = ema_fast - ema_slow
-signal_line = macd_line.ewm(span=signal_ema, adjust=False).mean()
-
-# Calculate the MACD histogram
-macd_histogram = macd_line - signal_line
+# Calculate the MACD line (fast EMA - slow EMA), the signal line and the MACD histogram
+macd_line, signal_line, macd_histogram = macd(nvda['Adj Close'].values, fast_ema, slow_ema, signal_ema)
 
 
 # In[24]:
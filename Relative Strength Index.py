@@ -19,10 +19,10 @@
 # In[12]:
 
 
-import yfinance as yf
 import pandas as pd
-import statistics as stats
 import matplotlib.pyplot as plt
+from financial_indicators.rsi import rsi
+from financial_indicators.store import PriceStore
 
 
 # In[13]:
@@ -31,10 +31,9 @@ import matplotlib.pyplot as plt
 start_date = '2022-04-20'
 end_date = '2023-04-20'
 
-nvidia = yf.Ticker("NVDA")
-nvidia_data = nvidia.history(start=start_date, end=end_date)
+nvidia_data = PriceStore('price_cache').get('NVDA', start_date, end_date)
 
-close = nvidia_data['Close']
+close = nvidia_data['Adj Close'] # dividend and split adjusted close
 print(nvidia_data)
 
 
@@ -42,59 +41,14 @@ print(nvidia_data)
 
 
 time_period = 20 # look back period to compute gains & losses
-gain_history = [] # history of gains over look back period (0 if no gain, magnitude of gain if gain)
-loss_history = [] # history of losses over look back period (0 if no loss, magnitude of loss if loss)
-avg_gain_values = [] # track avg gains for visualization purposes
-avg_loss_values = [] # track avg losses for visualization purposes
-rsi_values = [] # track computed RSI values
-last_price = 0 # current_price - last_price > 0 => gain. current_price - last_price < 0 => loss.
+rsi_mode = 'simple' # 'simple' averages the last 'time_period' gains & losses, 'wilder' uses Wilder's smoothing
 
 
 # In[15]:
 
 
-for close_price in close:
-    if last_price == 0:
-        last_price = close_price
-
-    gain_history.append(max(0, close_price - last_price))
-    loss_history.append(max(0, last_price - close_price))
-    last_price = close_price
-
-    if len(gain_history) > time_period: # maximum observations is equal to lookback period
-        del (gain_history[0])
-        del (loss_history[0])
-
-    avg_gain = stats.mean(gain_history) # average gain over lookback period
-    avg_loss = stats.mean(loss_history) # average loss over lookback period
-
-    avg_gain_values.append(avg_gain)
-    avg_loss_values.append(avg_loss)
-
-    rs = 0
-    if avg_loss > 0: # to avoid division by 0, which is undefined
-        rs = avg_gain / avg_loss
-
-    rsi = 100 - (100 / (1 + rs))
-    rsi_values.append(rsi)
-
-
-# In[16]:
-
-
-print(last_price)
-
-
-# In[17]:
-
-
-print(avg_gain)
-
-
-# In[18]:
-
-
-print(close_price)
+# average gains, average losses and RSI for every bar, the first price is compared with itself
+avg_gain_values, avg_loss_values, rsi_values = rsi(close.values, time_period, rsi_mode)
 
 
 # In[19]:
@@ -103,18 +57,6 @@ print(close_price)
 print(avg_gain_values)
 
 
-# In[20]:
-
-
-print(avg_loss)
-
-
-# In[21]:
-
-
-print(rs)
-
-
 # In[23]:
 
 
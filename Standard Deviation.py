@@ -26,12 +26,10 @@
 # In[3]:
 
 
-import yfinance as yf
 import pandas as pd
-import statistics as stats
 import matplotlib.pyplot as plt
-import statistics as stats
-import math as math
+from financial_indicators.rolling import rolling_moments
+from financial_indicators.store import PriceStore
 
 
 # In[4]:
@@ -40,10 +38,9 @@ import math as math
 start_date = '2022-04-24'
 end_date = '2023-04-24'
 
-goog = yf.Ticker("GOOG")
-goog_data = goog.history(start=start_date, end=end_date)
+goog_data = PriceStore('price_cache').get('GOOG', start_date, end_date)
 
-close = goog_data['Close']
+close = goog_data['Adj Close'] # dividend and split adjusted close
 print(goog_data)
 
 
@@ -51,34 +48,19 @@ print(goog_data)
 
 
 time_period = 20 # look back period
-history = [] # history of prices
-sma_values = [] # to track moving average values for visualization purposes
-stddev_values = [] # history of computed stdev values
 
 
 # In[6]:
 
 
-for close_price in close:
-  history.append(close_price)
-  if len(history) > time_period: # we track at most 'time_period' number of prices
-    del (history[0])
-
-  sma = stats.mean(history)
-  sma_values.append(sma)
-  variance = 0 # variance is square of standard deviation
-  for hist_price in history:
-    variance = variance + ((hist_price - sma) ** 2)
-
-  stdev = math.sqrt(variance / len(history))
-
-  stddev_values.append(stdev)
+# moving average and population standard deviation over at most 'time_period' prices
+sma_values, stddev_values = rolling_moments(close.values, time_period)
 
 
 # In[9]:
 
 
-print(history)
+print(close.values[-time_period:])
 
 
 # In[15]:
@@ -105,7 +87,7 @@ ax2 = ax1.twinx()
 color = 'tab:blue'
 ax2.set_ylabel('Stddev in $', color=color)
 stddev.plot(ax=ax2, color=color, lw=2., legend=True)
-ax2.axhline(y=stats.mean(stddev_values), color='k')
+ax2.axhline(y=stddev_values.mean(), color='k')
 ax2.tick_params(axis='y', labelcolor=color)
 
 fig.tight_layout()
@@ -8,21 +8,19 @@
 # In[20]:
 
 
-import yfinance as yf
-import statistics as stats
-import math as math
+import pandas as pd
 import matplotlib.pyplot as plt
-get_ipython().run_line_magic('matplotlib', 'inline')
+from financial_indicators.rolling import rolling_moments
+from financial_indicators.store import PriceStore
 
 
 # In[21]:
 
 
-nvidia = yf.Ticker("NVDA")
 start_date = '2022-04-17'
 end_date = '2023-04-17'
-nvda_data = nvidia.history(start=start_date, end=end_date)
-close = nvda_data['Close']
+nvda_data = PriceStore('price_cache').get('NVDA', start_date, end_date)
+close = nvda_data['Adj Close'] # dividend and split adjusted close
 print(nvda_data)
 
 
@@ -31,10 +29,6 @@ print(nvda_data)
 
 time_period = 20 # history length for Simple Moving Average for middle band
 stdev_factor = 2 # Standard Deviation Scaling factor for the upper and lower bands
-history = [] # price history for computing simple moving average
-sma_values = [] # moving average of prices for visualization purposes
-upper_band = [] # upper band values
-lower_bound = [] # lower band values
 
 
 # The Bollinger Band (BBANDS) study created by John Bollinger plots upper and lower envelope bands around the price of the instrument. The width of the bands is based on the standard deviation of the closing prices from a moving average of price.
@@ -68,23 +62,11 @@ lower_bound = [] # lower band values
 # In[30]:
 
 
-for close_price in close:
-    history.append(close_price)
-    if len(history) > time_period: # we only want to maintain at most 'time_period' number of price observations
-        del(history[0])
-        
-    sma = stats.mean(history)
-    sma_values.append(sma) # simple moving average or middle band
-    variance = 0 # variance is the square of standard deviation
-    for hist_price in history:
-        variance = variance + ((hist_price - sma)**2)
-        
-    # use square root to get standard deviation
-    stdev = math.sqrt(variance / len(history))
-    
-    upper_band.append(sma + stdev_factor * stdev)
-    lower_band.append(sma - stdev_factor * stdev)
-        
+# simple moving average (middle band) and standard deviation over at most 'time_period' prices
+sma_values, stdev = rolling_moments(close.values, time_period)
+
+upper_band = sma_values + stdev_factor * stdev
+lower_band = sma_values - stdev_factor * stdev
 
 
 # In[31]:
@@ -0,0 +1 @@
+# Lets pytest import financial_indicators from the checkout, without installing it.
@@ -0,0 +1,47 @@
+"""Financial indicators: APO, EMA, MACD, RSI, Momentum, Standard Deviation,
+Bollinger Bands and seasonality.
+
+Importing the package only loads numpy and the indicator kernels. The price
+store (pandas, yfinance), chart rendering (matplotlib), the statistical tests
+and the universe tools are imported on first use, e.g. by touching
+financial_indicators.PriceStore or financial_indicators.render.
+"""
+
+import importlib
+
+from .ema import apo, ema, ema_kernel, macd, smoothing_factor
+from .momentum import momentum, momentum_matrix
+from .rolling import RollingMoments, bollinger_bands, rolling_mean, rolling_moments
+from .rsi import rsi
+from .streaming import APO, EMA, MACD, RSI, BollingerBands, Momentum, StdDev
+
+# name -> submodule it is imported from when first used
+_LAZY = {
+    'CsvProvider': 'store', 'PriceStore': 'store', 'YahooProvider': 'store',
+    'Universe': 'universe', 'UniverseWriter': 'universe', 'build_universe': 'universe',
+    'sweep_universe': 'sweep',
+    'render_chart': 'render', 'render_universe': 'render',
+    'fit_universe': 'arima', 'rolling_adf': 'adf', 'Plan': 'graph',
+    'IndicatorStore': 'incremental', 'BulkFetcher': 'fetch', 'HttpProvider': 'fetch',
+    'MultiTimeframe': 'resample', 'Signals': 'signals', 'extract_signals': 'signals',
+    'acf': 'correlogram', 'pacf': 'correlogram',
+}
+# ema, momentum and rsi are the functions, not the submodules
+_SUBMODULES = ('adf', 'arima', 'backends', 'bench', 'chunked', 'correlogram', 'fetch', 'graph',
+               'incremental', 'metrics', 'precision', 'render', 'resample', 'rolling', 'scan',
+               'seasonality', 'signals', 'store', 'streaming', 'sweep', 'universe')
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module('.' + _LAZY[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | set(_SUBMODULES))
@@ -0,0 +1,159 @@
+# Augmented Dickey-Fuller test on rolling windows
+#
+# The notebook's test_stationarity calls statsmodels' adfuller(x, autolag='AIC')
+# once per series. Gating strategies on stationarity needs the test on every
+# rolling window (e.g. 252 bars stepped daily) of every symbol, so here the
+# regressions of many windows are solved together:
+#
+#   diff(x)[t] = const + gamma * x[t-1] + sum_j beta_j * diff(x)[t-j] + e[t]
+#
+# - the lagged design matrices of a chunk of windows are copied from strided
+#   views of the prices
+# - the constant is handled by centering every column in its window (same
+#   coefficients, residuals and t-values as with a constant column)
+# - one triangular factor per window (Cholesky of the stacked Gram matrices,
+#   QR if a window is singular) gives the residual sum of squares of every
+#   nested lag length at once, so the AIC search over lags is one batched
+#   factorization instead of maxlag + 1 regressions
+# - the final regression is done per group of windows with the same lag
+#
+# Lag selection, sample sizes and the MacKinnon p-value follow adfuller with
+# regression='c', so statistics, p-values and lags agree with statsmodels.
+
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .metrics import timed
+
+AUTOLAGS = ('AIC', 'BIC', None)
+CHUNK_BYTES = 64 << 20 # design matrices built at a time
+
+# MacKinnon (1994) p-value surface for the test with a constant, as in
+# statsmodels.tsa.adfvalues
+_TAU_MAX = 2.74
+_TAU_MIN = -18.83
+_TAU_STAR = -1.61
+_TAU_SMALLP = (2.1659, 1.4412, 0.038269)
+_TAU_LARGEP = (1.7339, 0.93202, -0.12745, -0.010368)
+
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def adf_maxlag(window, maxlag=None):
+    """Largest lag searched for a window, adfuller's default is 12 * (n / 100) ** (1 / 4)."""
+    limit = window // 2 - 2 # nobs // 2 - 1 - one deterministic term
+    if maxlag is None:
+        maxlag = min(limit, int(math.ceil(12.0 * (window / 100.0) ** 0.25)))
+        if maxlag < 0:
+            raise ValueError('window of %d bars is too short for the test' % window)
+    elif maxlag > limit:
+        raise ValueError('maxlag must be at most %d for a window of %d bars, got %r'
+                         % (limit, window, maxlag))
+    return maxlag
+
+
+def adf_pvalue(stat):
+    """MacKinnon's approximate p-value of ADF statistics (constant, no trend)."""
+    stat = np.asarray(stat, dtype=np.float64)
+    z = np.where(stat <= _TAU_STAR, np.polynomial.polynomial.polyval(stat, _TAU_SMALLP),
+                 np.polynomial.polynomial.polyval(stat, _TAU_LARGEP))
+    pvalue = 0.5 * _erfc(-z / math.sqrt(2)).astype(np.float64) # standard normal cdf
+    pvalue = np.where(stat > _TAU_MAX, 1.0, pvalue)
+    return np.where(stat < _TAU_MIN, 0.0, pvalue)
+
+
+def _r_factor(B):
+    # R of the QR decomposition of every stacked design (given as columns x rows),
+    # from the Cholesky factor of the Gram matrix, which is quicker, unless a
+    # window is singular
+    try:
+        return np.swapaxes(np.linalg.cholesky(B @ np.swapaxes(B, 1, 2)), 1, 2)
+    except np.linalg.LinAlgError:
+        return np.linalg.qr(np.swapaxes(B, 1, 2), mode='r')
+
+
+def _design(X, D, lags, level_first):
+    # rows t = lags .. window - 2 of the windows' regressions, stored column by
+    # column and centered: the lagged level, diff lags 1..lags and diff(x)[t]
+    # last. Shifted diffs are one strided view, shift k is D[:, k:k + nobs]
+    window = X.shape[1]
+    nobs = window - 1 - lags
+    shifts = sliding_window_view(D, nobs, axis=1)
+    B = np.empty((len(X), lags + 2, nobs))
+    first = 1 if level_first else 0
+    B[:, first:first + lags] = shifts[:, lags - 1::-1] if lags else shifts[:, :0] # lag j is shift lags - j
+    B[:, 0 if level_first else lags] = X[:, lags:window - 1]
+    B[:, -1] = shifts[:, lags]
+    B -= B.mean(axis=2, keepdims=True)
+    return B
+
+
+def _adf_windows(X, maxlag, autolag):
+    # ADF statistic and lag of every row of X (windows x window, no NaN)
+    window = X.shape[1]
+    D = np.diff(X, axis=1)
+    lags = np.full(len(X), maxlag)
+    if autolag is not None:
+        # every lag length is compared on the same sample, the one of maxlag
+        nobs = window - 1 - maxlag
+        R = _r_factor(_design(X, D, maxlag, level_first=True))
+        ssr = np.cumsum((R[:, :, -1] ** 2)[:, ::-1], axis=1)[:, ::-1][:, 1:] # by lag 0..maxlag
+        with np.errstate(divide='ignore'):
+            llf = -nobs / 2 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+        penalty = 2 if autolag == 'AIC' else np.log(nobs)
+        lags = np.argmin(-2 * llf + penalty * (np.arange(maxlag + 1) + 2), axis=1)
+
+    stat = np.empty(len(X))
+    for lag in np.unique(lags):
+        rows = np.flatnonzero(lags == lag)
+        nobs = window - 1 - lag
+        # the level is the last regressor, so its t-value is read off the factor
+        R = _r_factor(_design(X[rows], D[rows], lag, level_first=False))
+        sigma = np.abs(R[:, -1, -1]) / np.sqrt(nobs - lag - 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stat[rows] = np.sign(R[:, -2, -2]) * R[:, -2, -1] / sigma
+    return stat, lags
+
+
+@timed('kernel.rolling_adf')
+def rolling_adf(prices, window=252, step=1, maxlag=None, autolag='AIC'):
+    """ADF test (with a constant) on every `window` bars, `step` bars apart.
+
+    Works on a 1-D series or a symbols x bars array. Returns (stat, pvalue,
+    lags) with shape prices.shape[:-1] + (windows,), where window w covers
+    bars w * step .. w * step + window - 1. autolag='AIC' or 'BIC' picks the
+    lag up to maxlag as adfuller does, autolag=None always uses maxlag.
+    Windows with a NaN price give NaN and lag -1.
+    """
+    if autolag is not None:
+        autolag = autolag.upper()
+    if autolag not in AUTOLAGS:
+        raise ValueError('autolag must be one of AIC, BIC or None, got %r' % (autolag,))
+    x = np.asarray(prices, dtype=np.float64)
+    n = x.shape[-1]
+    maxlag = adf_maxlag(window, maxlag)
+    x2 = x.reshape(-1, n)
+    starts = np.arange(0, n - window + 1, step)
+    count = len(x2) * len(starts)
+    stat = np.full(count, np.nan)
+    lags = np.full(count, -1, dtype=np.intp)
+
+    views = sliding_window_view(x2, window, axis=-1) if count else None
+    per = max(1, CHUNK_BYTES // (8 * window * (maxlag + 2)))
+    for c0 in range(0, count, per):
+        index = np.arange(c0, min(count, c0 + per))
+        X = views[index // len(starts), starts[index % len(starts)]]
+        ok = ~np.isnan(X).any(axis=1)
+        if ok.any():
+            stat[index[ok]], lags[index[ok]] = _adf_windows(X[ok], maxlag, autolag)
+    shape = x.shape[:-1] + (len(starts),)
+    return stat.reshape(shape), adf_pvalue(stat).reshape(shape), lags.reshape(shape)
+
+
+def adf(prices, maxlag=None, autolag='AIC'):
+    """ADF test on the whole series (last axis), returns (stat, pvalue, lags)."""
+    x = np.asarray(prices, dtype=np.float64)
+    stat, pvalue, lags = rolling_adf(x, x.shape[-1], 1, maxlag, autolag)
+    return stat[..., 0], pvalue[..., 0], lags[..., 0]
@@ -0,0 +1,168 @@
+# ARIMA models of the monthly returns, fitted for a whole universe
+#
+# The Seasonality notebook fits ARIMA(2, 0, 2) to the mean daily return of each
+# month of one symbol. Here the same series is built for every symbol and the
+# model (or a small grid of orders) is refitted on a rolling origin, once per
+# month with the history up to that month:
+#
+# - each refit starts from the parameters of the previous month's fit, which
+#   is usually close, so the optimizer needs few iterations
+# - every fit is stored in an on-disk cache keyed by symbol, order and a
+#   fingerprint of the data it was fitted on, so a series that did not change
+#   is never fitted again and a new month only costs one fit per order
+# - (symbol, order) chains are spread over a process pool, the refits of one
+#   chain run in order in the same worker
+#
+# statsmodels is only imported when a model is fitted.
+#
+# Every fit is reported as a dict with the symbol, order, origin month, the
+# parameters, whether the optimizer converged, the log likelihood, AIC and the
+# wall time the fit took.
+
+import hashlib
+import json
+import os
+import time
+import warnings
+from multiprocessing import Pool
+
+import numpy as np
+
+from .seasonality import period_returns
+from .universe import OUTPUT_DIR, Universe
+
+ORDERS = ((2, 0, 2),) # the notebook's model
+ORDER_GRID = ((1, 0, 0), (0, 0, 1), (1, 0, 1), (2, 0, 2))
+MIN_MONTHS = 24 # history needed before the first fit
+CACHE_DIR = 'arima'
+
+
+def monthly_returns(dates, prices):
+    """Mean daily return of every month, returns (months, returns).
+
+    months is a datetime64[M] array. The first month is dropped as in the
+    notebook, which fits google_monthly_return[1:].
+    """
+    values, _ = period_returns(prices, dates, 'month')
+    months = np.unique(np.asarray(dates).astype('datetime64[M]'))
+    return months[1:], values[1:]
+
+
+def fingerprint(values):
+    """Hash of the exact float64 values a model is fitted on."""
+    return hashlib.sha1(np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()
+
+
+class FitCache:
+    """Fitted ARIMA parameters on disk, one JSON file per (symbol, order, data)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, symbol, order, key):
+        return os.path.join(self.root, symbol, '%d_%d_%d' % tuple(order), key + '.json')
+
+    def get(self, symbol, order, key):
+        try:
+            with open(self._path(symbol, order, key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, symbol, order, key, record):
+        from .store import _atomic_write # the store brings in pandas
+
+        path = self._path(symbol, order, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write(path, lambda f: f.write(json.dumps(record).encode()))
+
+
+def fit_arima(values, order, start_params=None):
+    """Fit one ARIMA model, returns the fit record without symbol and origin."""
+    from statsmodels.tsa.arima.model import ARIMA
+
+    start = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore') # convergence is reported in the record
+            result = ARIMA(np.asarray(values, dtype=np.float64), order=tuple(order)).fit(
+                start_params=None if start_params is None else np.asarray(start_params))
+    except (ValueError, np.linalg.LinAlgError) as e:
+        return {'params': None, 'converged': False, 'llf': None, 'aic': None,
+                'error': str(e), 'wall': time.perf_counter() - start}
+    retvals = result.mle_retvals or {}
+    return {'params': [float(p) for p in result.params],
+            'converged': bool(retvals.get('converged', True)),
+            'llf': float(result.llf), 'aic': float(result.aic), 'error': None,
+            'wall': time.perf_counter() - start}
+
+
+def fit_rolling(symbol, months, values, order, cache=None, min_months=MIN_MONTHS, origins=None):
+    """Refit one (symbol, order) at every monthly origin, oldest first.
+
+    Origin k is fitted on the first k monthly returns. origins=N only fits the
+    last N origins. Cached fits are reused and still seed the next refit.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    first = int(np.argmax(~np.isnan(values))) if len(values) else 0 # skip months before the listing
+    ends = list(range(first + min_months, len(values) + 1))
+    if origins is not None:
+        ends = ends[len(ends) - origins:] if origins else []
+    records = []
+    previous = None
+    for end in ends:
+        series = values[first:end]
+        key = fingerprint(series)
+        record = cache.get(symbol, order, key) if cache is not None else None
+        cached = record is not None
+        if not cached:
+            record = fit_arima(series, order, previous)
+            if cache is not None:
+                cache.put(symbol, order, key, record)
+        if record['params'] is not None:
+            previous = record['params']
+        records.append(dict(record, symbol=symbol, order=tuple(order),
+                            origin=str(months[end - 1]), cached=cached))
+    return records
+
+
+def _fit_shard(path, jobs, column, cache_dir, min_months, origins):
+    universe = Universe(path)
+    cache = FitCache(cache_dir) if cache_dir else None
+    records = []
+    for symbol, order in jobs:
+        months, values = monthly_returns(universe.dates(symbol), universe.series(symbol, column))
+        records.extend(fit_rolling(symbol, months, values, order, cache, min_months, origins))
+    return records
+
+
+def _fit_shard_args(args):
+    return _fit_shard(*args)
+
+
+def fit_universe(universe, orders=ORDERS, symbols=None, column='Close', processes=None,
+                 cache_dir=None, min_months=MIN_MONTHS, origins=None):
+    """Rolling-origin ARIMA fits of the monthly returns of every symbol.
+
+    The cache goes to '<universe>/out/arima' unless `cache_dir` is given;
+    cache_dir=False disables it. Returns the fit records sorted by symbol,
+    order and origin, pd.DataFrame(records) gives a table.
+    """
+    if not isinstance(universe, Universe):
+        universe = Universe(universe)
+    if cache_dir is None:
+        cache_dir = os.path.join(universe.path, OUTPUT_DIR, CACHE_DIR)
+    symbols = universe.symbols if symbols is None else symbols
+    jobs = [(symbol, tuple(order)) for symbol in symbols for order in orders]
+    processes = processes or os.cpu_count() or 1
+    shards = [jobs[i::processes * 4] for i in range(min(len(jobs), processes * 4))]
+    args = [(universe.path, shard, column, cache_dir, min_months, origins) for shard in shards]
+    if processes == 1 or len(args) < 2:
+        records = [record for arg in args for record in _fit_shard(*arg)]
+    else:
+        with Pool(processes) as pool:
+            records = [record for shard in pool.imap_unordered(_fit_shard_args, args)
+                       for record in shard]
+    position = {symbol: i for i, symbol in enumerate(symbols)}
+    records.sort(key=lambda r: (position[r['symbol']], r['order'], r['origin']))
+    return records
@@ -0,0 +1,494 @@
+# Compute backends for the core kernels
+#
+# The scripts compute the same few things in different ways: hand loops (APO,
+# EMA, RSI, Standard Deviation), pandas ewm (MACD) and pandas rolling
+# (Seasonality). Here every core kernel has up to three implementations behind
+# one interface:
+#
+# python - plain Python loops over lists, the reference. Also the quickest for
+#          a handful of series or a few bars, where NumPy's cost per call
+#          dominates
+# numpy  - vectorized over all series at once
+# numba  - the loops of the python backend compiled with numba.njit, only when
+#          numba is installed. Compiled on first use and cached on disk
+#
+# The kernels all take float64 arrays of series x bars:
+#
+# ema(series, alphas)              EMAs for several smoothing factors K,
+#                                  alphas x series x bars
+# rolling_moments(series, window)  rolling mean and population stddev
+# rolling_mean(series, window)
+# shift(series, periods)           the price `periods` bars ago, the first
+#                                  price while there is no such bar
+# diff(series, periods)            series - shift(series, periods)
+# gains_losses(series)             gain and loss of every price change
+#
+# The batch functions (ema_kernel, rolling_moments, rsi, momentum, ...) reshape
+# their input and call select(kernel, size), which returns
+#
+# - the backend forced with set_backend() / use_backend() or by the
+#   FINANCIAL_INDICATORS_BACKEND environment variable, if any
+# - otherwise python for inputs up to PYTHON_MAX[kernel], numba for inputs of
+#   NUMBA_MIN[kernel] or more when it is installed, and numpy for the rest.
+#   Compiled numba loops are the quickest at any size, but the first call in
+#   a process loads numba and the compiled loops, about half a second, which
+#   only pays off for inputs where numpy is markedly slower
+#
+# All backends do the same arithmetic in the same order, so they return the
+# same numbers. conformance() checks every available backend against the
+# python reference:
+#
+#   python -m financial_indicators.bench --conformance
+
+import contextlib
+import importlib.util
+import math
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+ENV_VAR = 'FINANCIAL_INDICATORS_BACKEND'
+KERNELS = ('ema', 'rolling_moments', 'rolling_mean', 'shift', 'diff', 'gains_losses')
+
+# without numba, inputs up to this size go to the python backend:
+# series x smoothing factors for ema (its loop is cheaper than one NumPy step
+# per bar however long the series), series x bars for the others
+PYTHON_MAX = {'ema': 16, 'rolling_moments': 96, 'rolling_mean': 96, 'shift': 0, 'diff': 0,
+              'gains_losses': 24}
+# smallest input size (series x bars) sent to numba when it is installed; numpy
+# EMAs are a Python loop over the bars, slower than numba at any size
+NUMBA_MIN = {'ema': 17, 'rolling_moments': 2048, 'rolling_mean': 2048, 'shift': 65536,
+             'diff': 65536, 'gains_losses': 2048}
+
+
+# Loops of the python and numba backends. They index their arguments one
+# element at a time, which works on lists (python) and on arrays (numba).
+
+def _ema_loop(series, alphas, out):
+    for a in range(len(alphas)):
+        K = alphas[a]
+        for i in range(len(series)):
+            row = series[i]
+            values = out[a][i]
+            ema_p = math.nan
+            for t in range(len(row)):
+                price = row[t]
+                if price != price: # NaN, EMA carries over
+                    pass
+                elif ema_p != ema_p: # first observation, EMA = current price
+                    ema_p = price
+                else:
+                    ema_p = (price - ema_p) * K + ema_p
+                values[t] = ema_p
+    return out
+
+
+def _moments_loop(series, window, squares, mean, stdev, base_sum, base_sq, base_nan):
+    # the block scheme of _window_sums, one bar at a time: the sums of every
+    # window ending in a block are running sums relative to the block's first
+    # price, started window - 1 bars before the block. NaN prices add nothing
+    # to the sums and are counted instead; a window with one is NaN
+    for i in range(len(series)):
+        row = series[i]
+        row_mean = mean[i]
+        row_stdev = stdev[i]
+        n = len(row)
+        for block in range(0, n, window):
+            shift = row[block]
+            if shift != shift: # NaN, the sums are taken relative to 0
+                shift = 0.0
+            total = 0.0
+            total_sq = 0.0
+            nans = 0
+            for p in range(window - 1): # the bars before the block
+                base_sum[p] = total
+                base_sq[p] = total_sq
+                base_nan[p] = nans
+                t = block - window + 1 + p
+                if t >= 0:
+                    if row[t] != row[t]:
+                        nans += 1
+                    else:
+                        d = row[t] - shift
+                        total += d
+                        total_sq += d * d
+            base_sum[window - 1] = total
+            base_sq[window - 1] = total_sq
+            base_nan[window - 1] = nans
+            for t in range(block, min(block + window, n)):
+                if row[t] != row[t]:
+                    nans += 1
+                else:
+                    d = row[t] - shift
+                    total += d
+                    total_sq += d * d
+                if nans > base_nan[t - block]: # a NaN in the window
+                    row_mean[t] = math.nan
+                    if squares:
+                        row_stdev[t] = math.nan
+                    continue
+                count = t + 1 if t + 1 < window else window
+                m = (total - base_sum[t - block]) / count
+                row_mean[t] = m + shift
+                if squares:
+                    variance = (total_sq - base_sq[t - block]) / count - m * m
+                    if variance < 0.0:
+                        variance = 0.0
+                    row_stdev[t] = math.sqrt(variance)
+    return mean, stdev
+
+
+def _shift_loop(series, periods, out):
+    for i in range(len(series)):
+        row = series[i]
+        values = out[i]
+        for t in range(len(row)):
+            values[t] = row[t - periods] if t >= periods else row[0]
+    return out
+
+
+def _gains_losses_loop(series, gain, loss):
+    for i in range(len(series)):
+        row = series[i]
+        row_gain = gain[i]
+        row_loss = loss[i]
+        last = math.nan # last price that was there
+        for t in range(len(row)):
+            price = row[t]
+            change = 0.0 # a missing price counts as no change
+            if price == price:
+                if last == last:
+                    change = price - last
+                last = price
+            row_gain[t] = change if change > 0.0 else 0.0
+            row_loss[t] = -change if change < 0.0 else 0.0
+    return gain, loss
+
+
+def _window_sums(x, window, squares):
+    # The series is cut into blocks of 'window' bars. Every window that ends in
+    # a block lies inside a segment made of the block plus the window - 1 bars
+    # before it, so running sums taken over each segment never grow beyond two
+    # windows and stay well conditioned however long the history is.
+    n = x.shape[-1]
+    n_blocks = -(-n // window)
+    pad_front = window - 1
+    pad_back = n_blocks * window - n
+    lead = x.shape[:-1]
+    padded = np.zeros(lead + (pad_front + n + pad_back,))
+    padded[..., pad_front:pad_front + n] = x
+    valid = np.zeros(padded.shape[-1])
+    valid[pad_front:pad_front + n] = 1.0
+
+    seg_len = 2 * window - 1
+    segments = sliding_window_view(padded, seg_len, axis=-1)[..., ::window, :]
+    seg_valid = sliding_window_view(valid, seg_len)[::window, :]
+
+    # prices relative to the first bar of each block (0 if it is NaN), padding
+    # and NaN prices zeroed out; the NaNs are counted separately
+    shift = segments[..., pad_front:pad_front + 1]
+    shift = np.where(np.isnan(shift), 0.0, shift)
+    missing = np.isnan(segments)
+    d = np.where(missing, 0.0, segments - shift) * seg_valid
+    zero = np.zeros(d.shape[:-1] + (1,))
+    csum = np.concatenate([zero, np.cumsum(d, axis=-1)], axis=-1)
+    wsum = (csum[..., window:] - csum[..., :window]).reshape(lead + (-1,))[..., :n]
+    cnan = np.concatenate([zero, np.cumsum(missing, axis=-1)], axis=-1)
+    wnan = (cnan[..., window:] - cnan[..., :window]).reshape(lead + (-1,))[..., :n]
+    wsq = None
+    if squares:
+        csq = np.concatenate([zero, np.cumsum(d * d, axis=-1)], axis=-1)
+        wsq = (csq[..., window:] - csq[..., :window]).reshape(lead + (-1,))[..., :n]
+    shift = np.repeat(shift[..., 0], window, axis=-1)[..., :n]
+    count = np.minimum(np.arange(1, n + 1), window) # window length at each bar
+    return shift, count, wsum, wsq, wnan > 0
+
+
+class Backend:
+    """One implementation of every kernel, on float64 series x bars arrays."""
+
+    __slots__ = ()
+    name = None
+
+    def available(self):
+        return True
+
+    def ema(self, series, alphas):
+        raise NotImplementedError
+
+    def rolling_moments(self, series, window):
+        raise NotImplementedError
+
+    def rolling_mean(self, series, window):
+        raise NotImplementedError
+
+    def shift(self, series, periods):
+        raise NotImplementedError
+
+    def diff(self, series, periods):
+        return series - self.shift(series, periods)
+
+    def gains_losses(self, series):
+        raise NotImplementedError
+
+
+class PythonBackend(Backend):
+    """The reference: the loops run by the interpreter on lists of floats."""
+
+    __slots__ = ()
+    name = 'python'
+
+    def ema(self, series, alphas):
+        m, n = series.shape
+        out = [[[0.0] * n for _ in range(m)] for _ in range(len(alphas))]
+        _ema_loop(series.tolist(), alphas.tolist(), out)
+        return np.array(out, dtype=np.float64).reshape(len(alphas), m, n)
+
+    def _moments(self, series, window, squares):
+        m, n = series.shape
+        mean = [[0.0] * n for _ in range(m)]
+        stdev = [[0.0] * n for _ in range(m)] if squares else mean
+        _moments_loop(series.tolist(), window, squares, mean, stdev, [0.0] * window, [0.0] * window,
+                      [0] * window)
+        return (np.array(mean, dtype=np.float64).reshape(m, n),
+                np.array(stdev, dtype=np.float64).reshape(m, n))
+
+    def rolling_moments(self, series, window):
+        return self._moments(series, window, True)
+
+    def rolling_mean(self, series, window):
+        return self._moments(series, window, False)[0]
+
+    def shift(self, series, periods):
+        out = [[0.0] * series.shape[1] for _ in range(series.shape[0])]
+        _shift_loop(series.tolist(), periods, out)
+        return np.array(out, dtype=np.float64).reshape(series.shape)
+
+    def gains_losses(self, series):
+        gain = [[0.0] * series.shape[1] for _ in range(series.shape[0])]
+        loss = [[0.0] * series.shape[1] for _ in range(series.shape[0])]
+        _gains_losses_loop(series.tolist(), gain, loss)
+        return (np.array(gain, dtype=np.float64).reshape(series.shape),
+                np.array(loss, dtype=np.float64).reshape(series.shape))
+
+
+class NumpyBackend(Backend):
+    """Vectorized over all series, one NumPy step per bar for the EMA."""
+
+    __slots__ = ()
+    name = 'numpy'
+
+    def ema(self, series, alphas):
+        # the recurrence runs once per bar over all series and smoothing
+        # factors at the same time
+        K = alphas.reshape(-1, 1)
+        m, n = series.shape
+        rows = np.ascontiguousarray(series.T) # bars x series, one row per bar
+        out = np.empty((n, K.shape[0], m))
+
+        missing = np.isnan(rows)
+        gap_in_bar = missing.any(axis=1)
+        state = np.full((K.shape[0], m), np.nan)
+        step = np.empty_like(state)
+        seeded = np.zeros(m, dtype=bool) # True once a series has seen its first price
+        all_seeded = m == 0
+        for t in range(n):
+            price = rows[t]
+            np.subtract(price, state, out=step)
+            step *= K
+            step += state # (P - EMAp) * K + EMAp
+            if not all_seeded or gap_in_bar[t]:
+                valid = ~missing[t]
+                start = valid & ~seeded
+                np.copyto(step, price, where=start) # first observation, EMA = current price
+                np.copyto(step, state, where=~valid) # no price, EMA carries over
+                seeded |= valid
+                all_seeded = seeded.all()
+            state, step = step, state
+            out[t] = state
+        return np.moveaxis(out, 0, -1)
+
+    def rolling_moments(self, series, window):
+        if series.shape[-1] == 0:
+            return series.copy(), series.copy()
+        shift, count, wsum, wsq, gaps = _window_sums(series, window, squares=True)
+        mean = wsum / count
+        variance = wsq / count - mean * mean
+        np.maximum(variance, 0.0, out=variance)
+        mean += shift
+        stdev = np.sqrt(variance)
+        mean[gaps] = np.nan
+        stdev[gaps] = np.nan
+        return mean, stdev
+
+    def rolling_mean(self, series, window):
+        if series.shape[-1] == 0:
+            return series.copy()
+        shift, count, wsum, _, gaps = _window_sums(series, window, squares=False)
+        mean = wsum / count + shift
+        mean[gaps] = np.nan
+        return mean
+
+    def shift(self, series, periods):
+        out = np.repeat(series[:, :1], series.shape[1], axis=1)
+        if periods == 0:
+            out[:] = series
+        elif periods < series.shape[1]:
+            out[:, periods:] = series[:, :-periods]
+        return out
+
+    def gains_losses(self, series):
+        n = series.shape[-1]
+        missing = np.isnan(series)
+        if missing.any(): # compare with the last price that was there
+            last = np.where(missing, 0, np.arange(n))
+            np.maximum.accumulate(last, axis=-1, out=last)
+            series = np.take_along_axis(series, last, axis=-1)
+        change = np.diff(series, axis=-1, prepend=series[..., :1])
+        change[np.isnan(change)] = 0.0
+        return np.maximum(change, 0.0), np.maximum(-change, 0.0)
+
+
+class NumbaBackend(Backend):
+    """The python backend's loops compiled with numba, when it is installed."""
+
+    __slots__ = ()
+    name = 'numba'
+    _loops = None # loop name -> compiled loop, filled on first use
+    _installed = None
+
+    def available(self):
+        if NumbaBackend._installed is None:
+            NumbaBackend._installed = importlib.util.find_spec('numba') is not None
+        return NumbaBackend._installed
+
+    def _compiled(self):
+        if NumbaBackend._loops is None:
+            from numba import njit
+
+            NumbaBackend._loops = {loop.__name__: njit(cache=True)(loop) for loop in
+                                   (_ema_loop, _moments_loop, _shift_loop, _gains_losses_loop)}
+        return NumbaBackend._loops
+
+    def ema(self, series, alphas):
+        out = np.empty((len(alphas),) + series.shape)
+        return self._compiled()['_ema_loop'](np.ascontiguousarray(series), alphas, out)
+
+    def _moments(self, series, window, squares):
+        mean = np.empty(series.shape)
+        stdev = np.empty(series.shape) if squares else mean
+        return self._compiled()['_moments_loop'](np.ascontiguousarray(series), window, squares,
+                                                 mean, stdev, np.empty(window), np.empty(window),
+                                                 np.empty(window, dtype=np.int64))
+
+    def rolling_moments(self, series, window):
+        return self._moments(series, window, True)
+
+    def rolling_mean(self, series, window):
+        return self._moments(series, window, False)[0]
+
+    def shift(self, series, periods):
+        return self._compiled()['_shift_loop'](np.ascontiguousarray(series), periods,
+                                               np.empty(series.shape))
+
+    def gains_losses(self, series):
+        return self._compiled()['_gains_losses_loop'](np.ascontiguousarray(series),
+                                                      np.empty(series.shape), np.empty(series.shape))
+
+
+BACKENDS = {backend.name: backend for backend in (PythonBackend(), NumpyBackend(), NumbaBackend())}
+
+_forced = os.environ.get(ENV_VAR) or None
+
+
+def available():
+    """Names of the backends that can run here."""
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def _check(name):
+    if name not in BACKENDS:
+        raise ValueError('backend must be one of %s, got %r' % (', '.join(BACKENDS), name))
+    if not BACKENDS[name].available():
+        raise ValueError('the %s backend is not available, %s is not installed' % (name, name))
+
+
+def set_backend(name):
+    """Use backend `name` for every kernel, or pick by size again with None."""
+    global _forced
+    if name is not None:
+        _check(name)
+    _forced = name
+
+
+def get_backend():
+    """Name of the forced backend, None when it is picked by size."""
+    return _forced
+
+
+@contextlib.contextmanager
+def use_backend(name):
+    """set_backend(name) inside a with block."""
+    previous = _forced
+    set_backend(name)
+    try:
+        yield BACKENDS[name] if name is not None else None
+    finally:
+        set_backend(previous)
+
+
+def select(kernel, size):
+    """Backend to run `kernel` on an input of `size` (see PYTHON_MAX and NUMBA_MIN)."""
+    if _forced is not None:
+        _check(_forced)
+        return BACKENDS[_forced]
+    if size <= PYTHON_MAX[kernel]:
+        return BACKENDS['python']
+    if size >= NUMBA_MIN[kernel] and BACKENDS['numba'].available():
+        return BACKENDS['numba']
+    return BACKENDS['numpy']
+
+
+def _inputs(seed):
+    # random walks with a leading gap, holes and a constant stretch
+    rng = np.random.default_rng(seed)
+    series = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (4, 300)), axis=1))
+    series[0, :5] = np.nan
+    series[1, rng.integers(0, 300, 20)] = np.nan
+    series[2, 100:150] = series[2, 100]
+    series[3, :] = np.nan
+    return [series, series[:1, :1], series[:, :0], series[:1, :37]]
+
+
+def _run(backend, kernel, series, parameter):
+    if kernel == 'ema':
+        return (backend.ema(series, np.asarray(parameter, dtype=np.float64)),)
+    if kernel == 'gains_losses':
+        return backend.gains_losses(series)
+    result = getattr(backend, kernel)(series, parameter)
+    return result if isinstance(result, tuple) else (result,)
+
+
+def conformance(backends=None, seed=0):
+    """Every available backend against the python reference on random inputs.
+
+    Returns a list of (backend, kernel, shape, parameter) that gave different
+    numbers, empty if all of them agree.
+    """
+    reference = BACKENDS['python']
+    names = [name for name in (backends or available()) if name != reference.name]
+    parameters = {'ema': ([2 / 11], [1.0, 2 / 21, 1 / 14]), 'rolling_moments': (1, 3, 20, 400),
+                  'rolling_mean': (1, 3, 20, 400), 'shift': (0, 1, 19, 400), 'diff': (0, 1, 19, 400),
+                  'gains_losses': (None,)}
+    failures = []
+    for series in _inputs(seed):
+        for kernel in KERNELS:
+            for parameter in parameters[kernel]:
+                expected = _run(reference, kernel, series, parameter)
+                for name in names:
+                    got = _run(BACKENDS[name], kernel, series, parameter)
+                    if not all(np.array_equal(g, e, equal_nan=True) for g, e in zip(got, expected)):
+                        failures.append((name, kernel, series.shape, parameter))
+    return failures
+
@@ -0,0 +1,554 @@
+# Benchmarks for every indicator
+#
+# Seeded synthetic prices (a geometric random walk, no network) from 1e3 to
+# 1e7 bars and 1 to 5000 symbols, with the implementations timed side by side:
+#
+# loop       - the per-bar list loops of the original scripts
+# pandas     - the pandas version of the scripts (ewm for MACD, groupby for
+#              seasonality)
+# vectorized - the batch functions of this package, all symbols in one call
+# streaming  - the bar by bar calculators of streaming.py
+# graph      - SCAN only: the scan's default indicators as one Plan (see
+#              graph.py) against the vectorized one call per indicator
+#
+# Each case records the best wall time of a few runs and the peak memory
+# allocated by one more run (tracemalloc, which sees numpy buffers too). The
+# pure Python variants only run where they finish in reasonable time, within
+# the 'loop_ops' and 'stream_cells' limits of the preset. Results are appended
+# as one JSON line per run to a history file with the git commit, and compare()
+# flags the cases that got slower than in the previous run on the same machine:
+#
+#   python -m financial_indicators.bench --preset quick --check
+#
+# --import-time times the cold import of the package instead, in fresh
+# interpreters after numpy is loaded, and fails if it loads one of the heavy
+# optional modules (pandas, matplotlib, ...), goes over IMPORT_BUDGET or, with
+# --check, got slower than in the previous run:
+#
+#   python -m financial_indicators.bench --import-time --check
+#
+# --conformance checks every available compute backend against the python
+# reference (see backends.py) and fails on any difference.
+#
+# --dtypes float64 float32 also times the vectorized and graph variants in
+# float32 mode on float32 prices (see precision.py), the peak memory column
+# shows the saving. --deviations prints the largest float32 errors against
+# float64.
+
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import statistics as stats
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import backends, streaming
+from .ema import apo, ema, macd
+from .graph import Plan
+from .momentum import momentum
+from .precision import DTYPES, deviations, use_dtype
+from .rolling import bollinger_bands, rolling_moments
+from .rsi import rsi
+from .seasonality import seasonality
+
+# loop_ops limits symbols x bars (x window for the loops that rescan their
+# window every bar) of the script loops, stream_cells symbols x bars of the
+# streaming calculators
+PRESETS = {
+    'quick': {'bars': (1000, 10000, 100000), 'symbols': (1, 100), 'windows': (20,),
+              'loop_ops': 3 * 10 ** 5, 'stream_cells': 2 * 10 ** 5},
+    'full': {'bars': (1000, 10000, 100000, 1000000, 10000000), 'symbols': (1, 10, 100, 1000, 5000),
+             'windows': (10, 20, 50, 200), 'loop_ops': 10 ** 7, 'stream_cells': 10 ** 7},
+}
+MAX_CELLS = 5 * 10 ** 7 # symbols x bars of the largest price matrix (400 MB)
+WINDOW_LOOPS = ('RSI', 'STDDEV', 'BBANDS') # script loops that are O(bars x window)
+HISTORY_FILE = 'bench_history.jsonl'
+THRESHOLD = 0.25 # slowdown flagged as a regression
+MIN_SECONDS = 0.05 # cases faster than this are too noisy to compare
+HEAVY_MODULES = ('pandas', 'matplotlib', 'yfinance', 'statsmodels', 'scipy')
+IMPORT_MODULES = ('financial_indicators',)
+IMPORT_BUDGET = 0.05 # seconds an import may add to the numpy import
+IMPORT_MIN_SECONDS = 0.002 # import slowdowns smaller than this are noise
+
+
+def synthetic_prices(symbols, bars, seed=0):
+    """Seeded random walk prices, returns (dates, prices) with prices symbols x bars."""
+    rng = np.random.default_rng(seed)
+    prices = rng.standard_normal((symbols, bars))
+    prices *= 0.01 # daily log returns of about 1%
+    np.cumsum(prices, axis=1, out=prices)
+    np.exp(prices, out=prices)
+    prices *= 100
+    dates = np.datetime64('2000-01-03') + np.arange(bars).astype('timedelta64[D]')
+    return dates, prices
+
+
+# The loops of the original scripts, one symbol at a time
+
+def _loop_ema(row, num_periods):
+    K = 2 / (num_periods + 1)
+    ema_p = 0
+    ema_values = []
+    for close_price in row:
+        if ema_p == 0:
+            ema_p = close_price
+        else:
+            ema_p = (close_price - ema_p) * K + ema_p
+        ema_values.append(ema_p)
+    return ema_values
+
+
+def _loop_apo(row, num_periods_fast):
+    K_fast = 2 / (num_periods_fast + 1)
+    K_slow = 2 / (4 * num_periods_fast + 1)
+    ema_fast = ema_slow = 0
+    apo_values = []
+    for close_price in row:
+        if ema_fast == 0:
+            ema_fast = ema_slow = close_price
+        else:
+            ema_fast = (close_price - ema_fast) * K_fast + ema_fast
+            ema_slow = (close_price - ema_slow) * K_slow + ema_slow
+        apo_values.append(ema_fast - ema_slow)
+    return apo_values
+
+
+def _loop_rsi(row, time_period):
+    gain_history = []
+    loss_history = []
+    rsi_values = []
+    last_price = 0
+    for close_price in row:
+        if last_price == 0:
+            last_price = close_price
+        gain_history.append(max(0, close_price - last_price))
+        loss_history.append(max(0, last_price - close_price))
+        last_price = close_price
+        if len(gain_history) > time_period:
+            del (gain_history[0])
+            del (loss_history[0])
+        avg_gain = stats.mean(gain_history)
+        avg_loss = stats.mean(loss_history)
+        rs = 0
+        if avg_loss > 0:
+            rs = avg_gain / avg_loss
+        rsi_values.append(100 - (100 / (1 + rs)))
+    return rsi_values
+
+
+def _loop_mom(row, time_period):
+    history = []
+    mom_values = []
+    for close_price in row:
+        history.append(close_price)
+        if len(history) > time_period:
+            del (history[0])
+        mom_values.append(close_price - history[0])
+    return mom_values
+
+
+def _loop_bands(row, time_period, stdev_factor=None):
+    history = []
+    sma_values = []
+    stddev_values = []
+    for close_price in row:
+        history.append(close_price)
+        if len(history) > time_period:
+            del (history[0])
+        sma = stats.mean(history)
+        sma_values.append(sma)
+        variance = 0
+        for hist_price in history:
+            variance = variance + ((hist_price - sma) ** 2)
+        stdev = math.sqrt(variance / len(history))
+        stddev_values.append(stdev if stdev_factor is None else (sma + stdev_factor * stdev,
+                                                                  sma - stdev_factor * stdev))
+    return sma_values, stddev_values
+
+
+def _per_row(loop):
+    def run(dates, prices, window):
+        return [loop(row, window) for row in prices.tolist()]
+    return run
+
+
+def _pandas_macd(dates, prices, window):
+    import pandas as pd
+
+    close = pd.DataFrame(prices.T)
+    macd_line = (close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean())
+    signal_line = macd_line.ewm(span=9, adjust=False).mean()
+    return macd_line - signal_line
+
+
+def _pandas_seasonality(dates, prices, window):
+    import pandas as pd
+
+    close = pd.DataFrame(prices.T, index=pd.DatetimeIndex(dates))
+    monthly = close.pct_change().groupby([close.index.year, close.index.month]).mean()
+    return monthly.groupby(level=1).describe()
+
+
+def _separately(dates, prices, window):
+    from .scan import INDICATORS as SCAN_INDICATORS
+
+    return [SCAN_INDICATORS[name][0](prices) for name in SCAN_SET]
+
+
+def _graph(dates, prices, window):
+    return Plan(SCAN_SET).run(prices)
+
+
+def _stream(make):
+    def run(dates, prices, window):
+        out = []
+        for row in prices.tolist():
+            calculator = make(window)
+            out.append([calculator.update(price) for price in row])
+        return out
+    return run
+
+
+# indicator -> (uses the window, {variant: function(dates, prices, window)})
+INDICATORS = {
+    'EMA': (True, {
+        'loop': _per_row(_loop_ema),
+        'vectorized': lambda dates, prices, window: ema(prices, window),
+        'streaming': _stream(streaming.EMA),
+    }),
+    'APO': (True, { # slow span is 4x the fast one, as 10 and 40 in the script
+        'loop': _per_row(_loop_apo),
+        'vectorized': lambda dates, prices, window: apo(prices, window, 4 * window),
+        'streaming': _stream(lambda window: streaming.APO(window, 4 * window)),
+    }),
+    'MACD': (False, {
+        'pandas': _pandas_macd,
+        'vectorized': lambda dates, prices, window: macd(prices),
+        'streaming': _stream(lambda window: streaming.MACD()),
+    }),
+    'RSI': (True, {
+        'loop': _per_row(_loop_rsi),
+        'vectorized': lambda dates, prices, window: rsi(prices, window),
+        'streaming': _stream(streaming.RSI),
+    }),
+    'MOM': (True, {
+        'loop': _per_row(_loop_mom),
+        'vectorized': lambda dates, prices, window: momentum(prices, window),
+        'streaming': _stream(streaming.Momentum),
+    }),
+    'STDDEV': (True, {
+        'loop': _per_row(_loop_bands),
+        'vectorized': lambda dates, prices, window: rolling_moments(prices, window),
+        'streaming': _stream(streaming.StdDev),
+    }),
+    'BBANDS': (True, {
+        'loop': _per_row(lambda row, window: _loop_bands(row, window, 2)),
+        'vectorized': lambda dates, prices, window: bollinger_bands(prices, window),
+        'streaming': _stream(streaming.BollingerBands),
+    }),
+    'SEASONALITY': (False, {
+        'pandas': _pandas_seasonality,
+        'vectorized': lambda dates, prices, window: seasonality(prices, dates),
+    }),
+    'SCAN': (False, { # the scan's default indicators, one call each or one shared plan
+        'vectorized': _separately,
+        'graph': _graph,
+    }),
+}
+VARIANTS = ('loop', 'pandas', 'vectorized', 'graph', 'streaming')
+SCAN_SET = ('APO', 'EMA', 'MACD', 'RSI', 'MOM', 'STDDEV', 'BBANDS')
+
+
+def _affordable(name, variant, cells, window, limits):
+    # the pure Python variants cost a few microseconds per bar, times the window
+    # for the loops that rescan it
+    if variant == 'loop':
+        return cells * (window if name in WINDOW_LOOPS else 1) <= limits['loop_ops']
+    if variant == 'streaming':
+        return cells <= limits['stream_cells']
+    return True
+
+
+def time_case(function, dates, prices, window, repeat=3, memory=True):
+    """Best wall time over up to `repeat` runs and the peak bytes allocated by one run."""
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(dates, prices, window)
+        best = min(best, time.perf_counter() - start)
+        if best > 1: # slow cases are stable enough with one run
+            break
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function(dates, prices, window)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def case_key(case):
+    key = '%s/%s/bars=%d/symbols=%d/window=%s' % (case['indicator'], case['variant'], case['bars'],
+                                                  case['symbols'], case['window'])
+    dtype = case.get('dtype', 'float64')
+    return key if dtype == 'float64' else key + '/dtype=' + dtype
+
+
+def run(bars=PRESETS['quick']['bars'], symbols=PRESETS['quick']['symbols'],
+        windows=PRESETS['quick']['windows'], indicators=tuple(INDICATORS), variants=VARIANTS,
+        seed=0, repeat=3, memory=True, max_cells=MAX_CELLS,
+        loop_ops=PRESETS['quick']['loop_ops'], stream_cells=PRESETS['quick']['stream_cells'],
+        report=None, dtype='float64'):
+    """Time every (indicator, variant, bars, symbols, window) case, returns a list of dicts.
+
+    dtype='float32' times the vectorized and graph variants in float32 mode on
+    float32 prices (see precision.py), the other variants are skipped.
+    """
+    if dtype != 'float64':
+        variants = [variant for variant in variants if variant in ('vectorized', 'graph')]
+    limits = {'loop_ops': loop_ops, 'stream_cells': stream_cells}
+    results = []
+    for n_bars in bars:
+        for n_symbols in symbols:
+            if n_bars * n_symbols > max_cells:
+                continue
+            dates, prices = synthetic_prices(n_symbols, n_bars, seed)
+            prices = prices.astype(dtype, copy=False)
+            for name in indicators:
+                windowed, functions = INDICATORS[name]
+                for window in (windows if windowed else (None,)):
+                    for variant in variants:
+                        if variant not in functions:
+                            continue
+                        if not _affordable(name, variant, n_bars * n_symbols, window, limits):
+                            continue
+                        with use_dtype(dtype):
+                            seconds, peak = time_case(functions[variant], dates, prices, window,
+                                                      repeat, memory)
+                        case = {'indicator': name, 'variant': variant, 'bars': n_bars,
+                                'symbols': n_symbols, 'window': window, 'dtype': dtype,
+                                'seconds': seconds,
+                                'peak_bytes': peak,
+                                'bars_per_second': n_bars * n_symbols / seconds if seconds else None}
+                        results.append(case)
+                        if report:
+                            report(case)
+            del prices
+    return results
+
+
+_IMPORT_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import numpy
+middle = time.perf_counter()
+import %s
+end = time.perf_counter()
+print(json.dumps([middle - start, end - middle, sorted(sys.modules)]))
+'''
+
+
+def import_time(module='financial_indicators', repeat=7):
+    """Cold import of `module` in fresh interpreters, returns a result dict.
+
+    seconds is the best time of the import after numpy is loaded, heavy the
+    HEAVY_MODULES it pulled in.
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (root, env.get('PYTHONPATH'))))
+    env.pop('PYTHONDONTWRITEBYTECODE', None) # time the import from the bytecode cache
+    best = baseline = math.inf
+    loaded = set()
+    for _ in range(repeat + 1): # the first run may have to write the bytecode cache
+        out = subprocess.run([sys.executable, '-c', _IMPORT_PROBE % module], capture_output=True,
+                             text=True, env=env, check=True).stdout
+        numpy_seconds, seconds, modules = json.loads(out)
+        best = min(best, seconds)
+        baseline = min(baseline, numpy_seconds)
+        loaded.update(name.partition('.')[0] for name in modules)
+    return {'indicator': 'import', 'variant': module, 'bars': 0, 'symbols': 0, 'window': None,
+            'seconds': best, 'numpy_seconds': baseline, 'peak_bytes': None, 'bars_per_second': None,
+            'heavy': sorted(loaded.intersection(HEAVY_MODULES))}
+
+
+def check_import(case, budget=IMPORT_BUDGET):
+    """Problems of an import_time() result, an empty list if there are none."""
+    problems = []
+    if case['heavy']:
+        problems.append('%s loads %s' % (case['variant'], ', '.join(case['heavy'])))
+    if case['seconds'] > budget:
+        problems.append('%s takes %.1f ms, the budget is %.1f ms'
+                        % (case['variant'], case['seconds'] * 1e3, budget * 1e3))
+    return problems
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def record(results, path=HISTORY_FILE, **info):
+    """Append a run to the JSON lines history, returns the entry."""
+    entry = {'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+             'commit': _commit(), 'host': platform.node(), 'python': platform.python_version(),
+             'numpy': np.__version__}
+    entry.update(info)
+    entry['results'] = results
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    return entry
+
+
+def load_history(path=HISTORY_FILE):
+    """Every run of the history file, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(before, after, threshold=THRESHOLD, min_seconds=MIN_SECONDS):
+    """Cases of `after` more than `threshold` slower than the same case in `before`.
+
+    Returns a list of (key, seconds before, seconds after) sorted by slowdown.
+    """
+    previous = {case_key(case): case['seconds'] for case in before}
+    slower = []
+    for case in after:
+        old = previous.get(case_key(case))
+        if old is None or max(old, case['seconds']) < min_seconds:
+            continue
+        if case['seconds'] > old * (1 + threshold):
+            slower.append((case_key(case), old, case['seconds']))
+    slower.sort(key=lambda item: item[2] / item[1], reverse=True)
+    return slower
+
+
+def _print_case(case):
+    peak = '' if case['peak_bytes'] is None else '%10.1f MB' % (case['peak_bytes'] / 2 ** 20)
+    print('%-12s %-10s %-7s bars=%-9d symbols=%-5d window=%-5s %10.4f s %14.0f bars/s%s'
+          % (case['indicator'], case['variant'], case.get('dtype', 'float64'), case['bars'],
+             case['symbols'], case['window'], case['seconds'], case['bars_per_second'] or 0, peak),
+          flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the indicators on synthetic prices.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--bars', type=int, nargs='+', help='bar counts, overrides the preset')
+    parser.add_argument('--symbols', type=int, nargs='+', help='symbol counts, overrides the preset')
+    parser.add_argument('--windows', type=int, nargs='+', help='window sizes, overrides the preset')
+    parser.add_argument('--indicators', nargs='+', choices=sorted(INDICATORS), default=list(INDICATORS))
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--loop-ops', type=float, help='limit of the script loops, overrides the preset')
+    parser.add_argument('--stream-cells', type=float, help='limit of the streaming runs, overrides the preset')
+    parser.add_argument('--history', default=HISTORY_FILE, help="JSON lines history, '' to not record")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 if a case is slower than in the previous run')
+    parser.add_argument('--import-time', action='store_true',
+                        help='time the cold import of the package instead of the indicators')
+    parser.add_argument('--import-modules', nargs='+', default=list(IMPORT_MODULES))
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='seconds an import may take after numpy')
+    parser.add_argument('--dtypes', nargs='+', choices=DTYPES, default=['float64'],
+                        help='float32 also times the vectorized and graph variants in float32 mode')
+    parser.add_argument('--deviations', action='store_true',
+                        help='print the largest float32 mode errors against float64')
+    parser.add_argument('--conformance', action='store_true',
+                        help='check every compute backend against the python reference')
+    args = parser.parse_args(argv)
+
+    if args.conformance:
+        return _main_conformance(args)
+    if args.deviations:
+        return _main_deviations(args)
+    if args.import_time:
+        return _main_import(args)
+    preset = PRESETS[args.preset]
+    results = []
+    for dtype in args.dtypes:
+        results += run(args.bars or preset['bars'], args.symbols or preset['symbols'],
+                       args.windows or preset['windows'], args.indicators, args.variants, args.seed,
+                       args.repeat, not args.no_memory, loop_ops=args.loop_ops or preset['loop_ops'],
+                       stream_cells=args.stream_cells or preset['stream_cells'], report=_print_case,
+                       dtype=dtype)
+
+    slower = []
+    if args.history:
+        host = platform.node()
+        runs = [entry for entry in load_history(args.history)
+                if entry.get('host') == host and entry.get('preset') != 'import']
+        if runs:
+            slower = compare(runs[-1]['results'], results, args.threshold)
+            for key, old, new in slower:
+                print('REGRESSION %s: %.4f s -> %.4f s (%+.0f%%)' % (key, old, new, (new / old - 1) * 100))
+        record(results, args.history, preset=args.preset, seed=args.seed)
+    return 1 if args.check and slower else 0
+
+
+def _main_conformance(args):
+    names = backends.available()
+    print('backends: %s' % ', '.join(names))
+    failures = backends.conformance(names, args.seed)
+    for name, kernel, shape, parameter in failures:
+        print('MISMATCH %s %s shape=%s parameter=%r' % (name, kernel, shape, parameter))
+    print('conformance: %s' % ('FAILED' if failures else 'ok'))
+    return 1 if failures else 0
+
+
+def _main_deviations(args):
+    from_float64 = deviations(seed=args.seed, stored=False)
+    from_float32 = deviations(seed=args.seed, stored=True)
+    print('%-16s %24s %24s' % ('output', 'float64 prices', 'float32 prices'))
+    for output, (error, relative) in from_float64.items():
+        stored, stored_relative = from_float32[output]
+        print('%-16s %11.2e %12.2e %11.2e %12.2e' % (output, error, relative, stored, stored_relative))
+    print('(max abs error, max error / price)')
+    return 0
+
+
+def _main_import(args):
+    results = [import_time(module, args.repeat) for module in args.import_modules]
+    problems = []
+    for case in results:
+        print('%-30s %8.1f ms after numpy (numpy %.1f ms)%s'
+              % (case['variant'], case['seconds'] * 1e3, case['numpy_seconds'] * 1e3,
+                 '  heavy: ' + ', '.join(case['heavy']) if case['heavy'] else ''), flush=True)
+        problems.extend(check_import(case, args.import_budget))
+    if args.history:
+        host = platform.node()
+        runs = [entry for entry in load_history(args.history)
+                if entry.get('host') == host and entry.get('preset') == 'import']
+        if runs:
+            for key, old, new in compare(runs[-1]['results'], results, args.threshold,
+                                         IMPORT_MIN_SECONDS):
+                message = '%s: %.1f ms -> %.1f ms' % (key, old * 1e3, new * 1e3)
+                print('REGRESSION ' + message)
+                if args.check:
+                    problems.append(message)
+        record(results, args.history, preset='import')
+    for problem in problems:
+        print('FAILED ' + problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,495 @@
+# Chunked (out-of-core) indicator computation and its command line
+#
+# The batch functions and the scan need the whole series in memory. Here the
+# input is read in fixed-size chunks, from CSV (a file or stdin), from the .npy
+# columns of a PriceStore symbol directory, from a single .npy column or from
+# Parquet, and every indicator carries the state it needs from one chunk to the
+# next:
+#
+# - EMA, APO, MACD: the last EMA values, which seed the EMAs of the next chunk
+# - RSI: the last price, and the last gains and losses ('simple') or the last
+#   Wilder averages
+# - MOM: the last time_period - 1 prices
+# - STDDEV, BBANDS: up to 2 * time_period - 1 prices, so the windows of the next
+#   chunk are summed over the same blocks as rolling_moments uses on the whole
+#   series
+# - ADF: the last window - 1 prices
+#
+# Each chunk goes through the same vectorized kernels as an in-memory run, so
+# the output is identical to the last bit to the scan of the whole series (in
+# float32 mode too, see precision.py), and memory is bounded by the chunk size
+# and the windows, not by the length of the input. Results are written out as
+# soon as a chunk is done:
+#
+#   python -m financial_indicators.chunked ticks.csv --indicators MACD RSI BBANDS -o out.csv
+#   zcat ticks.csv.gz | python -m financial_indicators.chunked - --column Price
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from . import metrics
+from .adf import adf_maxlag, rolling_adf
+from .ema import ema_kernel, smoothing_factor
+from .momentum import momentum
+from .precision import DTYPES, get_dtype, use_dtype
+from .rolling import rolling_mean, rolling_moments
+from .rsi import MODES as RSI_MODES
+from .rsi import gains_losses, wilder_average
+from .streaming import _Streaming
+
+CHUNK_ROWS = 1 << 20
+FORMATS = ('csv', 'npy', 'parquet')
+
+
+def _seeded_ema(values, alpha, seed):
+    # EMA of `values` continuing from `seed` (NaN if no price was seen yet): the
+    # seed goes in as the first price, which starts the EMA at exactly that value
+    return ema_kernel(np.concatenate(([seed], values)), [alpha])[0][1:]
+
+
+def _last(values, default):
+    return float(values[-1]) if len(values) else default
+
+
+def _tail(history, values, keep):
+    # the last `keep` values of history followed by values, as a list
+    if keep == 0:
+        return []
+    return np.concatenate((history, values))[-keep:].tolist()
+
+
+def _aligned(function, history, seen, values, window):
+    # function (rolling_mean or rolling_moments) of `values`, continuing `seen`
+    # earlier values whose last ones are `history`. The input handed to the
+    # kernel starts on a multiple of `window` bars, so its blocks and running
+    # sums are the ones of the whole series.
+    block = seen - seen % window
+    start = block - window if block >= window else 0
+    x = np.concatenate((history[len(history) - (seen - start):], values))
+    result = function(x, window)
+    if isinstance(result, tuple):
+        return tuple(r[seen - start:] for r in result)
+    return result[seen - start:]
+
+
+class ChunkedEMA(_Streaming):
+    """EMA over a series given chunk by chunk."""
+
+    __slots__ = ('span', 'value')
+
+    def __init__(self, span=20):
+        smoothing_factor(span)
+        self.span = span
+        self.value = math.nan
+
+    def update(self, prices):
+        values = _seeded_ema(prices, smoothing_factor(self.span), self.value)
+        self.value = _last(values, self.value)
+        return {'ema': values}
+
+
+class ChunkedAPO(_Streaming):
+    """Absolute Price Oscillator over a series given chunk by chunk."""
+
+    __slots__ = ('fast_span', 'slow_span', 'fast', 'slow')
+
+    def __init__(self, fast_span=10, slow_span=40):
+        smoothing_factor(fast_span)
+        smoothing_factor(slow_span)
+        self.fast_span = fast_span
+        self.slow_span = slow_span
+        self.fast = math.nan
+        self.slow = math.nan
+
+    def update(self, prices):
+        fast = _seeded_ema(prices, smoothing_factor(self.fast_span), self.fast)
+        slow = _seeded_ema(prices, smoothing_factor(self.slow_span), self.slow)
+        self.fast = _last(fast, self.fast)
+        self.slow = _last(slow, self.slow)
+        return {'apo': fast - slow}
+
+
+class ChunkedMACD(_Streaming):
+    """MACD line, signal line and histogram over a series given chunk by chunk."""
+
+    __slots__ = ('fast_span', 'slow_span', 'signal_span', 'fast', 'slow', 'signal')
+
+    def __init__(self, fast_span=12, slow_span=26, signal_span=9):
+        for span in (fast_span, slow_span, signal_span):
+            smoothing_factor(span)
+        self.fast_span = fast_span
+        self.slow_span = slow_span
+        self.signal_span = signal_span
+        self.fast = math.nan
+        self.slow = math.nan
+        self.signal = math.nan
+
+    def update(self, prices):
+        fast = _seeded_ema(prices, smoothing_factor(self.fast_span), self.fast)
+        slow = _seeded_ema(prices, smoothing_factor(self.slow_span), self.slow)
+        line = fast - slow
+        signal = _seeded_ema(line, smoothing_factor(self.signal_span), self.signal)
+        self.fast = _last(fast, self.fast)
+        self.slow = _last(slow, self.slow)
+        self.signal = _last(signal, self.signal)
+        return {'macd': line, 'macd_signal': signal, 'macd_histogram': line - signal}
+
+
+class ChunkedRSI(_Streaming):
+    """RSI over a series given chunk by chunk, mode='simple' or 'wilder' as in rsi.rsi()."""
+
+    __slots__ = ('time_period', 'mode', 'seen', 'last_price', 'gains', 'losses',
+                 'avg_gain', 'avg_loss')
+
+    def __init__(self, time_period=20, mode='simple'):
+        if time_period < 1:
+            raise ValueError('time_period must be at least 1, got %r' % (time_period,))
+        if mode not in RSI_MODES:
+            raise ValueError('mode must be one of %s, got %r' % (', '.join(RSI_MODES), mode))
+        self.time_period = time_period
+        self.mode = mode
+        self.seen = 0
+        self.last_price = math.nan # the first price is compared with itself
+        self.gains = [] # recent gains and losses, all of them during the Wilder warm-up
+        self.losses = []
+        self.avg_gain = math.nan
+        self.avg_loss = math.nan
+
+    def update(self, prices):
+        x = np.asarray(prices, dtype=np.float64)
+        gain, loss = gains_losses(np.concatenate(([self.last_price], x)))
+        gain, loss = gain[1:], loss[1:]
+        n = self.time_period
+        if self.mode == 'simple':
+            avg_gain = _aligned(rolling_mean, self.gains, self.seen, gain, n)
+            avg_loss = _aligned(rolling_mean, self.losses, self.seen, loss, n)
+            keep = 2 * n - 1
+        elif self.seen <= n: # running mean warm-up, redo it from the first bar
+            avg_gain = wilder_average(np.concatenate((self.gains, gain)), n)[self.seen:]
+            avg_loss = wilder_average(np.concatenate((self.losses, loss)), n)[self.seen:]
+            keep = n + 1
+        else:
+            avg_gain = _seeded_ema(gain, 1 / n, self.avg_gain)
+            avg_loss = _seeded_ema(loss, 1 / n, self.avg_loss)
+            keep = 0
+        self.gains = _tail(self.gains, gain, keep)
+        self.losses = _tail(self.losses, loss, keep)
+        self.avg_gain = _last(avg_gain, self.avg_gain)
+        self.avg_loss = _last(avg_loss, self.avg_loss)
+        self.last_price = _last(x[~np.isnan(x)], self.last_price)
+        self.seen += len(x)
+        rs = np.zeros_like(avg_gain)
+        np.divide(avg_gain, avg_loss, out=rs, where=avg_loss > 0)
+        return {'rsi': 100 - (100 / (1 + rs))}
+
+
+class ChunkedMomentum(_Streaming):
+    """Momentum over a series given chunk by chunk."""
+
+    __slots__ = ('time_period', 'history')
+
+    def __init__(self, time_period=20):
+        if time_period < 1:
+            raise ValueError('time_period must be at least 1, got %r' % (time_period,))
+        self.time_period = time_period
+        self.history = [] # the last time_period - 1 prices
+
+    def update(self, prices):
+        x = np.concatenate((self.history, np.asarray(prices, dtype=np.float64)))
+        mom = momentum(x, self.time_period)[len(self.history):]
+        self.history = _tail(self.history, prices, self.time_period - 1)
+        return {'mom': mom}
+
+
+class ChunkedMoments(_Streaming):
+    """Rolling mean and population stddev over a series given chunk by chunk."""
+
+    __slots__ = ('time_period', 'seen', 'history')
+
+    def __init__(self, time_period=20):
+        if time_period < 1:
+            raise ValueError('time_period must be at least 1, got %r' % (time_period,))
+        self.time_period = time_period
+        self.seen = 0
+        self.history = [] # up to 2 * time_period - 1 prices
+
+    def update(self, prices):
+        """(sma, stdev) of the chunk."""
+        x = np.asarray(prices, dtype=np.float64)
+        sma, stdev = _aligned(rolling_moments, self.history, self.seen, x, self.time_period)
+        self.history = _tail(self.history, x, 2 * self.time_period - 1)
+        self.seen += len(x)
+        return sma, stdev
+
+
+class ChunkedStdDev(_Streaming):
+    """Rolling population standard deviation over a series given chunk by chunk."""
+
+    __slots__ = ('moments',)
+    _nested = {'moments': ChunkedMoments}
+
+    def __init__(self, time_period=20):
+        self.moments = ChunkedMoments(time_period)
+
+    def update(self, prices):
+        return {'stddev': self.moments.update(prices)[1]}
+
+
+class ChunkedBollingerBands(_Streaming):
+    """Bollinger Bands over a series given chunk by chunk."""
+
+    __slots__ = ('stdev_factor', 'moments')
+    _nested = {'moments': ChunkedMoments}
+
+    def __init__(self, time_period=20, stdev_factor=2):
+        self.stdev_factor = stdev_factor
+        self.moments = ChunkedMoments(time_period)
+
+    def update(self, prices):
+        sma, stdev = self.moments.update(prices)
+        return {'bb_middle': sma, 'bb_upper': sma + self.stdev_factor * stdev,
+                'bb_lower': sma - self.stdev_factor * stdev}
+
+
+class ChunkedADF(_Streaming):
+    """ADF test of the window ending at each bar, NaN until the first full window."""
+
+    __slots__ = ('window', 'maxlag', 'autolag', 'history')
+
+    def __init__(self, window=252, maxlag=None, autolag='AIC'):
+        adf_maxlag(window, maxlag)
+        self.window = window
+        self.maxlag = maxlag
+        self.autolag = autolag
+        self.history = [] # the last window - 1 prices
+
+    def update(self, prices):
+        x = np.concatenate((self.history, np.asarray(prices, dtype=np.float64)))
+        n = len(x) - len(self.history)
+        out = {name: np.full(n, np.nan) for name in ('adf_stat', 'adf_pvalue', 'adf_lags')}
+        if len(x) >= self.window:
+            first = self.window - 1 - len(self.history) # first bar that ends a full window
+            for name, values in zip(out, rolling_adf(x, self.window, 1, self.maxlag, self.autolag)):
+                out[name][max(first, 0):] = values[max(-first, 0):]
+        self.history = _tail(self.history, prices, self.window - 1)
+        return out
+
+
+# indicator name, as in scan.INDICATORS -> chunked calculator
+CALCULATORS = {
+    'APO': ChunkedAPO,
+    'EMA': ChunkedEMA,
+    'MACD': ChunkedMACD,
+    'RSI': ChunkedRSI,
+    'MOM': ChunkedMomentum,
+    'STDDEV': ChunkedStdDev,
+    'BBANDS': ChunkedBollingerBands,
+    'ADF': ChunkedADF,
+}
+DEFAULT_INDICATORS = ('APO', 'EMA', 'MACD', 'RSI', 'MOM', 'STDDEV', 'BBANDS')
+
+
+class ChunkedIndicators:
+    """Several chunked calculators fed the same chunks.
+
+    `indicators` is a list of names or a dict of name -> parameters, as for
+    scan(). update(prices) returns {output column: values} for the chunk.
+    """
+
+    __slots__ = ('calculators',)
+
+    def __init__(self, indicators=DEFAULT_INDICATORS):
+        if not isinstance(indicators, dict):
+            indicators = {name: {} for name in indicators}
+        self.calculators = {}
+        for name, params in indicators.items():
+            name = name.upper()
+            if name not in CALCULATORS:
+                raise ValueError('unknown indicator %r' % (name,))
+            self.calculators[name] = CALCULATORS[name](**(params or {}))
+
+    def update(self, prices):
+        prices = np.asarray(prices, dtype=np.float64)
+        dtype = get_dtype()
+        outputs = {}
+        with use_dtype('float64'): # the state carries over in float64, as in one in-memory call
+            for calculator in self.calculators.values():
+                result = calculator.update(prices)
+                if dtype == np.float32 and not isinstance(calculator, ChunkedADF):
+                    result = {name: values.astype(np.float32) for name, values in result.items()}
+                outputs.update(result)
+        return outputs
+
+    def get_state(self):
+        """Checkpoint of every calculator as a dict of plain Python values."""
+        return {name: calculator.get_state() for name, calculator in self.calculators.items()}
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild from a get_state() checkpoint."""
+        self = cls.__new__(cls)
+        self.calculators = {name: CALCULATORS[name].from_state(values)
+                            for name, values in state.items()}
+        return self
+
+
+def read_csv_chunks(source, column='Close', date_column='Date', chunk_rows=CHUNK_ROWS):
+    """(dates, prices) chunks of a CSV file, a file object or '-' for stdin.
+
+    dates are the strings of `date_column` as written, None if date_column is
+    None or ''.
+    """
+    import pandas as pd
+
+    if source == '-':
+        source = sys.stdin
+    columns = [date_column, column] if date_column else [column]
+    reader = pd.read_csv(source, usecols=columns, chunksize=chunk_rows,
+                         dtype={date_column: str} if date_column else None)
+    with reader:
+        for frame in reader:
+            with metrics.span('chunked.read', rows=len(frame)):
+                dates = frame[date_column].to_numpy() if date_column else None
+                prices = frame[column].to_numpy(dtype=np.float64)
+            yield dates, prices
+
+
+def read_npy_chunks(path, column='Close', date_column='Date', chunk_rows=CHUNK_ROWS):
+    """(dates, prices) chunks of .npy columns, memory-mapped.
+
+    `path` is a PriceStore symbol directory (dates.npy, close.npy, ...) or one
+    .npy price column, which has no dates.
+    """
+    from .store import DATES_FILE, _column_file
+
+    if os.path.isdir(path):
+        prices = np.load(os.path.join(path, _column_file(column)), mmap_mode='r')
+        dates = np.load(os.path.join(path, DATES_FILE), mmap_mode='r') if date_column else None
+    else:
+        prices = np.load(path, mmap_mode='r')
+        dates = None
+    for start in range(0, len(prices), chunk_rows):
+        stop = start + chunk_rows
+        with metrics.span('chunked.read', rows=len(prices[start:stop])):
+            chunk_dates = None if dates is None else np.datetime_as_string(dates[start:stop], unit='D')
+            chunk = np.array(prices[start:stop], dtype=np.float64)
+        yield chunk_dates, chunk
+
+
+def read_parquet_chunks(path, column='Close', date_column='Date', chunk_rows=CHUNK_ROWS):
+    """(dates, prices) chunks of a Parquet file, needs pyarrow."""
+    import pyarrow.parquet as pq
+
+    columns = [date_column, column] if date_column else [column]
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+        with metrics.span('chunked.read', rows=batch.num_rows):
+            dates = batch.column(date_column).to_numpy(zero_copy_only=False) if date_column else None
+            prices = batch.column(column).to_numpy(zero_copy_only=False).astype(np.float64)
+        yield dates, prices
+
+
+READERS = {'csv': read_csv_chunks, 'npy': read_npy_chunks, 'parquet': read_parquet_chunks}
+
+
+def input_format(path):
+    """Format of an input path from its name, stdin ('-') is CSV."""
+    if path != '-' and (os.path.isdir(path) or path.endswith('.npy')):
+        return 'npy'
+    if path.endswith(('.parquet', '.pq')):
+        return 'parquet'
+    return 'csv'
+
+
+def compute_chunks(chunks, indicators=DEFAULT_INDICATORS):
+    """Indicators of every (dates, prices) chunk, yields (dates, {column: values}).
+
+    `indicators` is a list of names, a dict of name -> parameters or a
+    ChunkedIndicators, which then holds the state after the last chunk.
+    """
+    if not isinstance(indicators, ChunkedIndicators):
+        indicators = ChunkedIndicators(indicators)
+    for dates, prices in chunks:
+        yield dates, indicators.update(prices)
+
+
+def write_csv(results, output, date_column='Date'):
+    """Write compute_chunks() results as CSV to a path, a file object or '-' for stdout.
+
+    Returns the number of rows written.
+    """
+    import pandas as pd
+
+    if output == '-':
+        return _write_csv(pd, results, sys.stdout, date_column)
+    with open(output, 'w', newline='') as f:
+        return _write_csv(pd, results, f, date_column)
+
+
+def _write_csv(pd, results, f, date_column):
+    rows = 0
+    for dates, outputs in results:
+        frame = pd.DataFrame(outputs)
+        if dates is not None:
+            frame.insert(0, date_column or 'Date', dates)
+        with metrics.span('chunked.write', rows=len(frame)):
+            frame.to_csv(f, header=rows == 0, index=False)
+        rows += len(frame)
+    return rows
+
+
+def _params(items):
+    # ['RSI.time_period=14', 'RSI.mode=wilder'] -> {'RSI': {'time_period': 14, 'mode': 'wilder'}}
+    params = {}
+    for item in items:
+        key, equals, value = item.partition('=')
+        name, _, param = key.partition('.')
+        if not equals or not param:
+            raise ValueError('parameters are given as NAME.param=value, got %r' % (item,))
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass # a plain string such as wilder
+        params.setdefault(name.upper(), {})[param] = value
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compute indicators over a price file in fixed-size chunks.')
+    parser.add_argument('input', help="CSV file, '-' for CSV on stdin, a .npy column, a "
+                                      "PriceStore symbol directory or a Parquet file")
+    parser.add_argument('--format', choices=FORMATS, help='input format, guessed from the name')
+    parser.add_argument('--column', default='Close', help='price column')
+    parser.add_argument('--date-column', default='Date', help="column copied to the output, '' for none")
+    parser.add_argument('--indicators', nargs='+', type=str.upper, choices=sorted(CALCULATORS),
+                        default=list(DEFAULT_INDICATORS))
+    parser.add_argument('-p', '--param', action='append', default=[], metavar='NAME.param=value',
+                        help='indicator parameter, e.g. RSI.time_period=14')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--dtype', choices=DTYPES, default='float64',
+                        help='float32 writes the float64 results rounded to float32')
+    parser.add_argument('-o', '--output', default='-', help="output CSV, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    params = _params(args.param)
+    for name in params:
+        if name not in args.indicators:
+            parser.error('parameters given for %s, which is not computed' % name)
+    reader = READERS[args.format or input_format(args.input)]
+    chunks = reader(args.input, args.column, args.date_column or None, args.chunk_rows)
+    indicators = ChunkedIndicators({name: params.get(name, {}) for name in args.indicators})
+    try:
+        with use_dtype(args.dtype):
+            write_csv(compute_chunks(chunks, indicators), args.output, args.date_column)
+    except BrokenPipeError: # e.g. piped into head
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
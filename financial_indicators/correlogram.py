@@ -0,0 +1,157 @@
+# Autocorrelation (ACF) and partial autocorrelation (PACF) of many series
+#
+# The Seasonality notebook draws plot_acf / plot_pacf for one series, which
+# computes and plots in one step. Here the numbers are computed on their own,
+# for every series of an array (time is the last axis) and for rolling windows,
+# so autocorrelation can be screened over a whole universe:
+#
+# - the autocovariances of all series come from one batched FFT, so any number
+#   of lags costs the same O(n log n) per series
+# - the PACF follows from the ACF by the Durbin-Levinson recursion, one step
+#   per lag for all series at once
+# - the confidence bounds are the ones plot_acf (Bartlett's formula) and
+#   plot_pacf (1 / sqrt(n)) draw
+#
+# With the defaults the values are those of statsmodels' acf() and
+# pacf(method='ywm'), which plot_acf and plot_pacf use. plot_correlogram() is
+# the optional plotting layer.
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .metrics import timed
+
+CHUNK_BYTES = 64 << 20 # windows copied at a time by the rolling functions
+
+
+def default_nlags(n):
+    """statsmodels' default number of lags, 10 * log10(n) capped at n - 1."""
+    return int(min(10 * math.log10(n), n - 1)) if n > 0 else 0
+
+
+def _nlags(n, nlags):
+    nlags = default_nlags(n) if nlags is None else nlags
+    if not 0 <= nlags < max(n, 1):
+        raise ValueError('nlags must be between 0 and %d, got %r' % (n - 1, nlags))
+    return nlags
+
+
+def autocovariance(prices, nlags, adjusted=False):
+    """Autocovariances at lags 0..nlags along the last axis, through the FFT.
+
+    Sums are divided by n, or by n - lag with adjusted=True.
+    """
+    x = np.asarray(prices, dtype=np.float64)
+    n = x.shape[-1]
+    centered = x - x.mean(axis=-1, keepdims=True)
+    size = 1 << max(0, 2 * n - 2).bit_length() # zero padding to at least 2n - 1, no wrap-around
+    spectrum = np.fft.rfft(centered, size, axis=-1)
+    acov = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, size, axis=-1)[..., :nlags + 1]
+    return acov / ((n - np.arange(nlags + 1)) if adjusted else n)
+
+
+def durbin_levinson(acf):
+    """PACF at the lags of `acf` (last axis, lag 0 first) by Durbin-Levinson."""
+    r = np.asarray(acf, dtype=np.float64)
+    nlags = r.shape[-1] - 1
+    pacf = np.ones(r.shape)
+    phi = np.zeros(r.shape[:-1] + (max(nlags, 0),)) # AR coefficients of the current order
+    v = r[..., 0] # prediction error variance
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(1, nlags + 1):
+            a = (r[..., k] - np.sum(phi[..., :k - 1] * r[..., k - 1:0:-1], axis=-1)) / v
+            if k > 1:
+                phi[..., :k - 1] -= a[..., None] * phi[..., k - 2::-1]
+            phi[..., k - 1] = a
+            v = v * (1 - a * a)
+            pacf[..., k] = a
+    return pacf
+
+
+@timed('kernel.acf')
+def acf(prices, nlags=None, alpha=0.05, adjusted=False):
+    """ACF along the last axis, returns (acf, bounds).
+
+    bounds is the half-width of the 1 - alpha confidence band at each lag
+    (Bartlett's formula, 0 at lag 0), None when alpha is None.
+    """
+    x = np.asarray(prices, dtype=np.float64)
+    n = x.shape[-1]
+    nlags = _nlags(n, nlags)
+    acov = autocovariance(x, nlags, adjusted)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = acov / acov[..., :1]
+    if alpha is None:
+        return values, None
+    variance = np.zeros(values.shape)
+    variance[..., 1:] = 1 / n
+    variance[..., 2:] += 2 * np.cumsum(values[..., 1:-1] ** 2, axis=-1) / n
+    return values, NormalDist().inv_cdf(1 - alpha / 2) * np.sqrt(variance)
+
+
+@timed('kernel.pacf')
+def pacf(prices, nlags=None, alpha=0.05, adjusted=False):
+    """PACF along the last axis (Yule-Walker by Durbin-Levinson), returns (pacf, bounds).
+
+    bounds is the half-width of the 1 - alpha band, z / sqrt(n) and 0 at lag
+    0, None when alpha is None. adjusted=True is pacf(method='ywadjusted').
+    """
+    x = np.asarray(prices, dtype=np.float64)
+    n = x.shape[-1]
+    nlags = _nlags(n, nlags)
+    values = durbin_levinson(autocovariance(x, nlags, adjusted))
+    if alpha is None:
+        return values, None
+    bounds = np.full(values.shape, NormalDist().inv_cdf(1 - alpha / 2) / math.sqrt(n))
+    bounds[..., 0] = 0
+    return values, bounds
+
+
+def _rolling(function, prices, window, step, nlags, alpha, adjusted):
+    x = np.asarray(prices, dtype=np.float64)
+    n = x.shape[-1]
+    nlags = _nlags(window, nlags)
+    x2 = x.reshape(-1, n)
+    starts = np.arange(0, n - window + 1, step)
+    count = len(x2) * len(starts)
+    values = np.empty((count, nlags + 1))
+    bounds = None if alpha is None else np.empty((count, nlags + 1))
+    views = sliding_window_view(x2, window, axis=-1) if count else None
+    per = max(1, CHUNK_BYTES // (8 * window * 4)) # FFT buffers are about 4x the window
+    for c0 in range(0, count, per):
+        index = np.arange(c0, min(count, c0 + per))
+        chunk = function(views[index // len(starts), starts[index % len(starts)]], nlags, alpha, adjusted)
+        values[index] = chunk[0]
+        if bounds is not None:
+            bounds[index] = chunk[1]
+    shape = x.shape[:-1] + (len(starts), nlags + 1)
+    return values.reshape(shape), None if bounds is None else bounds.reshape(shape)
+
+
+def rolling_acf(prices, window, step=1, nlags=None, alpha=0.05, adjusted=False):
+    """acf() of every `window` bars, `step` bars apart, shape (..., windows, nlags + 1)."""
+    return _rolling(acf, prices, window, step, nlags, alpha, adjusted)
+
+
+def rolling_pacf(prices, window, step=1, nlags=None, alpha=0.05, adjusted=False):
+    """pacf() of every `window` bars, `step` bars apart, shape (..., windows, nlags + 1)."""
+    return _rolling(pacf, prices, window, step, nlags, alpha, adjusted)
+
+
+def plot_correlogram(ax, values, bounds=None, title='Autocorrelation', zero=True):
+    """Draw one ACF or PACF on a matplotlib Axes like plot_acf / plot_pacf."""
+    values = np.asarray(values, dtype=np.float64)
+    lags = np.arange(len(values))
+    first = 0 if zero else 1
+    ax.vlines(lags[first:], 0, values[first:])
+    ax.plot(lags[first:], values[first:], marker='o', markersize=5, linestyle='None')
+    ax.axhline(0, color='black', lw=0.8)
+    if bounds is not None:
+        # band centered on 0 as in plot_acf, lag 0 excluded
+        ax.fill_between(lags[1:], -bounds[1:], bounds[1:], alpha=0.25, linewidth=0)
+    ax.set_xlim(-1, len(values))
+    ax.set_title(title)
+    return ax
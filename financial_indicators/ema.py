@@ -0,0 +1,74 @@
+# Exponential Moving Average (EMA), Absolute Price Oscillator (APO) and MACD
+#
+# EMA = (P - EMAp) * K + EMAp
+#
+# Where:
+#
+# P = Price for the current period
+# EMAp = the Exponential Moving Average for the previous period
+# K = the smoothing constant, 2 / (n + 1) for an n period EMA
+#
+# APO = Fast EMA - Slow EMA
+# MACD Line = 12-day EMA - 26-day EMA, Signal Line = 9-day EMA of MACD Line
+#
+# Every EMA in the package goes through ema_kernel so the APO, EMA and MACD
+# numbers are the same wherever they are computed.
+
+import numpy as np
+
+from .backends import select
+from .metrics import timed
+from .precision import float32_blocks
+
+
+def smoothing_factor(span):
+    """K = 2 / (span + 1), the smoothing constant of a 'span' period EMA."""
+    if span < 1:
+        raise ValueError('span must be at least 1, got %r' % (span,))
+    return 2 / (span + 1)
+
+
+@timed('kernel.ema_kernel')
+@float32_blocks(axis=1)
+def ema_kernel(prices, alphas):
+    """EMAs of one or many price series for one or many smoothing factors.
+
+    `prices` is a 1-D series or an N-D array with time on the last axis, e.g.
+    symbols x bars. `alphas` is a sequence of smoothing factors K. Returns an
+    array of shape (len(alphas),) + prices.shape.
+
+    Each EMA is seeded with the first non-NaN price of its series and is NaN
+    before it. A NaN price leaves the EMA unchanged, so the previous value is
+    carried through gaps. The recurrence runs on the backend picked for the
+    number of (series, smoothing factor) pairs, see backends.py.
+    """
+    x = np.asarray(prices, dtype=np.float64)
+    K = np.asarray(alphas, dtype=np.float64).reshape(-1)
+    series = x.reshape(int(np.prod(x.shape[:-1])), x.shape[-1])
+    out = select('ema', len(series) * len(K)).ema(series, K)
+    return out.reshape((len(K),) + x.shape)
+
+
+@timed('kernel.ema')
+@float32_blocks()
+def ema(prices, span):
+    """EMA of `prices` with smoothing constant K = 2 / (span + 1)."""
+    return ema_kernel(prices, [smoothing_factor(span)])[0]
+
+
+@timed('kernel.apo')
+@float32_blocks()
+def apo(prices, fast_span, slow_span):
+    """Absolute Price Oscillator, returns (ema_fast, ema_slow, apo)."""
+    ema_fast, ema_slow = ema_kernel(
+        prices, [smoothing_factor(fast_span), smoothing_factor(slow_span)])
+    return ema_fast, ema_slow, ema_fast - ema_slow
+
+
+@timed('kernel.macd')
+@float32_blocks()
+def macd(prices, fast_span=12, slow_span=26, signal_span=9):
+    """MACD, returns (macd_line, signal_line, macd_histogram)."""
+    ema_fast, ema_slow, macd_line = apo(prices, fast_span, slow_span)
+    signal_line = ema(macd_line, signal_span)
+    return macd_line, signal_line, macd_line - signal_line
@@ -0,0 +1,612 @@
+# Bulk asynchronous download of daily bars into a PriceStore
+#
+# PriceStore.ensure() fetches one symbol at a time, so refreshing a universe
+# takes one round trip after the other. BulkFetcher runs the requests of
+# thousands of symbols on one asyncio event loop instead:
+#
+# - keep-alive HTTP/1.1 connections are pooled per host, with at most
+#   `connections` requests in flight overall and `per_host` per host
+# - a token bucket per host holds the request rate to `rate` per second (with
+#   bursts of `burst`), and a 429 or 503 answer with Retry-After pauses the
+#   whole host for that long, at most `max_backoff` seconds
+# - failed requests (connection errors, timeouts, 429 and 5xx answers) are
+#   retried up to `retries` times with exponential backoff and full jitter
+# - every response is merged into the store as soon as it lands, in a writer
+#   thread next to the event loop, so an interrupted refresh keeps what it got
+#   and the next one only asks for the rest. Merging is CPU work under the
+#   GIL, more writer threads only make it slower
+#
+# The endpoint is any URL template with {symbol}, {start} and {end} that
+# answers with CSV bars indexed by date, as read by CsvProvider. The client is
+# plain asyncio streams, no third party HTTP library is needed.
+#
+# StandInServer is a local HTTP server answering such requests with canned
+# bars (seeded random walks, or the CSV files of a directory), with optional
+# latency, failures, dropped connections and a rate limit, so throughput and
+# failure handling can be tried offline:
+#
+#   python -m financial_indicators.fetch serve --port 8765 --failure-rate 0.05
+#   python -m financial_indicators.fetch get price_cache AAPL MSFT @symbols.txt \
+#       --url 'http://127.0.0.1:8765/prices/{symbol}?start={start}&end={end}'
+#
+# or both in one process, e.g. for a throughput test:
+#
+#   python -m financial_indicators.fetch get /tmp/store --standin --synthetic 2000
+
+import argparse
+import asyncio
+import collections
+import gzip
+import io
+import random
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .store import CsvProvider, PriceStore, Provider, _day
+
+DEFAULT_URL = 'http://127.0.0.1:8765/prices/{symbol}?start={start}&end={end}'
+RETRY_STATUS = (429, 500, 502, 503, 504)
+SYNTHETIC_START = '2000-01-03' # first bar of the synthetic histories
+USER_AGENT = 'financial-indicators'
+
+
+class FetchError(Exception):
+    """A symbol that could not be fetched after all the retries."""
+
+
+class HttpProvider(Provider):
+    """Bars from an HTTP endpoint answering with CSV, one blocking request per call."""
+
+    def __init__(self, url=DEFAULT_URL, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self, symbol, start, end):
+        request = urllib.request.Request(_url(self.url, symbol, start, end),
+                                         headers={'User-Agent': USER_AGENT})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return read_bars(response.read())
+
+
+class SyntheticProvider(Provider):
+    """Canned OHLCV bars on business days: `histories` seeded random walks.
+
+    Every symbol gets one of the histories, picked by a hash of its name, so
+    a symbol always gets the same bars. Each history is formatted as CSV once
+    and csv() answers with a slice of it, which keeps a stand-in server fast.
+    """
+
+    def __init__(self, seed=0, histories=64):
+        self.seed = seed
+        self.histories = histories
+        self._days = None
+        self._csv = {} # history -> (days, offset of every line, CSV text)
+
+    def _history(self, symbol):
+        key = zlib.crc32(symbol.encode()) % self.histories
+        if key not in self._csv:
+            if self._days is None:
+                days = np.arange(np.datetime64(SYNTHETIC_START), np.datetime64(_day('today'), 'D'))
+                self._days = days[np.is_busday(days)]
+            days = self._days
+            rng = np.random.default_rng([self.seed, key])
+            close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days))))
+            open_ = close * np.exp(rng.normal(0, 0.005, len(days)))
+            spread = np.abs(rng.normal(0, 0.01, len(days)))
+            columns = [np.datetime_as_string(days)] + [
+                np.round(values, 6).astype(str) for values in
+                (open_, np.maximum(open_, close) * (1 + spread),
+                 np.minimum(open_, close) * (1 - spread), close, close)]
+            columns.append(rng.integers(10 ** 5, 10 ** 7, len(days)).astype(str))
+            lines = [(','.join(row) + '\n').encode() for row in zip(*columns)]
+            offsets = np.cumsum([0] + [len(line) for line in lines])
+            self._csv[key] = (days, offsets, b''.join(lines))
+        return self._csv[key]
+
+    def csv(self, symbol, start, end):
+        """Bars with start <= date < end as CSV bytes, with the header line."""
+        days, offsets, text = self._history(symbol)
+        lo, hi = np.searchsorted(days, [np.datetime64(_day(start), 'D'), np.datetime64(_day(end), 'D')])
+        return b'Date,Open,High,Low,Close,Adj Close,Volume\n' + text[offsets[lo]:offsets[hi]]
+
+    def fetch(self, symbol, start, end):
+        return read_bars(self.csv(symbol, start, end))
+
+
+def read_bars(body):
+    """DataFrame of the CSV bars of a response body, indexed by date."""
+    return pd.read_csv(io.BytesIO(body), index_col=0, parse_dates=True)
+
+
+def _url(template, symbol, start, end):
+    return template.format(symbol=urllib.parse.quote(symbol, safe=''),
+                           start=pd.Timestamp(start).strftime('%Y-%m-%d'),
+                           end=pd.Timestamp(end).strftime('%Y-%m-%d'))
+
+
+def _retry_after(headers):
+    try:
+        return max(0.0, float(headers['retry-after']))
+    except (KeyError, ValueError): # missing, or an HTTP date, which is not worth parsing
+        return None
+
+
+async def _read_head(reader):
+    # start line and headers (names in lower case), None if the peer closed first
+    line = await reader.readline()
+    if not line:
+        return None, None
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return line.decode('latin-1').rstrip('\r\n'), headers
+
+
+async def _read_response(reader):
+    line, headers = await _read_head(reader)
+    if line is None:
+        raise ConnectionError('connection closed before the response')
+    parts = line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        raise ConnectionError('bad status line %r' % (line,))
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''): # trailers
+                    pass
+                break
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+        body = bytes(body)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+        headers['connection'] = 'close'
+    if headers.get('content-encoding') == 'gzip':
+        body = gzip.decompress(body)
+    return int(parts[1]), headers, body
+
+
+class _TokenBucket:
+    # `rate` requests per second with bursts of `capacity`; every caller takes
+    # its token right away and sleeps until it is due, so waiters go in order
+    __slots__ = ('rate', 'capacity', 'tokens', 'stamp', 'resume')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.resume = 0.0 # no request before this time, after a Retry-After
+
+    def pause(self, seconds):
+        self.resume = max(self.resume, time.monotonic() + seconds)
+
+    async def wait(self):
+        while time.monotonic() < self.resume:
+            await asyncio.sleep(self.resume - time.monotonic())
+        if self.rate is None:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate) - 1
+        self.stamp = now
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class BulkFetcher:
+    """Concurrent HTTP fetches of daily bars, see the module comment.
+
+    `url` is the endpoint template, `rate` the requests per second allowed
+    per host (None for no limit), `timeout` the seconds one request may take.
+    """
+
+    def __init__(self, url=DEFAULT_URL, connections=64, per_host=8, rate=None, burst=None,
+                 retries=4, backoff=0.25, max_backoff=30.0, timeout=30.0, writers=1):
+        self.url = url
+        self.connections = connections
+        self.per_host = per_host
+        self.rate = rate
+        self.burst = burst or max(1, per_host)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.writers = writers
+        self.requests = 0 # HTTP requests sent, retries included
+        self.retried = 0
+        self._idle = {} # (scheme, host, port) -> idle (reader, writer) connections
+        self._slots = {} # (scheme, host, port) -> semaphore of per_host requests
+        self._buckets = {} # (scheme, host, port) -> token bucket
+        self._all = None # semaphore of all the requests
+        self._loop = None # event loop the semaphores and connections belong to
+
+    def _bind(self):
+        # semaphores and streams only work on the loop they were made on, a
+        # new loop (another refresh(), or asyncio.run(fetcher.get(...))) starts afresh
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._all = asyncio.Semaphore(self.connections)
+            self._slots, self._buckets, self._idle = {}, {}, {}
+
+    def _retry_after(self, headers):
+        # Retry-After of an answer in seconds, at most max_backoff
+        delay = _retry_after(headers)
+        return None if delay is None else min(self.max_backoff, delay)
+
+    def _host(self, key):
+        if key not in self._slots:
+            self._slots[key] = asyncio.Semaphore(self.per_host)
+            self._buckets[key] = _TokenBucket(self.rate, self.burst)
+            self._idle[key] = []
+        return self._slots[key], self._buckets[key]
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=scheme == 'https' or None), self.timeout)
+
+    async def get(self, url):
+        """One GET request over a pooled connection, returns (status, headers, body)."""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        request = ('GET %s HTTP/1.1\r\nHost: %s\r\nUser-Agent: %s\r\nAccept-Encoding: gzip\r\n'
+                   'Connection: keep-alive\r\n\r\n' % (target, parts.netloc, USER_AGENT)).encode()
+        self._bind()
+        slots, bucket = self._host(key)
+        async with self._all, slots:
+            await bucket.wait()
+            idle = self._idle[key]
+            while True:
+                reused = bool(idle)
+                reader, writer = idle.pop() if reused else await self._connect(key)
+                self.requests += 1
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    status, headers, body = await asyncio.wait_for(_read_response(reader),
+                                                                   self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused: # the server closed the idle connection, try a new one
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                break
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+            else:
+                idle.append((reader, writer))
+            if status in (429, 503) and self._retry_after(headers) is not None:
+                bucket.pause(self._retry_after(headers))
+        return status, headers, body
+
+    async def fetch(self, symbol, start, end):
+        """CSV body of the bars of `symbol` for [start, end), retried on failures."""
+        url = _url(self.url, symbol, start, end)
+        for attempt in range(self.retries + 1):
+            delay = None
+            try:
+                with metrics.span('fetch.http') as timer:
+                    status, headers, body = await self.get(url)
+                    timer.add(nbytes=len(body))
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                error = '%s: %s' % (type(e).__name__, e)
+            else:
+                if status == 200:
+                    return body
+                error = 'HTTP %d' % status
+                if status not in RETRY_STATUS:
+                    break
+                delay = self._retry_after(headers)
+            if attempt < self.retries:
+                self.retried += 1
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                await asyncio.sleep(delay)
+        raise FetchError('%s: %s' % (symbol, error))
+
+    async def refresh_async(self, store, symbols, start, end):
+        """Fetch the missing bars of every symbol into `store`, see refresh()."""
+        loop = asyncio.get_running_loop()
+        self._bind()
+        results = {}
+
+        def merge(symbol, body, gap_start, gap_end):
+            frame = read_bars(body)
+            store.merge(symbol, frame, gap_start, gap_end)
+            return len(frame)
+
+        async def one(symbol, executor):
+            fetches = rows = 0
+            try:
+                for gap_start, gap_end in store.missing(symbol, start, end):
+                    body = await self.fetch(symbol, gap_start, gap_end)
+                    # the gaps of one symbol are merged in order
+                    rows += await loop.run_in_executor(executor, merge, symbol, body,
+                                                       gap_start, gap_end)
+                    fetches += 1
+                error = None
+            except (FetchError, ValueError) as e: # ValueError: a body that is not CSV bars
+                error = str(e)
+            results[symbol] = {'fetches': fetches, 'rows': rows, 'error': error}
+
+        with ThreadPoolExecutor(self.writers) as executor:
+            try:
+                await asyncio.gather(*(one(symbol, executor) for symbol in symbols))
+            finally:
+                self.close()
+        return {symbol: results[symbol] for symbol in symbols}
+
+    def refresh(self, store, symbols, start, end):
+        """Bring every symbol of `store` up to date for [start, end).
+
+        Returns {symbol: {'fetches', 'rows', 'error'}}, error is None for the
+        symbols that are complete. A failed symbol keeps the gaps it could
+        fetch, the next refresh asks for the others.
+        """
+        return asyncio.run(self.refresh_async(store, symbols, start, end))
+
+    def close(self):
+        """Close the idle connections."""
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+            idle.clear()
+
+
+class StandInServer:
+    """Local HTTP endpoint serving canned bars, in a background thread.
+
+    GET /prices/<symbol>?start=YYYY-MM-DD&end=YYYY-MM-DD answers with CSV
+    bars from `provider` (SyntheticProvider() by default, CsvProvider for a
+    directory of files). Faults are injected at random with `seed`:
+    `failure_rate` of the requests get a 503, `drop_rate` lose their
+    connection without an answer, `latency` seconds are added to every
+    answer and above `rate` requests per second the answer is a 429 with a
+    Retry-After. The counters attribute counts what happened.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, provider=None, latency=0.0, failure_rate=0.0,
+                 drop_rate=0.0, rate=None, seed=0):
+        self.host = host
+        self.port = port
+        self.provider = provider if provider is not None else SyntheticProvider(seed)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.rate = rate
+        self.counters = dict.fromkeys(('connections', 'requests', 'ok', 'not_found', 'failed',
+                                       'dropped', 'throttled', 'max_concurrent'), 0)
+        self._random = random.Random(seed)
+        self._window = collections.deque() # times of the recent requests, for the rate limit
+        self._active = 0
+        self._loop = None
+        self._thread = None
+        self._server = None
+
+    @property
+    def url(self):
+        """URL template of the server for BulkFetcher and HttpProvider."""
+        return 'http://%s:%d/prices/{symbol}?start={start}&end={end}' % (self.host, self.port)
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, backlog=1024))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+            self._server.close()
+            handlers = asyncio.all_tasks(self._loop) # connections still kept alive by clients
+            for handler in handlers:
+                handler.cancel()
+            if handlers:
+                self._loop.run_until_complete(asyncio.wait(handlers))
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _throttled(self):
+        if self.rate is None:
+            return False
+        now = time.monotonic()
+        while self._window and self._window[0] <= now - 1:
+            self._window.popleft()
+        if len(self._window) >= self.rate:
+            return True
+        self._window.append(now)
+        return False
+
+    async def _handle(self, reader, writer):
+        self.counters['connections'] += 1
+        try:
+            while True:
+                line, headers = await _read_head(reader)
+                if line is None:
+                    break
+                self.counters['requests'] += 1
+                self._active += 1
+                self.counters['max_concurrent'] = max(self.counters['max_concurrent'], self._active)
+                try:
+                    answer = await self._answer(line, headers)
+                finally:
+                    self._active -= 1
+                if answer is None:
+                    break
+                writer.write(answer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, line, headers):
+        # the bytes of the response, None to drop the connection
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        draw = self._random.random()
+        if draw < self.drop_rate:
+            self.counters['dropped'] += 1
+            return None
+        if self._throttled():
+            self.counters['throttled'] += 1
+            return _response(429, b'rate limited\n', {'Retry-After': '1'})
+        if draw < self.drop_rate + self.failure_rate:
+            self.counters['failed'] += 1
+            return _response(503, b'try again\n')
+        method, target = (line.split() + ['', ''])[:2]
+        parts = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(parts.query)
+        if method != 'GET' or not parts.path.startswith('/prices/'):
+            self.counters['not_found'] += 1
+            return _response(404, b'not found\n')
+        symbol = urllib.parse.unquote(parts.path[len('/prices/'):])
+        start = query.get('start', [SYNTHETIC_START])[0]
+        end = query.get('end', [_day('today').strftime('%Y-%m-%d')])[0]
+        try:
+            if isinstance(self.provider, SyntheticProvider):
+                body = self.provider.csv(symbol, start, end)
+            else:
+                frame = await asyncio.get_running_loop().run_in_executor(
+                    None, self.provider.fetch, symbol, start, end)
+                body = frame.to_csv(index_label='Date').encode()
+        except FileNotFoundError:
+            self.counters['not_found'] += 1
+            return _response(404, b'unknown symbol\n')
+        extra = {}
+        if 'gzip' in headers.get('accept-encoding', ''):
+            body = gzip.compress(body, 1)
+            extra['Content-Encoding'] = 'gzip'
+        self.counters['ok'] += 1
+        return _response(200, body, extra, 'text/csv')
+
+
+def _response(status, body, headers=None, content_type='text/plain'):
+    reason = {200: 'OK', 404: 'Not Found', 429: 'Too Many Requests',
+              503: 'Service Unavailable'}[status]
+    head = ['HTTP/1.1 %d %s' % (status, reason), 'Content-Type: ' + content_type,
+            'Content-Length: %d' % len(body)]
+    head += ['%s: %s' % item for item in (headers or {}).items()]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode() + body
+
+
+def _server_args(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every answer')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of 503 answers')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='share of connections dropped without an answer')
+    parser.add_argument('--server-rate', type=float, help='requests per second before 429 answers')
+    parser.add_argument('--directory', help="serve '<symbol>.csv' files instead of random walks")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def _server(args, port=0):
+    provider = CsvProvider(args.directory) if args.directory else SyntheticProvider(args.seed)
+    return StandInServer(port=port, provider=provider, latency=args.latency,
+                         failure_rate=args.failure_rate, drop_rate=args.drop_rate,
+                         rate=args.server_rate, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk download of daily bars into a PriceStore.',
+                                     fromfile_prefix_chars='@')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='run the local stand-in server')
+    serve.add_argument('--port', type=int, default=8765)
+    _server_args(serve)
+
+    get = commands.add_parser('get', help='fetch the missing bars of symbols into a store',
+                              fromfile_prefix_chars='@')
+    get.add_argument('store', help='PriceStore directory')
+    get.add_argument('symbols', nargs='*', help='symbols, @file reads them from a file')
+    get.add_argument('--url', default=DEFAULT_URL, help='endpoint with {symbol}, {start}, {end}')
+    get.add_argument('--start', default='2020-01-01')
+    get.add_argument('--end', default='today')
+    get.add_argument('--connections', type=int, default=64)
+    get.add_argument('--per-host', type=int, default=8)
+    get.add_argument('--rate', type=float, help='requests per second per host')
+    get.add_argument('--retries', type=int, default=4)
+    get.add_argument('--timeout', type=float, default=30.0)
+    get.add_argument('--standin', action='store_true', help='fetch from a stand-in server in process')
+    get.add_argument('--synthetic', type=int, default=0, metavar='N',
+                     help='add N synthetic symbols SYN0 .. SYN<N-1>')
+    _server_args(get)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        with _server(args, args.port) as server:
+            print('serving %s' % server.url, flush=True)
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    symbols = list(args.symbols) + ['SYN%d' % i for i in range(args.synthetic)]
+    server = _server(args).start() if args.standin else None
+    try:
+        fetcher = BulkFetcher(server.url if server else args.url, args.connections, args.per_host,
+                              args.rate, retries=args.retries, timeout=args.timeout)
+        started = time.perf_counter()
+        results = fetcher.refresh(PriceStore(args.store), symbols, args.start, args.end)
+        elapsed = time.perf_counter() - started
+    finally:
+        if server:
+            server.stop()
+    failed = {symbol: r['error'] for symbol, r in results.items() if r['error']}
+    for symbol, error in failed.items():
+        print('FAILED %s' % error)
+    rows = sum(r['rows'] for r in results.values())
+    print('%d symbols, %d failed, %d requests (%d retries), %d bars in %.2f s, %.0f requests/s'
+          % (len(results), len(failed), fetcher.requests, fetcher.retried, rows, elapsed,
+             fetcher.requests / elapsed if elapsed else 0))
+    if server:
+        print('server: %s' % ', '.join('%s=%d' % item for item in server.counters.items()))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
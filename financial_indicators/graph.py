@@ -0,0 +1,242 @@
+# Indicator graph: shared intermediate results are computed once
+#
+# MACD, APO and EMA all take EMAs of the same prices, STDDEV and BBANDS the
+# same rolling mean and population stddev, and the seasonality starts from the
+# daily returns. A Plan builds the requested indicators out of nodes keyed by
+# what they compute, e.g. ('ema', prices, K) or ('rolling_moments', prices, 20),
+# so a node that two indicators need is the same node, and then runs every
+# node once, in the order it was added (which is a dependency order):
+#
+#   plan = Plan({'MACD': {}, 'EMA': {'span': 12}, 'BBANDS': {}, 'STDDEV': {}})
+#   outputs = plan.run(prices) # {'macd': ..., 'ema': ..., 'stddev': ...}
+#
+# Here EMA(12) is the MACD's fast EMA and STDDEV is the stddev of the BBANDS.
+# All the EMAs of one series go through a single ema_kernel call, and the
+# values of a node are dropped as soon as the last node that uses them has run.
+#
+# The nodes call the same kernels as the indicator functions and combine them
+# with the same arithmetic, so the outputs are identical to the last bit to
+# those of scan.INDICATORS. In float32 mode (see precision.py) the plan runs
+# in float64 and the indicator outputs are rounded at the end, as the
+# indicator functions do; the seasonality stays float64. A function from
+# `functions` runs in the caller's dtype and its outputs are what it returns
+# on its own: float32 from an indicator function, float64 from a statistic
+# such as the ADF.
+
+import operator
+
+import numpy as np
+
+from .ema import ema_kernel, smoothing_factor
+from .momentum import momentum
+from .precision import get_dtype, use_dtype
+from .rolling import rolling_mean, rolling_moments
+from .rsi import MODES as RSI_MODES
+from .rsi import gains_losses, rsi_index, wilder_average
+from .seasonality import STATS, daily_returns, seasonality
+
+PRICES = 0 # node of the prices given to run()
+DATES = 1 # node of the dates, needed by the seasonality only
+
+
+class Plan:
+    """Requested indicators as one graph of shared nodes, see the module comment.
+
+    `indicators` is a list of names from BUILDERS or a dict of name -> keyword
+    parameters, as for scan(). Names without a builder are looked up in
+    `functions`, a dict of name -> (function, output names) like
+    scan.INDICATORS, and run as a single node in the caller's dtype.
+    """
+
+    def __init__(self, indicators=(), functions=None):
+        self._nodes = [(('prices',), None, ()), (('dates',), None, ())]
+        self._index = {key: i for i, (key, _, _) in enumerate(self._nodes)}
+        self._emas = {} # source node -> smoothing factors of its EMA group
+        self._last = {} # node -> last node that uses it
+        self.functions = functions or {}
+        self.outputs = {} # output name -> node
+        self._float64 = set() # outputs the plan does not round in float32 mode
+        items = indicators.items() if isinstance(indicators, dict) else ((n, {}) for n in indicators)
+        for name, params in items:
+            self.add(name, **(params or {}))
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def keys(self):
+        """Key of every node, in the order they run."""
+        return [key for key, _, _ in self._nodes]
+
+    def add(self, name, **params):
+        """Add indicator `name`, returns its {output name: node}."""
+        name = name.upper()
+        if name in BUILDERS:
+            outputs = BUILDERS[name](self, PRICES, **params)
+            if name in STATISTICS:
+                self._float64.update(outputs)
+        elif name in self.functions:
+            function, names = self.functions[name]
+            call = self.node(('call', name, tuple(sorted(params.items()))),
+                             lambda prices: function(prices, **params), PRICES)
+            outputs = {output: self.node(('item', call, output), operator.itemgetter(output), call)
+                       for output in names}
+            self._float64.update(outputs)
+        else:
+            raise ValueError('unknown indicator %r' % (name,))
+        self.outputs.update(outputs)
+        return outputs
+
+    def node(self, key, function, *inputs):
+        """Node computing function(*values of inputs), the existing one if `key` is known."""
+        if key not in self._index:
+            self._index[key] = len(self._nodes)
+            self._nodes.append((key, function, inputs))
+            for j in inputs:
+                self._last[j] = self._index[key]
+        return self._index[key]
+
+    def item(self, source, i):
+        return self.node(('item', source, i), operator.itemgetter(i), source)
+
+    def plus(self, a, b):
+        return self.node(('plus', a, b), operator.add, a, b)
+
+    def minus(self, a, b):
+        return self.node(('minus', a, b), operator.sub, a, b)
+
+    def scale(self, source, factor):
+        return self.node(('scale', source, factor), lambda x: factor * x, source)
+
+    def ema(self, source, alpha):
+        """EMA of node `source` with smoothing factor `alpha`."""
+        if source not in self._emas:
+            alphas = self._emas[source] = []
+            self.node(('emas', source), lambda x: ema_kernel(x, alphas), source)
+        alphas = self._emas[source]
+        key = ('ema', source, alpha)
+        if key not in self._index:
+            alphas.append(alpha)
+        k = alphas.index(alpha)
+        # a copy, so the whole group can be dropped once its last EMA is used
+        return self.node(key, lambda group: group[k].copy(), self._index[('emas', source)])
+
+    def rolling_mean(self, source, window):
+        return self.node(('rolling_mean', source, window),
+                         lambda x: rolling_mean(x, window), source)
+
+    def rolling_moments(self, source, window):
+        """(mean, stddev) nodes of the rolling moments of `source`."""
+        moments = self.node(('rolling_moments', source, window),
+                            lambda x: rolling_moments(x, window), source)
+        return self.item(moments, 0), self.item(moments, 1)
+
+    def gains_losses(self, source):
+        split = self.node(('gains_losses', source), gains_losses, source)
+        return self.item(split, 0), self.item(split, 1)
+
+    def wilder_average(self, source, time_period):
+        return self.node(('wilder_average', source, time_period),
+                         lambda x: wilder_average(x, time_period), source)
+
+    def momentum(self, source, time_period):
+        return self.node(('momentum', source, time_period),
+                         lambda x: momentum(x, time_period), source)
+
+    def returns(self, source):
+        return self.node(('returns', source), daily_returns, source)
+
+    def seasonality(self, source, period='month', compound=False):
+        """Node of the seasonality() statistics of `source` over the dates."""
+        returns = self.returns(source)
+        return self.node(('seasonality', source, period, compound),
+                         lambda x, dates, r: seasonality(x, dates, period, compound, r)[0],
+                         source, DATES, returns)
+
+    def run(self, prices, dates=None):
+        """Every output for a 1-D series or a symbols x bars array, {output name: values}."""
+        dtype = get_dtype()
+        if dtype != np.float32:
+            return self._run(prices, dates, dtype)
+        with use_dtype('float64'):
+            outputs = self._run(prices, dates, dtype)
+        return {name: values if name in self._float64 else values.astype(np.float32)
+                for name, values in outputs.items()}
+
+    def _run(self, prices, dates, dtype):
+        if dates is None and DATES in self._last:
+            raise ValueError('the seasonality needs the dates')
+        keep = set(self.outputs.values())
+        values = {PRICES: prices, DATES: dates}
+        for i in range(DATES + 1, len(self._nodes)):
+            key, function, inputs = self._nodes[i]
+            if key[0] == 'call': # an opaque function, run as the caller would run it
+                with use_dtype(dtype):
+                    values[i] = function(*[values[j] for j in inputs])
+            else:
+                values[i] = function(*[values[j] for j in inputs])
+            for j in inputs:
+                if self._last[j] == i and j not in keep:
+                    values.pop(j, None)
+        return {name: values[i] for name, i in self.outputs.items()}
+
+
+def _apo(plan, prices, fast_span=10, slow_span=40):
+    fast = plan.ema(prices, smoothing_factor(fast_span))
+    slow = plan.ema(prices, smoothing_factor(slow_span))
+    return {'apo': plan.minus(fast, slow)}
+
+
+def _ema(plan, prices, span=20):
+    return {'ema': plan.ema(prices, smoothing_factor(span))}
+
+
+def _macd(plan, prices, fast_span=12, slow_span=26, signal_span=9):
+    line = _apo(plan, prices, fast_span, slow_span)['apo']
+    signal = plan.ema(line, smoothing_factor(signal_span))
+    return {'macd': line, 'macd_signal': signal, 'macd_histogram': plan.minus(line, signal)}
+
+
+def _rsi(plan, prices, time_period=20, mode='simple'):
+    if time_period < 1:
+        raise ValueError('time_period must be at least 1, got %r' % (time_period,))
+    if mode not in RSI_MODES:
+        raise ValueError('mode must be one of %s, got %r' % (', '.join(RSI_MODES), mode))
+    average = plan.rolling_mean if mode == 'simple' else plan.wilder_average
+    gain, loss = plan.gains_losses(prices)
+    avg_gain, avg_loss = average(gain, time_period), average(loss, time_period)
+    return {'rsi': plan.node(('rsi_index', avg_gain, avg_loss), rsi_index, avg_gain, avg_loss)}
+
+
+def _mom(plan, prices, time_period=20):
+    return {'mom': plan.momentum(prices, time_period)}
+
+
+def _stddev(plan, prices, time_period=20):
+    return {'stddev': plan.rolling_moments(prices, time_period)[1]}
+
+
+def _bbands(plan, prices, time_period=20, stdev_factor=2):
+    sma, stdev = plan.rolling_moments(prices, time_period)
+    width = plan.scale(stdev, stdev_factor)
+    return {'bb_middle': sma, 'bb_upper': plan.plus(sma, width), 'bb_lower': plan.minus(sma, width)}
+
+
+def _seasonality(plan, prices, period='month', compound=False):
+    # mean return of every month of the year, as scan.monthly_seasonality
+    stats = plan.seasonality(prices, period, compound)
+    column = STATS.index('mean')
+    return {'seasonality': plan.node(('mean', stats), lambda s: s[..., column], stats)}
+
+
+# indicator name, as in scan.INDICATORS -> function adding its nodes to a plan
+BUILDERS = {
+    'APO': _apo,
+    'EMA': _ema,
+    'MACD': _macd,
+    'RSI': _rsi,
+    'MOM': _mom,
+    'STDDEV': _stddev,
+    'BBANDS': _bbands,
+    'SEASONALITY': _seasonality,
+}
+STATISTICS = ('SEASONALITY',) # outputs kept in float64
@@ -0,0 +1,247 @@
+# Append-only indicator results for the symbols of a PriceStore
+#
+# Every run of a script recomputes its indicators over the whole history. Here
+# the results are kept on disk together with the state the indicators need to
+# go on (the chunked calculators of chunked.py: the last EMA values, the last
+# prices of the rolling windows, RSI's last price and gains and losses, the
+# momentum lookback), so when new bars arrive only those bars are computed:
+#
+#   indicators = IndicatorStore('indicators', PriceStore('price_cache'))
+#   indicators.update('TSM') # computes the bars added since the last update
+#   dates, outputs = indicators.load('TSM')
+#
+# <root>/<symbol>/<column>/ holds one raw file per output column (e.g.
+# apo.bin), appended to on every update, and a state.json with the number of
+# bars computed, the dtype of every output, the calculator state and a check
+# of the prices they were computed from. The outputs are written first and
+# the state replaced atomically after them, so an interrupted update leaves
+# bytes past the recorded length, which the next update cuts off.
+#
+# History that changed since the last update (a split or a dividend adjusts
+# all the earlier Adj Close prices, a data vendor corrects a bar) is detected
+# before appending and the symbol is rebuilt from the first bar. The check
+# compares the stored dates and prices at the first bar, the last CHECK_TAIL
+# bars and CHECK_SAMPLES bars spread over the history, so it costs the same
+# for any history length and catches any adjustment of the past prices.
+# verify='full' also compares a hash of every stored price, which catches a
+# single revised bar anywhere but reads the whole history.
+#
+# The last stored bar is an exception: the store keeps today's bar while the
+# session is open, and its price changes until the close. The state also holds
+# the calculators as they were before the last bar, so when only the price of
+# the last bar changed, the update goes on from there and recomputes that bar
+# instead of rebuilding the symbol.
+#
+# The results are identical to the last bit to the scan of the whole series,
+# as for the chunked computation.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from . import metrics
+from .chunked import DEFAULT_INDICATORS, ChunkedIndicators, _params
+from .precision import get_dtype
+from .store import _atomic_write
+
+STATE_FILE = 'state.json'
+CHECK_TAIL = 8 # last bars compared before appending
+CHECK_SAMPLES = 64 # bars spread over the history compared before appending
+VERIFY = ('sample', 'full')
+
+
+def _check_positions(rows):
+    positions = np.linspace(0, rows - 1, CHECK_SAMPLES).astype(np.intp) if rows else []
+    return np.unique(np.r_[positions, np.arange(max(rows - CHECK_TAIL, 0), rows)]).astype(np.intp)
+
+
+def _digest(prices):
+    return hashlib.sha1(np.ascontiguousarray(prices, dtype=np.float64).tobytes()).hexdigest()
+
+
+def _spec(indicators):
+    # indicators as a dict of name -> parameters, comparable with the stored one
+    if isinstance(indicators, dict):
+        return {name.upper(): dict(params or {}) for name, params in indicators.items()}
+    return {name.upper(): {} for name in indicators}
+
+
+class IndicatorStore:
+    """Indicator results kept up to date one appended bar at a time.
+
+    `prices` is the PriceStore the bars come from, `indicators` a list of
+    names or a dict of name -> parameters as for the chunked calculators.
+    """
+
+    def __init__(self, root, prices, indicators=DEFAULT_INDICATORS, column='Close',
+                 verify='sample'):
+        if verify not in VERIFY:
+            raise ValueError('verify must be one of %s, got %r' % (', '.join(VERIFY), verify))
+        self.root = root
+        self.prices = prices
+        self.indicators = _spec(indicators)
+        ChunkedIndicators(self.indicators) # reject unknown names and parameters now
+        self.column = column
+        self.verify = verify
+
+    def _path(self, symbol, name=''):
+        return os.path.join(self.root, symbol, self.column.lower().replace(' ', '_'), name)
+
+    def state(self, symbol):
+        """The stored state.json of `symbol`, None if it was never computed."""
+        try:
+            with open(self._path(symbol, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def stale(self, symbol, dates=None, prices=None):
+        """Why the stored results of `symbol` cannot be appended to, None if they can."""
+        state = self.state(symbol)
+        if state is None:
+            return 'not computed'
+        if state['indicators'] != self.indicators:
+            return 'indicators changed'
+        if state['dtype'] != get_dtype().name:
+            return 'dtype changed'
+        if dates is None:
+            dates, values = self.prices.load(symbol, [self.column], mmap_mode='r')
+            prices = values.get(self.column, np.empty(0))
+        rows = state['rows']
+        if len(dates) < rows:
+            return 'history shortened'
+        positions = np.asarray(state['check']['positions'], dtype=np.intp)
+        closed = positions < rows - 1 # the price of the last bar may change, see the module comment
+        if state.get('previous') is None:
+            closed[:] = True
+        if (not np.array_equal(np.asarray(dates[positions]).view(np.int64), state['check']['dates'])
+                or not np.array_equal(np.asarray(prices[positions[closed]], dtype=np.float64),
+                                      np.asarray(state['check']['prices'], dtype=np.float64)[closed],
+                                      equal_nan=True)):
+            return 'history revised'
+        if self.verify == 'full':
+            if state['digest'] is None:
+                return 'no hash stored'
+            if _digest(prices[:rows - 1 if state.get('previous') is not None else rows]) != state['digest']:
+                return 'history revised'
+        return None
+
+    def _last_revised(self, state, prices):
+        # the price of the last stored bar changed (stale() allowed it)
+        rows = state['rows']
+        return (state.get('previous') is not None
+                and not np.array_equal(np.float64(prices[rows - 1]),
+                                       np.float64(state['check']['prices'][-1]), equal_nan=True))
+
+    def update(self, symbol):
+        """Compute the bars of `symbol` added since the last update.
+
+        Returns (bars computed, reason of the rebuild or None). A stale
+        symbol is recomputed from its first bar; a revised last bar is
+        computed again.
+        """
+        dates, values = self.prices.load(symbol, [self.column], mmap_mode='r')
+        prices = values.get(self.column, np.empty(0))
+        reason = self.stale(symbol, dates, prices)
+        if reason is None:
+            state = self.state(symbol)
+            rows = state['rows']
+            if self._last_revised(state, prices):
+                rows -= 1
+                indicators = ChunkedIndicators.from_state(state['previous'])
+            else:
+                indicators = ChunkedIndicators.from_state(state['state'])
+        else:
+            rows = 0
+            indicators = ChunkedIndicators(self.indicators)
+        if reason is None and rows == len(prices):
+            return 0, None
+        if len(prices) == 0: # nothing stored for the symbol yet
+            return 0, reason
+
+        os.makedirs(self._path(symbol), exist_ok=True)
+        with metrics.span('incremental.update', rows=len(prices) - rows):
+            new = np.asarray(prices[rows:], dtype=np.float64)
+            outputs = indicators.update(new[:-1])
+            previous = indicators.get_state() # before the last bar, which may still change
+            for output, array in indicators.update(new[-1:]).items():
+                outputs[output] = np.concatenate((outputs[output], array))
+            for output, array in outputs.items():
+                with open(self._path(symbol, output + '.bin'), 'r+b' if rows else 'wb') as f:
+                    f.truncate(rows * array.itemsize) # drop what an interrupted update left
+                    f.seek(0, os.SEEK_END)
+                    f.write(np.ascontiguousarray(array).tobytes())
+            self._write_state(symbol, indicators, previous, dates, prices,
+                              {output: array.dtype.name for output, array in outputs.items()})
+        return len(prices) - rows, reason
+
+    def _write_state(self, symbol, indicators, previous, dates, prices, outputs):
+        rows = len(prices)
+        positions = _check_positions(rows)
+        state = {'indicators': self.indicators, 'dtype': get_dtype().name, 'rows': rows,
+                 'outputs': outputs,
+                 'last_date': str(np.datetime64(dates[-1], 'D')) if rows else None,
+                 'check': {'positions': positions.tolist(),
+                           'dates': np.asarray(dates[positions]).view(np.int64).tolist(),
+                           'prices': np.asarray(prices[positions], dtype=np.float64).tolist()},
+                 'digest': _digest(prices[:rows - 1]) if self.verify == 'full' else None,
+                 'state': indicators.get_state(), 'previous': previous}
+        _atomic_write(self._path(symbol, STATE_FILE), lambda f: f.write(json.dumps(state).encode()))
+
+    def refresh(self, symbols):
+        """update() every symbol, returns {symbol: (new bars, rebuild reason)}."""
+        return {symbol: self.update(symbol) for symbol in symbols}
+
+    def load(self, symbol):
+        """Stored results of `symbol` as (dates, {output: memory-mapped array})."""
+        state = self.state(symbol)
+        if state is None:
+            raise KeyError('%s has no computed indicators' % (symbol,))
+        rows = state['rows']
+        dates, _ = self.prices.load(symbol, [self.column], mmap_mode='r')
+        outputs = {}
+        for output, dtype in state['outputs'].items():
+            outputs[output] = (np.memmap(self._path(symbol, output + '.bin'), dtype=dtype, mode='r',
+                                         shape=(rows,)) if rows else np.empty(0, dtype=dtype))
+        return dates[:rows], outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Bring the stored indicators of PriceStore symbols up to date.')
+    parser.add_argument('store', help='PriceStore directory')
+    parser.add_argument('output', help='directory of the indicator results')
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--column', default='Close', help='price column')
+    parser.add_argument('--indicators', nargs='+', type=str.upper, default=list(DEFAULT_INDICATORS))
+    parser.add_argument('-p', '--param', action='append', default=[], metavar='NAME.param=value',
+                        help='indicator parameter, e.g. RSI.time_period=14')
+    parser.add_argument('--start', help='fetch missing bars from this date first')
+    parser.add_argument('--end', help='end of the fetch, default today')
+    parser.add_argument('--verify', choices=VERIFY, default='sample',
+                        help='full also hashes every stored price to detect revisions')
+    args = parser.parse_args(argv)
+
+    from .store import PriceStore
+
+    params = _params(args.param)
+    for name in params:
+        if name not in args.indicators:
+            parser.error('parameters given for %s, which is not computed' % name)
+    prices = PriceStore(args.store)
+    if args.start:
+        prices.refresh(args.symbols, args.start, args.end or 'today')
+    store = IndicatorStore(args.output, prices, {name: params.get(name, {}) for name in args.indicators},
+                           args.column, args.verify)
+    for symbol in args.symbols:
+        rows, reason = store.update(symbol)
+        print('%-10s %8d new bars%s' % (symbol, rows, ', rebuilt: ' + reason if reason else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# Opt-in instrumentation of the hot paths
+#
+# Data fetches, cache reads and writes, the indicator kernels, DataFrame
+# assembly and chart rendering report to an in-process registry: per name the
+# number of calls, wall and CPU seconds, bytes and rows. The registry can be
+# dumped as JSON or in the Prometheus text format.
+#
+# Instrumentation is off unless enable() is called or the environment variable
+# FINANCIAL_INDICATORS_METRICS is set to something other than '' or '0'. While
+# it is off, a timed function costs one extra call and a flag test, and span()
+# returns a shared object that does nothing.
+#
+#   from financial_indicators import metrics
+#   metrics.enable()
+#   ... run a scan ...
+#   print(metrics.to_prometheus())
+
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+ENV_VAR = 'FINANCIAL_INDICATORS_METRICS'
+FIELDS = ('calls', 'wall_seconds', 'cpu_seconds', 'bytes', 'rows')
+PREFIX = 'financial_indicators'
+
+_enabled = os.environ.get(ENV_VAR, '') not in ('', '0')
+_registry = {} # name -> [calls, wall_seconds, cpu_seconds, bytes, rows]
+_lock = threading.Lock()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    """Turn instrumentation on (or off with on=False)."""
+    global _enabled
+    _enabled = bool(on)
+
+
+def disable():
+    enable(False)
+
+
+def record(name, calls=1, wall_seconds=0.0, cpu_seconds=0.0, nbytes=0, rows=0):
+    """Add to the totals of `name`, whether instrumentation is on or not."""
+    with _lock:
+        totals = _registry.get(name)
+        if totals is None:
+            totals = _registry[name] = [0, 0.0, 0.0, 0, 0]
+        totals[0] += calls
+        totals[1] += wall_seconds
+        totals[2] += cpu_seconds
+        totals[3] += int(nbytes)
+        totals[4] += int(rows)
+
+
+class _Span:
+    __slots__ = ('name', 'rows', 'nbytes', 'wall', 'cpu')
+
+    def __init__(self, name, rows=0, nbytes=0):
+        self.name = name
+        self.rows = rows
+        self.nbytes = nbytes
+
+    def add(self, rows=0, nbytes=0):
+        """Count rows or bytes found out inside the block."""
+        self.rows += rows
+        self.nbytes += nbytes
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, 1, time.perf_counter() - self.wall, time.process_time() - self.cpu,
+               self.nbytes, self.rows)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def add(self, rows=0, nbytes=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, rows=0, nbytes=0):
+    """Context manager timing a block as one call of `name`."""
+    return _Span(name, rows, nbytes) if _enabled else _NO_SPAN
+
+
+def timed(name):
+    """Decorator timing every call as `name`, rows are the size of the first argument."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            rows = np.size(args[0]) if args else 0
+            with _Span(name, rows):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """Totals of every name as {name: {field: value}}."""
+    with _lock:
+        return {name: dict(zip(FIELDS, totals)) for name, totals in sorted(_registry.items())}
+
+
+def reset():
+    with _lock:
+        _registry.clear()
+
+
+def collect():
+    """snapshot() and reset(), e.g. to send a worker's totals to its parent."""
+    with _lock:
+        totals = {name: dict(zip(FIELDS, values)) for name, values in sorted(_registry.items())}
+        _registry.clear()
+    return totals
+
+
+def worker_init(on):
+    """Pool initializer: the parent's switch and an empty registry in the worker."""
+    enable(on)
+    reset()
+
+
+def merge(totals):
+    """Add a snapshot() from another process to the registry."""
+    for name, values in totals.items():
+        record(name, values['calls'], values['wall_seconds'], values['cpu_seconds'],
+               values['bytes'], values['rows'])
+
+
+def to_json(indent=None):
+    return json.dumps(snapshot(), indent=indent)
+
+
+def to_prometheus(prefix=PREFIX):
+    """The registry in the Prometheus text exposition format."""
+    metrics = (('calls_total', 'calls', 'Number of calls.'),
+               ('wall_seconds_total', 'wall_seconds', 'Wall clock time spent.'),
+               ('cpu_seconds_total', 'cpu_seconds', 'Process CPU time spent.'),
+               ('bytes_total', 'bytes', 'Bytes read or written.'),
+               ('rows_total', 'rows', 'Rows or values processed.'))
+    totals = snapshot()
+    lines = []
+    for suffix, field, description in metrics:
+        metric = '%s_%s' % (prefix, suffix)
+        lines.append('# HELP %s %s' % (metric, description))
+        lines.append('# TYPE %s counter' % metric)
+        for name, values in totals.items():
+            lines.append('%s{name="%s"} %s' % (metric, name.replace('\\', '\\\\').replace('"', '\\"'),
+                                               repr(values[field])))
+    return '\n'.join(lines) + '\n'
+
+
+def dump(path):
+    """Write the registry to `path`, Prometheus text for .prom or .txt, JSON otherwise."""
+    text = to_prometheus() if path.endswith(('.prom', '.txt')) else to_json(indent=1)
+    with open(path, 'w') as f:
+        f.write(text)
@@ -0,0 +1,72 @@
+# Momentum (MOM) and Rate of Change (ROC)
+#
+# Momentum = Current Price - Price n Periods Ago
+# ROC = (Current Price - Price n Periods Ago) / Price n Periods Ago * 100
+#
+# momentum() follows the Momentum script: the reference price is the oldest of
+# the last 'time_period' observed prices (the current one included), so
+# time_period=20 compares with the price 19 bars ago, and early bars use the
+# first price of the series.
+#
+# momentum_matrix() takes lookbacks in bars, so lookback=19 is the script's
+# time_period=20, and computes every lookback from one strided view of the
+# price buffer.
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .backends import select
+from .metrics import timed
+from .precision import float32_blocks
+
+LOOKBACKS = (1, 5, 10, 20, 60, 120, 250)
+WARMUPS = ('partial', 'nan')
+
+
+@timed('kernel.momentum')
+@float32_blocks()
+def momentum(prices, time_period=20):
+    """Momentum of a 1-D series or a symbols x bars array."""
+    if time_period < 1:
+        raise ValueError('time_period must be at least 1, got %r' % (time_period,))
+    x = np.asarray(prices, dtype=np.float64)
+    series = x.reshape(int(np.prod(x.shape[:-1])), x.shape[-1])
+    # partial history compares with the first price, as the backends' diff does
+    return select('diff', series.size).diff(series, time_period - 1).reshape(x.shape)
+
+
+@timed('kernel.momentum_matrix')
+@float32_blocks()
+def momentum_matrix(prices, lookbacks=LOOKBACKS, warmup='partial'):
+    """Momentum and ROC for many lookbacks at once, returns (mom, roc).
+
+    For a 1-D series the arrays are lookbacks x bars, for a symbols x bars
+    array they are symbols x lookbacks x bars. With warmup='partial' bars with
+    less than `lookback` bars of history compare with the first price, as the
+    Momentum script does; with warmup='nan' they are NaN.
+    """
+    if warmup not in WARMUPS:
+        raise ValueError('warmup must be one of %s, got %r' % (', '.join(WARMUPS), warmup))
+    lookbacks = np.asarray(lookbacks, dtype=np.intp).reshape(-1)
+    if lookbacks.size and lookbacks.min() < 1:
+        raise ValueError('lookbacks must be at least 1, got %r' % (lookbacks.min(),))
+    x = np.asarray(prices, dtype=np.float64)
+    n = x.shape[-1]
+    longest = int(lookbacks.max()) if lookbacks.size else 0
+
+    if n == 0:
+        empty = np.empty(x.shape[:-1] + (lookbacks.size, 0))
+        return empty, empty.copy()
+
+    # one buffer holding 'longest' warm-up bars in front of the prices; window t
+    # of its strided view covers bars t - longest .. t, so the price L bars ago
+    # is at position longest - L of every window
+    fill = x[..., :1] if warmup == 'partial' else np.full(x.shape[:-1] + (1,), np.nan)
+    buffer = np.concatenate([np.repeat(fill, longest, axis=-1), x], axis=-1)
+    windows = sliding_window_view(buffer, longest + 1, axis=-1) # ... x bars x (longest + 1)
+    reference = np.moveaxis(windows[..., longest - lookbacks], -1, -2) # ... x lookbacks x bars
+
+    mom = np.subtract(x[..., None, :], reference)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roc = mom / reference * 100
+    return mom, roc
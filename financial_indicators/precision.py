@@ -0,0 +1,180 @@
+# Opt-in float32 mode
+#
+# Prices and indicator outputs are float64 unless float32 is asked for. For a
+# large intraday universe float32 halves the memory, the disk space and the
+# memory bandwidth, at about 7 significant digits:
+#
+# - storage: PriceStore(root, dtype=np.float32) caches the prices as float32,
+#   build_universe(..., dtype=np.float32) writes float32 memory-mapped columns
+#   and the scan's output columns follow the universe's dtype. FLOAT64_COLUMNS
+#   (the volume) stay float64 in both
+# - compute: in float32 mode (set_dtype('float32'), use_dtype() or the
+#   FINANCIAL_INDICATORS_DTYPE environment variable) the indicator functions
+#   return float32 arrays. The input is processed in blocks of series; each
+#   block is converted to float64, so the EMA recurrences, running sums and
+#   variances accumulate in float64 and only the final values are rounded to
+#   float32. Memory is the float32 input and outputs plus the float64 work of
+#   one block
+#
+# deviations() measures the largest difference from the float64 results. On
+# random walks of 2000 series x 2000 bars with prices around 100 (seeds 0 to
+# 3), the largest error relative to the price is
+#
+#                          float64 prices     prices stored as float32
+#   EMA                    6.4e-8             8.4e-8
+#   BBANDS middle          6.5e-8             8.8e-8
+#   BBANDS upper / lower   7.2e-8             1.2e-7
+#   APO                    6.5e-9             3.2e-8
+#   MACD line / signal     3.3e-9             1.9e-8
+#   MACD histogram         9.4e-10            1.2e-8
+#   MOM                    1.1e-8             1.2e-7
+#   STDDEV                 4.0e-9             3.8e-8
+#
+# and RSI is off by at most 3.8e-6 RSI points from float64 prices, 6.4e-3
+# points from float32 prices (the rounded prices change the small gains and
+# losses, so this one varies most from one seed to the next). MAX_DEVIATIONS
+# are twice these, the margin for other prices and seeds.
+#
+# The statistics (ADF, ACF/PACF, seasonality, ARIMA) always return float64.
+#
+# set_dtype() sets the default of the whole process. use_dtype() overrides it
+# in a context variable, so it only applies to the code inside the with block
+# in the same thread (or asyncio task): a Plan that runs in float64 under
+# float32 mode does not change the dtype that other threads see meanwhile.
+
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+
+import numpy as np
+
+ENV_VAR = 'FINANCIAL_INDICATORS_DTYPE'
+DTYPES = ('float64', 'float32')
+FLOAT64_COLUMNS = ('Volume',) # stored as float64 in float32 mode, volumes pass 2**24
+BLOCK_BYTES = 8 << 20 # float64 input converted at a time in float32 mode
+
+# bound of the deviations() error, twice the largest measured at its default
+# size, relative to the price (RSI: in RSI points), from float64 prices and
+# from prices stored as float32
+MAX_DEVIATIONS = {
+    'ema': (1.3e-7, 1.7e-7),
+    'bb_middle': (1.3e-7, 1.8e-7),
+    'bb_upper': (1.5e-7, 2.5e-7),
+    'bb_lower': (1.5e-7, 2.5e-7),
+    'apo': (1.4e-8, 6.5e-8),
+    'macd': (6.7e-9, 3.9e-8),
+    'macd_signal': (6.7e-9, 3.9e-8),
+    'macd_histogram': (1.9e-9, 2.4e-8),
+    'mom': (2.3e-8, 2.4e-7),
+    'stddev': (8.0e-9, 7.6e-8),
+    'rsi': (7.7e-6, 1.3e-2),
+}
+ABSOLUTE = ('rsi',) # outputs whose MAX_DEVIATIONS are absolute
+
+_local = threading.local() # inside a float32 block, nested calls run in float64
+
+
+def _check(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.name not in DTYPES:
+        raise ValueError('dtype must be one of %s, got %r' % (', '.join(DTYPES), dtype.name))
+    return dtype
+
+
+_dtype = _check(os.environ.get(ENV_VAR) or 'float64') # default of the process
+_override = contextvars.ContextVar('dtype', default=None) # set by use_dtype()
+
+
+def set_dtype(dtype):
+    """Return indicator outputs as `dtype`, float64 (the default) or float32."""
+    global _dtype
+    _dtype = _check(dtype)
+
+
+def get_dtype():
+    dtype = _override.get()
+    return _dtype if dtype is None else dtype
+
+
+@contextlib.contextmanager
+def use_dtype(dtype):
+    """`dtype` inside a with block, for the current thread or task only."""
+    token = _override.set(_check(dtype))
+    try:
+        yield _override.get()
+    finally:
+        _override.reset(token)
+
+
+def float32_blocks(axis=0):
+    """Decorator running an indicator function block by block in float32 mode.
+
+    `axis` is the axis of the series in the function's outputs for a 2-D
+    input, e.g. 1 for ema_kernel's alphas x series x bars. Outside float32 mode
+    the function is called as it is.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(prices, *args, **kwargs):
+            if get_dtype() != np.float32 or getattr(_local, 'inside', False):
+                return function(prices, *args, **kwargs)
+            _local.inside = True
+            try:
+                return _blocks(function, axis, prices, args, kwargs)
+            finally:
+                _local.inside = False
+        return wrapper
+    return decorate
+
+
+def _blocks(function, axis, prices, args, kwargs):
+    x = np.asarray(prices)
+    lead, n = x.shape[:-1], x.shape[-1]
+    series = x.reshape(-1, n)
+    if len(series) == 0:
+        result = function(x.astype(np.float64), *args, **kwargs)
+        if isinstance(result, tuple):
+            return tuple(r.astype(np.float32) for r in result)
+        return result.astype(np.float32)
+
+    per = max(1, BLOCK_BYTES // (8 * max(n, 1)))
+    outputs = single = None
+    for start in range(0, len(series), per):
+        stop = min(start + per, len(series))
+        result = function(series[start:stop].astype(np.float64), *args, **kwargs)
+        single = not isinstance(result, tuple)
+        result = (result,) if single else result
+        if outputs is None:
+            outputs = [np.empty(r.shape[:axis] + (len(series),) + r.shape[axis + 1:], dtype=np.float32)
+                       for r in result]
+        for out, r in zip(outputs, result):
+            out[(slice(None),) * axis + (slice(start, stop),)] = r
+    outputs = [out.reshape(out.shape[:axis] + lead + out.shape[axis + 1:]) for out in outputs]
+    return outputs[0] if single else tuple(outputs)
+
+
+def deviations(symbols=2000, bars=2000, seed=0, indicators=None, stored=True):
+    """Largest float32 mode error of every indicator output, against float64.
+
+    Prices are seeded random walks around 100, given as float32 to the float32
+    run when `stored` (storage and compute error) or as float64 (compute error
+    only). Returns {output: (max abs error, max error / price)}.
+    """
+    from .bench import synthetic_prices
+    from .scan import INDICATORS
+
+    _, prices = synthetic_prices(symbols, bars, seed)
+    stored = prices.astype(np.float32) if stored else prices
+    result = {}
+    for name in indicators or ('EMA', 'APO', 'MACD', 'RSI', 'MOM', 'STDDEV', 'BBANDS'):
+        function = INDICATORS[name][0]
+        with use_dtype('float64'):
+            expected = function(prices)
+        with use_dtype('float32'):
+            got = function(stored)
+        for output, values in expected.items():
+            error = np.abs(got[output].astype(np.float64) - values)
+            result[output] = (float(np.nanmax(error)), float(np.nanmax(error / np.abs(prices))))
+    return result
@@ -0,0 +1,226 @@
+# Headless chart rendering
+#
+# The same panels the scripts show with plt.show(), drawn on Agg canvases
+# without pyplot, so they can be written to PNG or SVG files from worker
+# processes on a machine without a display:
+#
+# apo       - price with the fast and slow EMA, APO below
+# macd      - price, MACD line, signal line and histogram below
+# rsi       - price, average gain and loss, RSI
+# bbands    - price with the middle, upper and lower Bollinger Band
+#
+# Long series are downsampled before plotting (LTTB or min/max buckets), so the
+# time to draw a chart stays about the same however much history there is.
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from . import metrics
+from .ema import apo, macd
+from .rolling import rolling_moments
+from .rsi import rsi
+from .universe import Universe
+
+MAX_POINTS = 2000
+CHARTS = ('apo', 'macd', 'rsi', 'bbands')
+
+
+def minmax_indices(y, n_out):
+    """Indices keeping the lowest and highest point of each of n_out / 2 buckets."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n <= n_out or n <= 2:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    filled = np.where(np.isnan(padded), np.inf, padded)
+    low = filled.argmin(axis=1)
+    filled = np.where(np.isnan(padded), -np.inf, padded)
+    high = filled.argmax(axis=1)
+    base = np.arange(buckets) * size
+    keep = np.unique(np.concatenate([base + low, base + high, [0, n - 1]]))
+    return keep[keep < n]
+
+
+def lttb_indices(y, n_out, x=None):
+    """Indices picked by Largest-Triangle-Three-Buckets downsampling to n_out points."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    y = np.where(np.isnan(y), 0.0, y)
+
+    # the first and last points are kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    means_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    means_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+
+    keep = np.empty(n_out, dtype=np.intp)
+    keep[0] = 0
+    keep[-1] = n - 1
+    previous = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # triangle with the previously kept point and the mean of the next bucket
+        next_x = means_x[b + 1] if b + 1 < n_out - 2 else x[n - 1]
+        next_y = means_y[b + 1] if b + 1 < n_out - 2 else y[n - 1]
+        area = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                      - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(area.argmax())
+        keep[b + 1] = previous
+    return keep
+
+
+def downsample(y, max_points=MAX_POINTS, method='lttb'):
+    """Indices of the points of `y` to plot."""
+    if method == 'lttb':
+        return lttb_indices(y, max_points)
+    if method == 'minmax':
+        return minmax_indices(y, max_points)
+    if method is None:
+        return np.arange(len(y))
+    raise ValueError("method must be 'lttb', 'minmax' or None, got %r" % (method,))
+
+
+class _Plotter:
+    # plots every series through the downsampler
+    def __init__(self, dates, max_points, method):
+        self.dates = dates
+        self.max_points = max_points
+        self.method = method
+
+    def line(self, ax, values, **kwargs):
+        keep = downsample(values, self.max_points, self.method)
+        ax.plot(self.dates[keep], values[keep], **kwargs)
+
+    def bars(self, ax, values, **kwargs):
+        # one line collection instead of a rectangle per bar
+        keep = downsample(values, self.max_points, 'minmax' if self.method else None)
+        ax.vlines(self.dates[keep], 0, values[keep], **kwargs)
+
+
+def _figure(rows, figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, [fig.add_subplot(rows, 1, i + 1) for i in range(rows)]
+
+
+def apo_chart(plot, symbol, close, num_periods_fast=10, num_periods_slow=40):
+    fig, (ax1, ax2) = _figure(2, (12, 8))
+    ema_f, ema_s, apo_values = apo(close, num_periods_fast, num_periods_slow)
+    ax1.set_ylabel('%s price in $' % symbol)
+    plot.line(ax1, close, color='g', lw=2., label='ClosePrice')
+    plot.line(ax1, ema_f, color='b', lw=2., label='FastExponential%dDayMovingAverage' % num_periods_fast)
+    plot.line(ax1, ema_s, color='r', lw=2., label='SlowExponential%dDayMovingAverage' % num_periods_slow)
+    ax1.legend()
+    ax2.set_ylabel('APO')
+    plot.line(ax2, apo_values, color='black', lw=2., label='AbsolutePriceOscillator')
+    ax2.legend()
+    return fig
+
+
+def macd_chart(plot, symbol, close, fast_ema=12, slow_ema=26, signal_ema=9):
+    fig, (ax1, ax2) = _figure(2, (12, 8))
+    macd_line, signal_line, macd_histogram = macd(close, fast_ema, slow_ema, signal_ema)
+    ax1.set_ylabel('Closing Price ($)')
+    plot.line(ax1, close)
+    ax1.set_title('%s Stock Price' % symbol)
+    ax2.set_ylabel('MACD')
+    plot.line(ax2, macd_line, label='MACD')
+    plot.line(ax2, signal_line, label='Signal Line')
+    plot.bars(ax2, macd_histogram, label='MACD Histogram', color='grey')
+    ax2.legend()
+    ax2.set_title('MACD Indicator')
+    return fig
+
+
+def rsi_chart(plot, symbol, close, time_period=20, mode='simple'):
+    fig, axs = _figure(3, (12, 10))
+    avg_gain, avg_loss, rsi_values = rsi(close, time_period, mode)
+    plot.line(axs[0], close, color='black', lw=2., label='%s Price' % symbol)
+    axs[0].legend(loc='upper left')
+    plot.line(axs[1], avg_gain, color='g', lw=2., label='RSI Avg Gain')
+    plot.line(axs[1], avg_loss, color='r', lw=2., label='RSI Avg Loss')
+    axs[1].legend(loc='upper left')
+    plot.line(axs[2], rsi_values, color='b', lw=2., label='RSI')
+    axs[2].legend(loc='upper left')
+    return fig
+
+
+def bbands_chart(plot, symbol, close, time_period=20, stdev_factor=2):
+    fig, (ax1,) = _figure(1, (12, 6))
+    sma, stdev = rolling_moments(close, time_period)
+    ax1.set_ylabel('%s price in $' % symbol)
+    plot.line(ax1, close, color='g', lw=2., label='ClosePrice')
+    plot.line(ax1, sma, color='b', lw=2., label='MiddleBollingerBand%dDaySMA' % time_period)
+    plot.line(ax1, sma + stdev_factor * stdev, color='black', lw=2., label='UpperBollingerBand')
+    plot.line(ax1, sma - stdev_factor * stdev, color='r', lw=2., label='LowerBollingerBand')
+    ax1.legend()
+    return fig
+
+
+CHART_FUNCTIONS = {
+    'apo': apo_chart,
+    'macd': macd_chart,
+    'rsi': rsi_chart,
+    'bbands': bbands_chart,
+}
+
+
+def render_chart(path, chart, symbol, dates, close, max_points=MAX_POINTS, method='lttb', **params):
+    """Draw one chart and save it to `path`, the format follows the extension."""
+    with metrics.span('render.' + chart, rows=len(close)) as timer:
+        plot = _Plotter(np.asarray(dates), max_points, method)
+        fig = CHART_FUNCTIONS[chart](plot, symbol, np.asarray(close, dtype=np.float64), **params)
+        fig.tight_layout()
+        fig.savefig(path)
+        timer.add(nbytes=os.path.getsize(path))
+    return path
+
+
+def _render_shard(path, jobs, out_dir, column, fmt, max_points, method):
+    universe = Universe(path)
+    written = []
+    for symbol, chart in jobs:
+        out = os.path.join(out_dir, '%s_%s.%s' % (symbol, chart, fmt))
+        written.append(render_chart(out, chart, symbol, universe.dates(symbol),
+                                    universe.series(symbol, column), max_points, method))
+    return written
+
+
+def _render_shard_args(args):
+    return _render_shard(*args), metrics.collect()
+
+
+def render_universe(universe, out_dir, charts=CHARTS, symbols=None, column='Close', fmt='png',
+                    max_points=MAX_POINTS, method='lttb', processes=None):
+    """Write every chart for every symbol to '<out_dir>/<symbol>_<chart>.<fmt>'."""
+    if not isinstance(universe, Universe):
+        universe = Universe(universe)
+    for chart in charts:
+        if chart not in CHART_FUNCTIONS:
+            raise ValueError('unknown chart %r' % (chart,))
+    os.makedirs(out_dir, exist_ok=True)
+    symbols = universe.symbols if symbols is None else symbols
+    jobs = [(symbol, chart) for symbol in symbols if universe.span(symbol)[1] > universe.span(symbol)[0]
+            for chart in charts]
+    processes = processes or os.cpu_count() or 1
+    shards = [jobs[i::processes * 4] for i in range(min(len(jobs), processes * 4))]
+    args = [(universe.path, shard, out_dir, column, fmt, max_points, method) for shard in shards]
+    if processes == 1 or len(args) < 2:
+        return [out for arg in args for out in _render_shard(*arg)]
+    written = []
+    with Pool(processes, metrics.worker_init, (metrics.enabled(),)) as pool:
+        for paths, totals in pool.imap_unordered(_render_shard_args, args):
+            written.extend(paths)
+            metrics.merge(totals)
+    return written
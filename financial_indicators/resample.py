@@ -0,0 +1,289 @@
+# OHLCV bars at several timeframes from one base series
+#
+# Bars are a dict of arrays: 'time' (datetime64, the start of the bar, sorted)
+# and 'open', 'high', 'low', 'close', 'volume'. Only 'time' and 'close' are
+# required; open, high and low default to the close and volume to 0. A missing
+# minute is simply a missing row; prices must not be NaN.
+#
+# A timeframe is a number and a unit, '1m', '5m', '1h', '4h', '1d' or '1mo'
+# (calendar months). Bar k of a fixed timeframe covers
+# [origin + k * width, origin + (k + 1) * width), so with origin=0 the buckets
+# start at round times in the timestamps' own time zone; origin shifts them,
+# e.g. to 09:30 for daily bars of a session.
+#
+# resample() computes the bucket of every bar, finds where the buckets change
+# and reduces each column in one reduceat call per column, as the seasonality
+# does for its months:
+#
+#   open = first open, high = max, low = min, close = last close, volume = sum
+#
+# resample_all() builds several timeframes in one go, each from the finest
+# timeframe it is made of (1h from 5m, not from the 1m bars), so only the
+# first one reads the whole base series.
+#
+# Resampler does the same as bars stream in, chunk by chunk: it keeps the bar
+# still being built and returns the bars that are complete, which is when a
+# bar of a later bucket arrives or when the last input bar that fits in the
+# bucket has arrived (the 09:04 bar completes the 09:00 5m bar). flush() ends
+# the bar in progress, e.g. at the close of a session. MultiTimeframe chains
+# resamplers, each timeframe fed by the bars completed in the finer one, and
+# feeds the completed bars of every timeframe to the chunked indicators of
+# that timeframe (see chunked.py), so nothing of a lower timeframe is
+# recomputed. The bars and the indicators are the same as those of the batch
+# functions on the whole series (volumes are summed in a different order when
+# a bar spans two chunks, which only shows in the last bits of fractional
+# volumes).
+
+import re
+
+import numpy as np
+
+from .chunked import DEFAULT_INDICATORS, ChunkedIndicators
+from .graph import Plan
+from .metrics import timed
+from .streaming import _Streaming
+
+FIELDS = ('time', 'open', 'high', 'low', 'close', 'volume')
+UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'mo': None} # seconds, None for calendar months
+TIMEFRAMES = ('1m', '5m', '1h', '1d')
+_NS = 10 ** 9
+
+
+def parse_timeframe(timeframe):
+    """(count, unit) of a timeframe such as '5m', '1h', '1d' or '1mo'."""
+    match = re.fullmatch(r'(\d+)(mo|m|h|d)', str(timeframe))
+    if not match or int(match.group(1)) < 1:
+        raise ValueError("timeframe must be a count and one of m, h, d, mo, e.g. '5m', got %r"
+                         % (timeframe,))
+    return int(match.group(1)), match.group(2)
+
+
+def _width(timeframe):
+    # width in ns of a fixed timeframe, None for months
+    count, unit = parse_timeframe(timeframe)
+    return None if UNITS[unit] is None else count * UNITS[unit] * _NS
+
+
+def _divides(fine, coarse):
+    # every bucket of `coarse` is made of whole buckets of `fine` (same origin)
+    fine_width, coarse_width = _width(fine), _width(coarse)
+    if fine_width is None:
+        return coarse_width is None and parse_timeframe(coarse)[0] % parse_timeframe(fine)[0] == 0
+    if coarse_width is None:
+        return 86400 * _NS % fine_width == 0
+    return coarse_width % fine_width == 0
+
+
+def bucket_keys(times, timeframe, origin=0):
+    """Bucket number of every time, consecutive buckets have consecutive numbers."""
+    ns = np.asarray(times, dtype='datetime64[ns]').view(np.int64) - int(origin)
+    width = _width(timeframe)
+    if width is not None:
+        return ns // width
+    count = parse_timeframe(timeframe)[0]
+    return ns.astype('datetime64[ns]').astype('datetime64[M]').astype(np.int64) // count
+
+
+def bucket_times(keys, timeframe, origin=0):
+    """Start time of buckets given by number, as datetime64[ns]."""
+    keys = np.asarray(keys, dtype=np.int64)
+    width = _width(timeframe)
+    if width is not None:
+        ns = keys * width
+    else:
+        months = (keys * parse_timeframe(timeframe)[0]).astype('datetime64[M]')
+        ns = months.astype('datetime64[ns]').view(np.int64)
+    return (ns + int(origin)).view('datetime64[ns]')
+
+
+def bucket_end(key, timeframe, origin=0):
+    """End (exclusive) of bucket `key` in ns since the epoch."""
+    return int(bucket_times([key + 1], timeframe, origin).view(np.int64)[0])
+
+
+def _columns(bars):
+    # the six columns of `bars` as arrays, with the defaults filled in
+    close = np.asarray(bars['close'], dtype=np.float64)
+    columns = {'time': np.asarray(bars['time'], dtype='datetime64[ns]'), 'close': close}
+    for field in ('open', 'high', 'low'):
+        columns[field] = np.asarray(bars[field], dtype=np.float64) if field in bars else close
+    columns['volume'] = (np.asarray(bars['volume'], dtype=np.float64) if 'volume' in bars
+                         else np.zeros(len(close)))
+    if len(columns['time']) != len(close):
+        raise ValueError('time has %d rows, close has %d' % (len(columns['time']), len(close)))
+    return columns
+
+
+def _empty():
+    return {field: np.empty(0, dtype='datetime64[ns]' if field == 'time' else np.float64)
+            for field in FIELDS}
+
+
+def _reduce(columns, keys):
+    # bucket numbers and OHLCV of every bucket of sorted `keys`
+    if len(keys) == 0:
+        return keys, _empty()
+    if np.any(keys[1:] < keys[:-1]):
+        raise ValueError('bar times must be sorted')
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    return keys[starts], {
+        'time': None,
+        'open': columns['open'][starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'close': columns['close'][ends],
+        'volume': np.add.reduceat(columns['volume'], starts),
+    }
+
+
+@timed('kernel.resample')
+def resample(bars, timeframe, origin=0):
+    """Bars of `timeframe` from finer bars, labelled with the start of their bucket."""
+    columns = _columns(bars)
+    keys, out = _reduce(columns, bucket_keys(columns['time'], timeframe, origin))
+    out['time'] = bucket_times(keys, timeframe, origin)
+    return out
+
+
+def _parents(timeframes):
+    # finest earlier timeframe every timeframe can be built from, None for the base
+    order = sorted(timeframes, key=_sort_key)
+    parents = {}
+    for i, timeframe in enumerate(order):
+        parents[timeframe] = next((fine for fine in reversed(order[:i]) if _divides(fine, timeframe)),
+                                  None)
+    return order, parents
+
+
+def _sort_key(timeframe):
+    count, unit = parse_timeframe(timeframe)
+    return count * (UNITS[unit] or 31 * 86400)
+
+
+def resample_all(bars, timeframes=TIMEFRAMES, origin=0):
+    """{timeframe: bars} for every timeframe, each built from the finest one it contains."""
+    order, parents = _parents(timeframes)
+    out = {}
+    for timeframe in order:
+        parent = parents[timeframe]
+        out[timeframe] = resample(bars if parent is None else out[parent], timeframe, origin)
+    return {timeframe: out[timeframe] for timeframe in timeframes}
+
+
+def multi_timeframe(bars, timeframes=TIMEFRAMES, indicators=DEFAULT_INDICATORS, origin=0):
+    """{timeframe: (bars, {output: values})}, the indicators of the close of every timeframe."""
+    plan = Plan(indicators)
+    return {timeframe: (frame, plan.run(frame['close']))
+            for timeframe, frame in resample_all(bars, timeframes, origin).items()}
+
+
+class Resampler(_Streaming):
+    """resample() over bars given chunk by chunk.
+
+    `base` is the timeframe of the input bars; the last input bar of a
+    bucket completes it. update(bars) returns the completed bars.
+    """
+
+    __slots__ = ('timeframe', 'base', 'origin', 'key', 'bar')
+
+    def __init__(self, timeframe, base='1m', origin=0):
+        if not _divides(base, timeframe):
+            raise ValueError('%s bars cannot be built from %s bars' % (timeframe, base))
+        self.timeframe = timeframe
+        self.base = base
+        self.origin = int(origin)
+        self.key = None # bucket of the bar in progress
+        self.bar = None # its [open, high, low, close, volume]
+
+    def update(self, bars):
+        columns = _columns(bars)
+        keys = bucket_keys(columns['time'], self.timeframe, self.origin)
+        if self.key is not None:
+            # the bar in progress goes in front as one more input bar
+            keys = np.r_[self.key, keys]
+            for field, value in zip(FIELDS[1:], self.bar):
+                columns[field] = np.r_[value, columns[field]]
+        keys, out = _reduce(columns, keys)
+        if len(keys) == 0:
+            out['time'] = bucket_times(keys, self.timeframe, self.origin)
+            return out
+        last = len(keys) - 1
+        times = columns['time']
+        # end of the last input bar, a month long for month bars
+        if len(times) and (bucket_end(bucket_keys(times[-1:], self.base, self.origin)[0], self.base,
+                                      self.origin)
+                           >= bucket_end(keys[last], self.timeframe, self.origin)):
+            last += 1 # the last input bar of the bucket is in, it is complete
+        if last < len(keys):
+            self.key = int(keys[last])
+            self.bar = [float(out[field][last]) for field in FIELDS[1:]]
+        else:
+            self.key = self.bar = None
+        out = {field: values[:last] for field, values in out.items() if field != 'time'}
+        out['time'] = bucket_times(keys[:last], self.timeframe, self.origin)
+        return out
+
+    def flush(self):
+        """End the bar in progress, returns it as bars (empty if there is none)."""
+        out = _empty()
+        if self.key is not None:
+            out = {field: np.array([value]) for field, value in zip(FIELDS[1:], self.bar)}
+            out['time'] = bucket_times([self.key], self.timeframe, self.origin)
+            self.key = self.bar = None
+        return out
+
+
+class MultiTimeframe:
+    """Completed bars and their indicators at every timeframe, from streamed base bars.
+
+    update(bars) takes a chunk of `base` bars and returns {timeframe: (bars,
+    {output: values})} with the bars completed by the chunk; flush() ends
+    the bars in progress the same way.
+    """
+
+    __slots__ = ('timeframes', 'parents', 'resamplers', 'indicators')
+
+    def __init__(self, timeframes=TIMEFRAMES, base='1m', indicators=DEFAULT_INDICATORS, origin=0):
+        self.timeframes, self.parents = _parents(timeframes)
+        if any(_sort_key(timeframe) < _sort_key(base) for timeframe in timeframes):
+            raise ValueError('timeframes cannot be finer than the %s base bars' % (base,))
+        self.resamplers = {timeframe: Resampler(timeframe, self.parents[timeframe] or base, origin)
+                           for timeframe in self.timeframes}
+        self.indicators = {timeframe: ChunkedIndicators(indicators) for timeframe in self.timeframes}
+
+    def _run(self, step):
+        completed = {}
+        for timeframe in self.timeframes:
+            bars = step(timeframe, completed.get(self.parents[timeframe]))
+            completed[timeframe] = (bars, self.indicators[timeframe].update(bars['close']))
+        return completed
+
+    def update(self, bars):
+        def step(timeframe, parent):
+            return self.resamplers[timeframe].update(bars if parent is None else parent[0])
+        return self._run(step)
+
+    def flush(self):
+        def step(timeframe, parent):
+            resampler = self.resamplers[timeframe]
+            done = resampler.update(parent[0]) if parent is not None else _empty()
+            tail = resampler.flush()
+            return {field: np.concatenate((done[field], tail[field])) for field in FIELDS}
+        return self._run(step)
+
+    def get_state(self):
+        """Checkpoint of the resamplers and indicators as plain Python values."""
+        return {'timeframes': self.timeframes, 'parents': self.parents,
+                'resamplers': {tf: r.get_state() for tf, r in self.resamplers.items()},
+                'indicators': {tf: i.get_state() for tf, i in self.indicators.items()}}
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild from a get_state() checkpoint."""
+        self = cls.__new__(cls)
+        self.timeframes = list(state['timeframes'])
+        self.parents = dict(state['parents'])
+        self.resamplers = {tf: Resampler.from_state(s) for tf, s in state['resamplers'].items()}
+        self.indicators = {tf: ChunkedIndicators.from_state(s) for tf, s in state['indicators'].items()}
+        return self
@@ -0,0 +1,185 @@
+# Rolling mean / population standard deviation
+#
+# Both the Standard Deviation and the Bollinger Band scripts need the same two
+# numbers for every bar: the simple moving average of the last n prices and the
+# population standard deviation around it
+#
+# d = ((P1-MA)^2 + (P2-MA)^2 + ... (Pn-MA)^2)/n
+# stddev = sqrt(d)
+#
+# While fewer than n prices have been seen the window is simply shorter, so the
+# first bar has MA = P1 and stddev = 0.
+
+import math
+
+import numpy as np
+
+from .backends import select
+from .metrics import timed
+from .precision import float32_blocks
+
+
+class RollingMoments:
+    """Streaming rolling mean and population stddev, amortized O(1) per price.
+
+    The last `window` prices live in a fixed size ring buffer and the window
+    sums are running sums taken relative to the first price of the current
+    block of `window` bars, exactly as rolling_moments does it, so feeding
+    prices one at a time gives the same numbers as the batch call. The sums
+    are re-based once per block, which is O(window) every `window` bars.
+    NaN prices are counted apart from the sums, and the mean and stddev are
+    NaN while one is in the window.
+    """
+
+    __slots__ = ('window', '_buffer', '_head', '_count', '_pos', '_shift',
+                 '_base_sum', '_base_sq', '_base_nan', '_sum', '_sq', '_nans', '_mean', '_variance')
+
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError('window must be at least 1, got %r' % (window,))
+        self.window = int(window)
+        self._buffer = [0.0] * self.window # ring buffer of the last 'window' prices
+        self._head = 0 # slot that the next price is written to
+        self._count = 0 # number of prices currently in the window
+        self._pos = 0 # position of the next price inside its block
+        self._shift = 0.0 # first price of the current block
+        self._base_sum = [0.0] * self.window # running sums at the start of each window
+        self._base_sq = [0.0] * self.window
+        self._base_nan = [0] * self.window
+        self._sum = 0.0 # running sums up to the latest price
+        self._sq = 0.0
+        self._nans = 0 # running count of NaN prices
+        self._mean = 0.0
+        self._variance = 0.0
+
+    def _rebase(self, price):
+        # a new block starts: redo the running sums of the previous
+        # window - 1 prices relative to the new first price
+        self._shift = price = 0.0 if price != price else price # relative to 0 after a NaN
+        total = 0.0
+        total_sq = 0.0
+        nans = 0
+        missing = self.window - 1 - self._count if self._count < self.window else 0
+        older = self.values()[-(self.window - 1):] if self.window > 1 else []
+        self._base_sum[0] = 0.0
+        self._base_sq[0] = 0.0
+        self._base_nan[0] = 0
+        for i in range(self.window - 1):
+            if i >= missing:
+                value = older[i - missing]
+                if value != value:
+                    nans += 1
+                else:
+                    d = value - price
+                    total += d
+                    total_sq += d * d
+            self._base_sum[i + 1] = total
+            self._base_sq[i + 1] = total_sq
+            self._base_nan[i + 1] = nans
+        self._sum = total
+        self._sq = total_sq
+        self._nans = nans
+
+    def update(self, price):
+        """Add one price and return the new (mean, stddev)."""
+        price = float(price)
+        if self._pos == 0:
+            self._rebase(price)
+        if price != price:
+            self._nans += 1
+        else:
+            d = price - self._shift
+            self._sum += d
+            self._sq += d * d
+        if self._count < self.window: # warm-up, the window is still growing
+            self._count += 1
+        self._buffer[self._head] = price
+        self._head = (self._head + 1) % self.window
+
+        if self._nans > self._base_nan[self._pos]: # a NaN in the window
+            self._mean = self._variance = math.nan
+        else:
+            mean = (self._sum - self._base_sum[self._pos]) / self._count
+            variance = (self._sq - self._base_sq[self._pos]) / self._count - mean * mean
+            self._variance = 0.0 if variance < 0.0 else variance
+            self._mean = mean + self._shift
+        self._pos = (self._pos + 1) % self.window
+        return self._mean, self.stdev
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def variance(self):
+        return self._variance
+
+    @property
+    def stdev(self):
+        return math.sqrt(self._variance)
+
+    def get_state(self):
+        """Checkpoint of the calculator as a dict of plain Python values."""
+        state = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            state[name] = list(value) if isinstance(value, list) else value
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a calculator from a get_state() checkpoint."""
+        self = cls.__new__(cls)
+        for name in cls.__slots__:
+            value = state[name]
+            setattr(self, name, list(value) if isinstance(value, list) else value)
+        return self
+
+    def values(self):
+        """Prices currently in the window, oldest first."""
+        if self._count < self.window:
+            return self._buffer[:self._count]
+        return self._buffer[self._head:] + self._buffer[:self._head]
+
+
+@float32_blocks()
+def rolling_mean(values, window):
+    """Rolling mean of a 1-D series or tickers x time array.
+
+    The same numbers as the mean returned by rolling_moments, without the
+    cost of the sums of squares.
+    """
+    if window < 1:
+        raise ValueError('window must be at least 1, got %r' % (window,))
+    x = np.asarray(values, dtype=np.float64)
+    series = x.reshape(int(np.prod(x.shape[:-1])), x.shape[-1])
+    return select('rolling_mean', series.size).rolling_mean(series, window).reshape(x.shape)
+
+
+@timed('kernel.rolling_moments')
+@float32_blocks()
+def rolling_moments(prices, window):
+    """Rolling mean and population stddev of a whole price array at once.
+
+    `prices` is a 1-D series or a 2-D tickers x time array (time on the last
+    axis). Returns (mean, stddev) arrays of the same shape, with the same
+    partial-window warm-up as RollingMoments; windows with a NaN price are NaN.
+    """
+    if window < 1:
+        raise ValueError('window must be at least 1, got %r' % (window,))
+    x = np.asarray(prices, dtype=np.float64)
+    series = x.reshape(int(np.prod(x.shape[:-1])), x.shape[-1])
+    mean, stdev = select('rolling_moments', series.size).rolling_moments(series, window)
+    return mean.reshape(x.shape), stdev.reshape(x.shape)
+
+
+@timed('kernel.bollinger_bands')
+@float32_blocks()
+def bollinger_bands(prices, time_period=20, stdev_factor=2):
+    """Middle, upper and lower Bollinger Band, sma +/- stdev_factor * stddev."""
+    sma, stdev = rolling_moments(prices, time_period)
+    return sma, sma + stdev_factor * stdev, sma - stdev_factor * stdev
@@ -0,0 +1,80 @@
+# Relative Strength Index (RSI)
+#
+# RSI = 100 - (100 / (1 + RS))
+#
+# Where:
+# RS = average gain over the last n price changes / average loss over the same
+# price changes. The first price is compared with itself, so the first change
+# is 0. A missing (NaN) price counts as no change and the next price is
+# compared with the last one that was there.
+#
+# Two ways of averaging are supported:
+#
+# 'simple' - the mean of the last n gains and losses, with the averages taken
+#            over the shorter history while fewer than n changes have been seen.
+#            This is what the RSI script has always computed.
+# 'wilder' - Wilder's smoothing: the mean of the first n changes, then
+#            avg = (gain - avg) * K + avg with K = 1 / n, an EMA of the gains
+#            and losses. Before n changes the running mean is used.
+
+import numpy as np
+
+from .backends import select
+from .ema import ema_kernel
+from .metrics import timed
+from .precision import float32_blocks
+from .rolling import rolling_mean
+
+MODES = ('simple', 'wilder')
+
+
+@float32_blocks()
+def gains_losses(prices):
+    """Gain (0 if no gain) and loss (0 if no loss) at every bar."""
+    x = np.asarray(prices, dtype=np.float64)
+    series = x.reshape(int(np.prod(x.shape[:-1])), x.shape[-1])
+    gain, loss = select('gains_losses', series.size).gains_losses(series)
+    return gain.reshape(x.shape), loss.reshape(x.shape)
+
+
+@float32_blocks()
+def wilder_average(values, time_period):
+    """Wilder smoothed average of gains or losses along the last axis."""
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    # running mean of the changes seen so far, the first bar has no change
+    warm = min(n, time_period + 1)
+    seen = np.maximum(np.arange(warm), 1)
+    avg = np.empty_like(values)
+    avg[..., :warm] = np.cumsum(values[..., :warm], axis=-1) / seen
+    if n > warm:
+        seeded = values.copy()
+        seeded[..., :time_period] = np.nan
+        seeded[..., time_period] = avg[..., time_period]
+        avg[..., warm:] = ema_kernel(seeded, [1 / time_period])[0][..., warm:]
+    return avg
+
+
+@timed('kernel.rsi')
+@float32_blocks()
+def rsi(prices, time_period=20, mode='simple'):
+    """RSI of a 1-D series or a symbols x bars array, returns (avg_gain, avg_loss, rsi)."""
+    if time_period < 1:
+        raise ValueError('time_period must be at least 1, got %r' % (time_period,))
+    if mode not in MODES:
+        raise ValueError('mode must be one of %s, got %r' % (', '.join(MODES), mode))
+    gain, loss = gains_losses(prices)
+    if mode == 'simple':
+        avg_gain = rolling_mean(gain, time_period)
+        avg_loss = rolling_mean(loss, time_period)
+    else:
+        avg_gain = wilder_average(gain, time_period)
+        avg_loss = wilder_average(loss, time_period)
+    return avg_gain, avg_loss, rsi_index(avg_gain, avg_loss)
+
+
+def rsi_index(avg_gain, avg_loss):
+    """RSI = 100 - (100 / (1 + RS)) from the average gains and losses."""
+    rs = np.zeros_like(avg_gain)
+    np.divide(avg_gain, avg_loss, out=rs, where=avg_loss > 0) # to avoid division by 0, which is undefined
+    return 100 - (100 / (1 + rs))
@@ -0,0 +1,200 @@
+# Universe scan: every requested indicator for every symbol, across processes
+#
+# Prices are read from a memory-mapped Universe (see universe.py). Worker
+# processes open the same files, so the price data is shared through the OS
+# page cache instead of being pickled, and each worker writes its results
+# straight into preallocated memory-mapped output columns at the symbol's own
+# offset. Since every symbol is computed independently and lands at a fixed
+# place, the output is byte-identical whatever the number of processes or the
+# order in which the shards finish.
+#
+# The requested indicators of a symbol are run as one Plan (see graph.py), so
+# the EMAs, rolling moments and returns that several indicators share are
+# computed once per symbol.
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from . import metrics
+from .adf import rolling_adf
+from .ema import apo, ema, macd
+from .graph import Plan
+from .momentum import momentum
+from .rolling import bollinger_bands, rolling_moments
+from .rsi import rsi
+from .seasonality import STATS, seasonality
+from .universe import Universe
+
+
+def _apo(prices, fast_span=10, slow_span=40):
+    return {'apo': apo(prices, fast_span, slow_span)[2]}
+
+
+def _ema(prices, span=20):
+    return {'ema': ema(prices, span)}
+
+
+def _macd(prices, fast_span=12, slow_span=26, signal_span=9):
+    line, signal, histogram = macd(prices, fast_span, slow_span, signal_span)
+    return {'macd': line, 'macd_signal': signal, 'macd_histogram': histogram}
+
+
+def _rsi(prices, time_period=20, mode='simple'):
+    return {'rsi': rsi(prices, time_period, mode)[2]}
+
+
+def _mom(prices, time_period=20):
+    return {'mom': momentum(prices, time_period)}
+
+
+def _stddev(prices, time_period=20):
+    return {'stddev': rolling_moments(prices, time_period)[1]}
+
+
+def _bbands(prices, time_period=20, stdev_factor=2):
+    middle, upper, lower = bollinger_bands(prices, time_period, stdev_factor)
+    return {'bb_middle': middle, 'bb_upper': upper, 'bb_lower': lower}
+
+
+def _adf(prices, window=252, maxlag=None, autolag='AIC'):
+    # test of the window ending at each bar, NaN until the first full window
+    out = {name: np.full(len(prices), np.nan) for name in ('adf_stat', 'adf_pvalue', 'adf_lags')}
+    if len(prices) >= window:
+        results = rolling_adf(prices, window, 1, maxlag, autolag)
+        for name, values in zip(out, results):
+            out[name][window - 1:] = values
+    return out
+
+
+# indicator name -> (function, names of the output columns it fills)
+INDICATORS = {
+    'APO': (_apo, ('apo',)),
+    'EMA': (_ema, ('ema',)),
+    'MACD': (_macd, ('macd', 'macd_signal', 'macd_histogram')),
+    'RSI': (_rsi, ('rsi',)),
+    'MOM': (_mom, ('mom',)),
+    'STDDEV': (_stddev, ('stddev',)),
+    'BBANDS': (_bbands, ('bb_middle', 'bb_upper', 'bb_lower')),
+    'ADF': (_adf, ('adf_stat', 'adf_pvalue', 'adf_lags')),
+}
+SEASONALITY = 'SEASONALITY'
+
+
+def monthly_seasonality(dates, prices):
+    """Mean monthly return for each calendar month, a length 12 array (Jan..Dec).
+
+    Monthly returns are the mean daily return of each (year, month) as in the
+    Seasonality notebook, averaged over the years.
+    """
+    return seasonality(prices, dates, 'month')[0][:, STATS.index('mean')]
+
+
+def _normalize(indicators):
+    # list of names, or dict of name -> parameters
+    if isinstance(indicators, dict):
+        items = indicators.items()
+    else:
+        items = ((name, {}) for name in indicators)
+    spec = {}
+    for name, params in items:
+        name = name.upper()
+        if name not in INDICATORS and name != SEASONALITY:
+            raise ValueError('unknown indicator %r' % (name,))
+        spec[name] = dict(params or {})
+    return spec
+
+
+def _scan_shard(path, positions, spec, column):
+    if not positions:
+        return 0
+    universe = Universe(path)
+    prices = universe.column(column)
+    outputs = {}
+    for name in spec:
+        if name == SEASONALITY:
+            outputs[SEASONALITY] = universe.table(SEASONALITY, mode='r+')
+        else:
+            for output in INDICATORS[name][1]:
+                outputs[output] = universe.output(output, mode='r+')
+    dates = universe.column('dates')
+    plan = Plan(spec, INDICATORS)
+    for i in positions:
+        start = int(universe.offsets[i])
+        stop = start + int(universe.lengths[i])
+        if stop == start:
+            continue
+        for output, values in plan.run(prices[start:stop], dates[start:stop]).items():
+            if output == 'seasonality':
+                outputs[SEASONALITY][i] = values
+            else:
+                outputs[output][start:stop] = values
+    for out in outputs.values():
+        if isinstance(out, np.memmap):
+            out.flush()
+    return len(positions)
+
+
+def _scan_shard_args(args):
+    return _scan_shard(*args), metrics.collect() # the worker's metrics go to the parent
+
+
+class ScanResult:
+    """Columnar scan output: per-bar indicator columns laid out like the universe."""
+
+    def __init__(self, universe, columns, seasonality=None):
+        self.universe = universe
+        self.columns = columns # output name -> memory-mapped column
+        self.seasonality = seasonality # symbols x 12 mean monthly returns, if requested
+
+    def series(self, symbol, name):
+        start, stop = self.universe.span(symbol)
+        return self.columns[name][start:stop]
+
+    def latest(self, name):
+        """Last value of output `name` for every symbol, NaN for empty symbols."""
+        ends = self.universe.offsets + self.universe.lengths - 1
+        values = np.full(len(self.universe), np.nan)
+        has_bars = self.universe.lengths > 0
+        values[has_bars] = self.columns[name][ends[has_bars]]
+        return values
+
+
+def scan(universe, indicators=('APO', 'EMA', 'MACD', 'RSI', 'MOM', 'STDDEV', 'BBANDS'),
+         symbols=None, column='Close', processes=None):
+    """Compute `indicators` for `symbols` (default all) of a Universe or universe path.
+
+    The output columns are created afresh, the other symbols' rows are NaN.
+
+    `indicators` is a list of names from INDICATORS (plus 'SEASONALITY') or a
+    dict of name -> keyword parameters, e.g. {'EMA': {'span': 50}}.
+    processes=1 runs everything in this process.
+    """
+    if not isinstance(universe, Universe):
+        universe = Universe(universe)
+    spec = _normalize(indicators)
+    positions = (list(range(len(universe))) if symbols is None
+                 else universe.positions(symbols))
+    processes = processes or os.cpu_count() or 1
+
+    columns = {}
+    for name in spec:
+        if name != SEASONALITY:
+            for output in INDICATORS[name][1]:
+                columns[output] = universe.create_output(output)
+    if SEASONALITY in spec:
+        universe.create_table(SEASONALITY, 12)
+
+    if processes == 1 or len(positions) < 2:
+        _scan_shard(universe.path, positions, spec, column)
+    else:
+        jobs = [(universe.path, shard, spec, column)
+                for shard in universe.shards(positions, processes * 4)]
+        with Pool(processes, metrics.worker_init, (metrics.enabled(),)) as pool:
+            for _, totals in pool.imap_unordered(_scan_shard_args, jobs):
+                metrics.merge(totals)
+
+    columns = {name: universe.output(name) for name in columns}
+    seasonality = universe.table(SEASONALITY) if SEASONALITY in spec else None
+    return ScanResult(universe, columns, seasonality)
@@ -0,0 +1,113 @@
+# Seasonality of returns
+#
+# The Seasonality notebook takes the daily pct_change of one symbol, averages it
+# per (year, month) and draws a boxplot of those monthly returns by month. Here
+# the same is done for a whole symbols x days price matrix at once:
+#
+# 1. daily returns, pct_change = (current - previous) / previous
+# 2. one value per symbol and bucket, where a bucket is a (year, month), an
+#    (ISO year, ISO week) or a single day for day-of-week statistics. The value
+#    is the mean daily return in the bucket as in the notebook, or with
+#    compound=True the compounded return prod(1 + r) - 1
+# 3. statistics of those values over the years for every month of the year,
+#    ISO week or weekday: mean, median, quartiles, min, max and count, which is
+#    everything a boxplot needs.
+#
+# Dates are one calendar shared by every symbol, in ascending order. Missing
+# prices are NaN and simply do not count.
+
+import warnings
+
+import numpy as np
+
+from .metrics import timed
+
+PERIODS = ('month', 'week', 'weekday')
+STATS = ('mean', 'median', 'q1', 'q3', 'min', 'max', 'count')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def daily_returns(prices):
+    """pct_change along the last axis, NaN on the first day."""
+    x = np.asarray(prices, dtype=np.float64)
+    returns = np.full(x.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[..., 1:] = x[..., 1:] / x[..., :-1] - 1
+    return returns
+
+
+def _calendar(dates, period):
+    # bucket key and period label (1-12, 1-53 or 0-6) of every day
+    days = np.asarray(dates).astype('datetime64[D]')
+    weekday = (days.astype(np.int64) + 3) % 7 # 1970-01-01 was a Thursday, Monday is 0
+    if period == 'month':
+        months = days.astype('datetime64[M]').astype(np.int64)
+        return months, months % 12 + 1
+    if period == 'week':
+        thursday = days - weekday + 3 # ISO weeks belong to the year of their Thursday
+        jan1 = thursday.astype('datetime64[Y]').astype('datetime64[D]')
+        week = (thursday - jan1).astype(np.int64) // 7 + 1
+        year = thursday.astype('datetime64[Y]').astype(np.int64)
+        return year * 53 + week, week
+    if period == 'weekday':
+        return days.astype(np.int64), weekday
+    raise ValueError('period must be one of %s, got %r' % (', '.join(PERIODS), period))
+
+
+def period_returns(prices, dates, period='month', compound=False, returns=None):
+    """Return of every symbol in every bucket of `period`.
+
+    Returns (values, labels): values has shape prices.shape[:-1] + (buckets,)
+    and labels gives the month (1-12), ISO week (1-53) or weekday (0-6) of
+    each bucket. Buckets without any return are NaN. `returns` takes the
+    daily_returns(prices) if they are already computed.
+    """
+    returns = daily_returns(prices) if returns is None else returns
+    keys, labels = _calendar(dates, period)
+    if len(keys) == 0:
+        return returns[..., :0], labels
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    valid = ~np.isnan(returns)
+    count = np.add.reduceat(valid, starts, axis=-1)
+    if compound:
+        total = np.add.reduceat(np.log1p(np.where(valid, returns, 0.0)), starts, axis=-1)
+        values = np.expm1(total)
+    else:
+        total = np.add.reduceat(np.where(valid, returns, 0.0), starts, axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = total / count
+    values[count == 0] = np.nan
+    return values, labels[starts]
+
+
+@timed('kernel.seasonality')
+def seasonality(prices, dates, period='month', compound=False, returns=None):
+    """Statistics of the returns for each month, ISO week or weekday.
+
+    `prices` is a 1-D series or a symbols x days array over `dates`. Returns
+    (stats, periods): stats has shape prices.shape[:-1] + (len(periods),
+    len(STATS)) with the statistics in STATS order, periods lists the months
+    1-12, weeks 1-53 or weekdays 0-6 (Monday first). `returns` is passed on
+    to period_returns.
+    """
+    values, labels = period_returns(prices, dates, period, compound, returns)
+    periods = {'month': np.arange(1, 13), 'week': np.arange(1, 54),
+               'weekday': np.arange(7)}[period]
+    stats = np.full(values.shape[:-1] + (len(periods), len(STATS)), np.nan)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], periods)
+    bounds = np.r_[bounds, len(order)]
+    ordered = values[..., order]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # periods with no data stay NaN
+        for i in range(len(periods)):
+            group = ordered[..., bounds[i]:bounds[i + 1]]
+            if group.shape[-1] == 0:
+                stats[..., i, STATS.index('count')] = 0
+                continue
+            q1, median, q3 = np.nanpercentile(group, [25, 50, 75], axis=-1)
+            stats[..., i, :] = np.stack([np.nanmean(group, axis=-1), median, q1, q3,
+                                         np.nanmin(group, axis=-1), np.nanmax(group, axis=-1),
+                                         np.sum(~np.isnan(group), axis=-1)], axis=-1)
+    return stats, periods
@@ -0,0 +1,218 @@
+# Trading signals of the indicators as events, for every symbol and every bar
+#
+# The notebooks read the rules off the charts; here they are evaluated as data:
+#
+#   macd_bullish / macd_bearish  MACD line crosses above / below its signal line
+#   bb_upper / bb_lower          price crosses above the upper / below the lower band
+#   rsi_overbought / rsi_oversold  RSI crosses above 70 / below 30
+#   mom_positive / mom_negative  momentum turns positive / negative
+#
+# A cross is a change of sign of the difference of the two series between two
+# consecutive bars (from <= 0 to > 0 for a cross above), one vectorized
+# comparison over the whole series; a NaN on either bar (warm-up) is no cross.
+#
+# extract_signals() runs the scan of MACD, BBANDS, RSI and MOM over a Universe
+# (see scan.py), then evaluates every event over the flat output columns in
+# blocks of rows, with the first bar of every symbol cleared so that no cross
+# is read across two symbols. Each event is stored as a bit per bar under
+# out/<event>.bits, bars packed 8 to a byte in universe row order (1/64 of a
+# float64 column), with signals.json recording the events and thresholds.
+#
+# Signals answers the queries. recent('macd_bullish', 5) gathers the bits of
+# the last 5 bars of every symbol, a few bytes per symbol, so it takes well
+# under a millisecond for thousands of symbols; rows() gives the sparse list
+# of every occurrence.
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from . import metrics
+from .scan import scan
+from .universe import OUTPUT_DIR, Universe
+
+EVENTS = ('macd_bullish', 'macd_bearish', 'bb_upper', 'bb_lower',
+          'rsi_overbought', 'rsi_oversold', 'mom_positive', 'mom_negative')
+INDICATORS = ('MACD', 'BBANDS', 'RSI', 'MOM') # scanned for the events
+OUTPUTS = ('macd', 'macd_signal', 'bb_upper', 'bb_lower', 'rsi', 'mom') # read by detect()
+SIGNALS_FILE = 'signals.json'
+BLOCK_ROWS = 1 << 20 # rows evaluated at a time, a multiple of 8
+
+
+def crosses_above(a, b):
+    """True at the bars where `a` goes from <= b to > b, along the last axis."""
+    d = np.subtract(a, b)
+    out = np.zeros(d.shape, dtype=bool)
+    out[..., 1:] = (d[..., :-1] <= 0) & (d[..., 1:] > 0)
+    return out
+
+
+def crosses_below(a, b):
+    """True at the bars where `a` goes from >= b to < b, along the last axis."""
+    d = np.subtract(a, b)
+    out = np.zeros(d.shape, dtype=bool)
+    out[..., 1:] = (d[..., :-1] >= 0) & (d[..., 1:] < 0)
+    return out
+
+
+def detect(prices, outputs, overbought=70, oversold=30):
+    """{event: bool array} for a 1-D series or a symbols x bars array.
+
+    `outputs` holds the OUTPUTS columns of the indicators of `prices`, as
+    returned by scan.INDICATORS or a Plan.
+    """
+    macd, signal, rsi, mom = outputs['macd'], outputs['macd_signal'], outputs['rsi'], outputs['mom']
+    return {
+        'macd_bullish': crosses_above(macd, signal),
+        'macd_bearish': crosses_below(macd, signal),
+        'bb_upper': crosses_above(prices, outputs['bb_upper']),
+        'bb_lower': crosses_below(prices, outputs['bb_lower']),
+        'rsi_overbought': crosses_above(rsi, overbought),
+        'rsi_oversold': crosses_below(rsi, oversold),
+        'mom_positive': crosses_above(mom, 0),
+        'mom_negative': crosses_below(mom, 0),
+    }
+
+
+def _bits_path(universe, event):
+    return os.path.join(universe.path, OUTPUT_DIR, event + '.bits')
+
+
+def extract_signals(universe, indicators=None, column='Close', overbought=70, oversold=30,
+                    processes=None, rescan=True):
+    """Evaluate EVENTS for every symbol of a Universe or universe path, returns Signals.
+
+    `indicators` gives parameters of the scanned indicators, e.g.
+    {'RSI': {'time_period': 14}}. rescan=False reuses the outputs of an
+    earlier scan.
+    """
+    if not isinstance(universe, Universe):
+        universe = Universe(universe)
+    params = {name: dict((indicators or {}).get(name, {})) for name in INDICATORS}
+    if rescan:
+        scan(universe, params, column=column, processes=processes)
+    prices = universe.column(column)
+    columns = {output: universe.output(output) for output in OUTPUTS}
+    rows = universe.rows
+    # first bar of every symbol, where a cross would compare two symbols
+    starts = universe.offsets[universe.lengths > 0]
+
+    os.makedirs(os.path.join(universe.path, OUTPUT_DIR), exist_ok=True)
+    files = {event: open(_bits_path(universe, event), 'wb') for event in EVENTS}
+    try:
+        with metrics.span('signals.extract', rows=rows):
+            for begin in range(0, rows, BLOCK_ROWS):
+                end = min(begin + BLOCK_ROWS, rows)
+                lead = 1 if begin else 0 # the bar before the block, for crosses at its first bar
+                block = {output: values[begin - lead:end] for output, values in columns.items()}
+                flags = detect(prices[begin - lead:end], block, overbought, oversold)
+                first = starts[(starts >= begin) & (starts < end)] - begin
+                for event, values in flags.items():
+                    values = values[lead:]
+                    values[first] = False
+                    files[event].write(np.packbits(values, bitorder='little').tobytes())
+    finally:
+        for f in files.values():
+            f.close()
+    with open(os.path.join(universe.path, OUTPUT_DIR, SIGNALS_FILE), 'w') as f:
+        json.dump({'events': list(EVENTS), 'column': column, 'rows': rows, 'indicators': params,
+                   'overbought': overbought, 'oversold': oversold}, f)
+    return Signals(universe)
+
+
+class Signals:
+    """Stored events of a universe, see extract_signals()."""
+
+    def __init__(self, universe):
+        if not isinstance(universe, Universe):
+            universe = Universe(universe)
+        self.universe = universe
+        with open(os.path.join(universe.path, OUTPUT_DIR, SIGNALS_FILE)) as f:
+            self.info = json.load(f)
+        if self.info['rows'] != universe.rows:
+            raise ValueError('signals were extracted from %d rows, the universe has %d'
+                             % (self.info['rows'], universe.rows))
+        self.events = self.info['events']
+        self._bits = {}
+        self._rows = {}
+
+    def bits(self, event):
+        """Packed flags of `event` for every row of the universe (little bit order)."""
+        if event not in self.events:
+            raise KeyError('unknown event %r, one of %s' % (event, ', '.join(self.events)))
+        if event not in self._bits:
+            size = (self.universe.rows + 7) // 8
+            self._bits[event] = (np.memmap(_bits_path(self.universe, event), dtype=np.uint8,
+                                           mode='r', shape=(size,))
+                                 if size else np.zeros(0, dtype=np.uint8))
+        return self._bits[event]
+
+    def flags(self, event, symbol):
+        """Bool flags of `event` at every bar of `symbol`."""
+        start, stop = self.universe.span(symbol)
+        bits = self.bits(event)[start // 8:(stop + 7) // 8]
+        return np.unpackbits(bits, bitorder='little')[start % 8:start % 8 + stop - start].astype(bool)
+
+    def rows(self, event):
+        """Universe rows where `event` occurred, sorted (the sparse form)."""
+        if event not in self._rows:
+            flags = np.unpackbits(self.bits(event), count=self.universe.rows, bitorder='little')
+            self._rows[event] = np.flatnonzero(flags)
+        return self._rows[event]
+
+    def recent(self, event, bars=5):
+        """(symbols, bars ago) of every `event` in the last `bars` bars of each symbol.
+
+        bars ago is 0 for the last bar. Symbols come in universe order, the
+        most recent occurrence first.
+        """
+        lengths = self.universe.lengths
+        if not self.universe.rows: # no bars at all, nothing to gather
+            return [], np.zeros(0, dtype=np.int64)
+        ago = np.arange(bars)
+        rows = (self.universe.offsets + lengths - 1)[:, None] - ago
+        valid = ago < lengths[:, None]
+        rows = np.where(valid, rows, 0)
+        bits = self.bits(event)
+        hit = valid & (((bits[rows >> 3] >> (rows & 7)) & 1) == 1)
+        positions, ago = np.nonzero(hit)
+        return [self.universe.symbols[i] for i in positions], ago
+
+    def latest(self, event):
+        """Symbols with `event` at their last bar."""
+        return self.recent(event, 1)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extract indicator signals for a universe and list the recent ones.')
+    parser.add_argument('universe', help='universe directory')
+    parser.add_argument('--events', nargs='+', choices=EVENTS, default=list(EVENTS),
+                        help='events to list')
+    parser.add_argument('--bars', type=int, default=5, help='list events of the last BARS bars')
+    parser.add_argument('--column', default='Close', help='price column')
+    parser.add_argument('--overbought', type=float, default=70)
+    parser.add_argument('--oversold', type=float, default=30)
+    parser.add_argument('--processes', type=int, help='scan processes, default one per CPU')
+    parser.add_argument('--reuse', action='store_true',
+                        help='list the stored signals without extracting them again')
+    args = parser.parse_args(argv)
+
+    if args.reuse:
+        signals = Signals(args.universe)
+    else:
+        signals = extract_signals(args.universe, column=args.column, overbought=args.overbought,
+                                  oversold=args.oversold, processes=args.processes)
+    for event in args.events:
+        symbols, ago = signals.recent(event, args.bars)
+        print('%-15s %d' % (event, len(symbols)))
+        for symbol, n in zip(symbols, ago):
+            print('    %-10s %d bars ago' % (symbol, n))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# Local OHLCV price store
+#
+# Bars are kept on disk one directory per symbol, one .npy file per column
+# (dates, Open, High, Low, Close, Adj Close, Volume), next to a meta.json that
+# records the column names and which date ranges have already been requested
+# from the provider. A request for (symbol, start, end) only goes to the
+# provider for the parts of [start, end) that are not covered yet, so moving
+# end_date forward by a day fetches one new bar instead of the whole history.
+#
+# Bars after the last stored date are appended to the column files in place:
+# the .npy header numpy writes leaves room for a longer shape, so only the new
+# rows and the header are written. The dates are appended last, and load()
+# ignores column rows past the dates, so an interrupted append leaves the
+# store as it was. Bars that overlap or precede the stored ones rewrite the
+# columns.
+#
+# The provider is pluggable: YahooProvider downloads from Yahoo Finance and
+# CsvProvider serves bars from local CSV files, e.g. in tests. fetch.py has an
+# HTTP provider and the bulk fetcher that fills a store for many symbols at once.
+
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .precision import FLOAT64_COLUMNS
+
+DATES_FILE = 'dates.npy'
+META_FILE = 'meta.json'
+
+
+class Provider:
+    """Source of daily OHLCV bars for a PriceStore."""
+
+    def fetch(self, symbol, start, end):
+        """Bars of `symbol` with start <= date < end, as a DataFrame indexed by date."""
+        raise NotImplementedError
+
+
+class YahooProvider(Provider):
+    """Daily bars from Yahoo Finance through yfinance."""
+
+    def fetch(self, symbol, start, end):
+        import yfinance as yf
+
+        data = yf.download(symbol, start=start, end=end, auto_adjust=False, progress=False)
+        if isinstance(data.columns, pd.MultiIndex): # newer yfinance adds a Ticker level
+            data.columns = data.columns.get_level_values(0)
+        return data
+
+
+class CsvProvider(Provider):
+    """Bars from '<symbol>.csv' files in a local directory, a stand-in for Yahoo."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, symbol, start, end):
+        path = os.path.join(self.directory, symbol + '.csv')
+        data = pd.read_csv(path, index_col=0, parse_dates=True)
+        return data[(data.index >= start) & (data.index < end)]
+
+
+def _day(value):
+    day = pd.Timestamp(value)
+    if day.tz is not None:
+        day = day.tz_localize(None)
+    return day.normalize()
+
+
+def _days(index):
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.normalize().rename('Date')
+
+
+def _column_file(column):
+    return column.lower().replace(' ', '_') + '.npy'
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(covered, start, end):
+    """Parts of [start, end) that are not inside any of the `covered` ranges."""
+    missing = []
+    for cov_start, cov_end in _merge_ranges(covered):
+        if cov_end <= start:
+            continue
+        if cov_start >= end:
+            break
+        if cov_start > start:
+            missing.append((start, cov_start))
+        start = max(start, cov_end)
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+class PriceStore:
+    """Multi-symbol on-disk OHLCV cache in front of a Provider.
+
+    Price columns are stored as `dtype`, float64 or float32 for half the disk
+    space and read bandwidth (see precision.py). Volume stays float64, which
+    holds share counts exactly.
+    """
+
+    def __init__(self, root, provider=None, dtype=np.float64):
+        self.root = root
+        self.provider = provider if provider is not None else YahooProvider()
+        self.dtype = np.dtype(dtype)
+
+    def _path(self, symbol, name=''):
+        return os.path.join(self.root, symbol, name)
+
+    def _read_meta(self, symbol):
+        try:
+            with open(self._path(symbol, META_FILE)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return {'columns': [], 'coverage': []}
+        meta['coverage'] = [[pd.Timestamp(s), pd.Timestamp(e)] for s, e in meta['coverage']]
+        return meta
+
+    def _write_meta(self, symbol, meta):
+        meta = {'columns': meta['columns'],
+                'coverage': [[s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')]
+                             for s, e in meta['coverage']]}
+        _atomic_write(self._path(symbol, META_FILE), lambda f: f.write(json.dumps(meta).encode()))
+
+    def coverage(self, symbol):
+        """Date ranges [start, end) already requested from the provider."""
+        return [tuple(r) for r in self._read_meta(symbol)['coverage']]
+
+    def load(self, symbol, columns=None, mmap_mode=None):
+        """All stored bars of `symbol` as (dates, {column: array})."""
+        meta = self._read_meta(symbol)
+        if not meta['columns']:
+            return np.empty(0, dtype='datetime64[ns]'), {}
+        with metrics.span('cache.read') as timer:
+            dates = np.load(self._path(symbol, DATES_FILE), mmap_mode=mmap_mode)
+            values = {}
+            for column in columns or meta['columns']:
+                values[column] = np.load(self._path(symbol, _column_file(column)),
+                                         mmap_mode=mmap_mode)[:len(dates)] # see _append
+            timer.add(rows=len(dates), nbytes=dates.nbytes + sum(v.nbytes for v in values.values()))
+        return dates, values
+
+    def _dtype(self, column):
+        return np.dtype(np.float64) if column in FLOAT64_COLUMNS else self.dtype
+
+    def _write(self, symbol, frame, meta):
+        os.makedirs(self._path(symbol), exist_ok=True)
+        nbytes = len(frame) * (8 + sum(self._dtype(column).itemsize for column in frame.columns))
+        with metrics.span('cache.write', rows=len(frame), nbytes=nbytes):
+            _atomic_write(self._path(symbol, DATES_FILE),
+                          lambda f: np.save(f, frame.index.values.astype('datetime64[ns]')))
+            for column in frame.columns:
+                _atomic_write(self._path(symbol, _column_file(column)),
+                              lambda f: np.save(f, frame[column].to_numpy(dtype=self._dtype(column))))
+        meta['columns'] = list(frame.columns)
+
+    def _append(self, symbol, frame, meta):
+        # add bars after the stored ones at the end of the files, False if the
+        # files cannot grow in place (other dtype, header too short)
+        files = [(_column_file(column), frame[column].to_numpy(dtype=self._dtype(column)))
+                 for column in meta['columns']]
+        files.append((DATES_FILE, frame.index.values.astype('datetime64[ns]')))
+        # the rows of the dates are the committed ones, columns may have more
+        rows = len(np.load(self._path(symbol, DATES_FILE), mmap_mode='r'))
+        headers = [_grown_header(self._path(symbol, name), values, rows) for name, values in files]
+        if any(header is None for header in headers):
+            return False
+        nbytes = sum(values.nbytes for _, values in files)
+        with metrics.span('cache.append', rows=len(frame), nbytes=nbytes):
+            for (name, values), (end, header) in zip(files, headers): # the dates last
+                with open(self._path(symbol, name), 'r+b') as f:
+                    f.seek(end)
+                    f.truncate() # rows and header an interrupted append left
+                    f.write(values.tobytes())
+                    f.seek(0)
+                    f.write(header)
+        return True
+
+    def _frame(self, symbol):
+        dates, values = self.load(symbol)
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='Date'))
+
+    def merge(self, symbol, frame, start, end):
+        """Merge bars fetched for [start, end) into the store.
+
+        Bars on dates that are already stored are replaced by the new ones.
+        Dates from today on are stored but not marked as covered, since the
+        current bar may still change. Bars after the last stored date are
+        appended, anything else rewrites the symbol's columns.
+        """
+        meta = self._read_meta(symbol)
+        frame = frame.select_dtypes('number').astype(np.float64)
+        frame.index = _days(frame.index)
+        frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        if len(frame) and not (meta['columns'] and list(frame.columns) == meta['columns']
+                               and frame.index[0] > self._last_date(symbol)
+                               and self._append(symbol, frame, meta)):
+            stored = self._frame(symbol)
+            merged = pd.concat([stored, frame]) if len(stored) else frame
+            merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+            self._write(symbol, merged, meta)
+        end = min(end, _day('today'))
+        if start < end:
+            meta['coverage'] = _merge_ranges(meta['coverage'] + [[start, end]])
+        self._write_meta(symbol, meta)
+
+    def _last_date(self, symbol):
+        dates = np.load(self._path(symbol, DATES_FILE), mmap_mode='r')
+        return pd.Timestamp(dates[-1]) if len(dates) else pd.Timestamp.min
+
+    def missing(self, symbol, start, end):
+        """Parts of [start, end) that were never requested from the provider."""
+        return missing_ranges(self._read_meta(symbol)['coverage'], _day(start), _day(end))
+
+    def ensure(self, symbol, start, end):
+        """Fetch whatever part of [start, end) is missing, returns the number of fetches."""
+        gaps = self.missing(symbol, start, end)
+        for gap_start, gap_end in gaps:
+            with metrics.span('fetch') as timer:
+                frame = self.provider.fetch(symbol, gap_start.strftime('%Y-%m-%d'),
+                                            gap_end.strftime('%Y-%m-%d'))
+                timer.add(rows=len(frame))
+            self.merge(symbol, frame, gap_start, gap_end)
+        return len(gaps)
+
+    def get(self, symbol, start, end):
+        """Bars of `symbol` with start <= date < end, fetching missing dates first."""
+        start, end = _day(start), _day(end)
+        self.ensure(symbol, start, end)
+        dates, values = self.load(symbol, mmap_mode='r')
+        lo, hi = np.searchsorted(dates, [np.datetime64(start), np.datetime64(end)])
+        with metrics.span('frame', rows=hi - lo):
+            return pd.DataFrame({column: np.array(array[lo:hi]) for column, array in values.items()},
+                                index=pd.DatetimeIndex(dates[lo:hi], name='Date'))
+
+    def refresh(self, symbols, start, end):
+        """Bring every symbol up to date for [start, end), returns fetches per symbol."""
+        return {symbol: self.ensure(symbol, start, end) for symbol in symbols}
+
+
+def _grown_header(path, values, rows):
+    # (end of the first `rows` rows, .npy header for them plus `values`) of a
+    # 1-D .npy file of values.dtype, None if the file has fewer rows or the new
+    # header does not fit the old one
+    with open(path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        read = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read(f)
+        offset = f.tell()
+    if dtype != values.dtype or len(shape) != 1 or shape[0] < rows:
+        return None
+    header = io.BytesIO()
+    (np.lib.format.write_array_header_1_0 if version == (1, 0)
+     else np.lib.format.write_array_header_2_0)(
+        header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order,
+                 'shape': (rows + len(values),)})
+    if len(header.getvalue()) != offset:
+        return None
+    return offset + rows * dtype.itemsize, header.getvalue()
+
+
+def _atomic_write(path, write):
+    # write next to the target and rename, so readers never see half a file
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
@@ -0,0 +1,220 @@
+# Streaming (bar by bar) indicator calculators
+#
+# Each calculator keeps only the state its recurrence needs, so update(price)
+# costs the same on the first bar and the millionth. The arithmetic is the same
+# as in the batch functions, so feeding a series one price at a time gives
+# exactly the numbers the batch call returns for the whole series.
+#
+# Every calculator can be checkpointed with get_state(), which returns a dict
+# of plain Python values, and restored with from_state().
+
+import math
+
+from .ema import smoothing_factor
+from .rolling import RollingMoments
+from .rsi import MODES as RSI_MODES
+
+
+class _Streaming:
+    __slots__ = ()
+    _nested = {} # attribute name -> class, for calculators built from other calculators
+
+    def get_state(self):
+        """Checkpoint of the calculator as a dict of plain Python values."""
+        state = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if name in self._nested and value is not None:
+                value = value.get_state()
+            elif isinstance(value, list):
+                value = list(value)
+            state[name] = value
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a calculator from a get_state() checkpoint."""
+        self = cls.__new__(cls)
+        for name in cls.__slots__:
+            value = state[name]
+            if name in cls._nested and value is not None:
+                value = cls._nested[name].from_state(value)
+            elif isinstance(value, list):
+                value = list(value)
+            setattr(self, name, value)
+        return self
+
+
+class EMA(_Streaming):
+    """EMA = (P - EMAp) * K + EMAp, seeded with the first non-NaN price."""
+
+    __slots__ = ('num_periods', 'K', 'value')
+
+    def __init__(self, num_periods):
+        self.num_periods = num_periods
+        self.K = smoothing_factor(num_periods) # smoothing constant
+        self.value = math.nan # NaN until the first observation
+
+    def update(self, price):
+        price = float(price)
+        if math.isnan(price): # no price, EMA carries over
+            return self.value
+        if math.isnan(self.value): # first observation, EMA = current price
+            self.value = price
+        else:
+            self.value = (price - self.value) * self.K + self.value
+        return self.value
+
+
+class APO(_Streaming):
+    """Absolute Price Oscillator, Fast EMA - Slow EMA."""
+
+    __slots__ = ('fast', 'slow', 'value')
+    _nested = {'fast': EMA, 'slow': EMA}
+
+    def __init__(self, num_periods_fast=10, num_periods_slow=40):
+        self.fast = EMA(num_periods_fast)
+        self.slow = EMA(num_periods_slow)
+        self.value = math.nan
+
+    def update(self, price):
+        self.value = self.fast.update(price) - self.slow.update(price)
+        return self.value
+
+
+class MACD(_Streaming):
+    """MACD line, signal line and histogram, update() returns all three."""
+
+    __slots__ = ('line', 'signal', 'histogram')
+    _nested = {'line': APO, 'signal': EMA}
+
+    def __init__(self, fast_ema=12, slow_ema=26, signal_ema=9):
+        self.line = APO(fast_ema, slow_ema) # MACD line is the APO of the two EMAs
+        self.signal = EMA(signal_ema)
+        self.histogram = math.nan
+
+    def update(self, price):
+        macd_line = self.line.update(price)
+        signal_line = self.signal.update(macd_line)
+        self.histogram = macd_line - signal_line
+        return macd_line, signal_line, self.histogram
+
+
+class RSI(_Streaming):
+    """Relative Strength Index over the gains and losses of the price changes.
+
+    mode='simple' averages the last 'time_period' changes, mode='wilder' uses
+    Wilder's smoothing, as in rsi.rsi().
+    """
+
+    __slots__ = ('time_period', 'mode', 'last_price', 'gains', 'losses', 'bars',
+                 'sum_gain', 'sum_loss', 'avg_gain', 'avg_loss', 'value')
+    _nested = {'gains': RollingMoments, 'losses': RollingMoments}
+
+    def __init__(self, time_period=20, mode='simple'):
+        if mode not in RSI_MODES:
+            raise ValueError('mode must be one of %s, got %r' % (', '.join(RSI_MODES), mode))
+        self.time_period = time_period
+        self.mode = mode
+        self.last_price = None # the first price is compared with itself
+        self.gains = RollingMoments(time_period) if mode == 'simple' else None
+        self.losses = RollingMoments(time_period) if mode == 'simple' else None
+        self.bars = 0
+        self.sum_gain = 0.0 # running sums for the Wilder warm-up
+        self.sum_loss = 0.0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self.value = math.nan
+
+    def update(self, price):
+        price = float(price)
+        gain = loss = 0.0 # a missing price counts as no change
+        if not math.isnan(price):
+            if self.last_price is None:
+                self.last_price = price
+            gain = max(0.0, price - self.last_price)
+            loss = max(0.0, self.last_price - price)
+            self.last_price = price
+
+        if self.mode == 'simple':
+            avg_gain = self.gains.update(gain)[0]
+            avg_loss = self.losses.update(loss)[0]
+        elif self.bars <= self.time_period: # Wilder warm-up, mean of the changes so far
+            self.sum_gain += gain
+            self.sum_loss += loss
+            avg_gain = self.sum_gain / max(self.bars, 1)
+            avg_loss = self.sum_loss / max(self.bars, 1)
+        else:
+            K = 1 / self.time_period
+            avg_gain = (gain - self.avg_gain) * K + self.avg_gain
+            avg_loss = (loss - self.avg_loss) * K + self.avg_loss
+        self.avg_gain = avg_gain
+        self.avg_loss = avg_loss
+        self.bars += 1
+
+        rs = 0.0
+        if avg_loss > 0: # to avoid division by 0, which is undefined
+            rs = avg_gain / avg_loss
+        self.value = 100 - (100 / (1 + rs))
+        return self.value
+
+
+class Momentum(_Streaming):
+    """Current price - the oldest of the last 'time_period' prices."""
+
+    __slots__ = ('time_period', 'history', 'head', 'count', 'value')
+
+    def __init__(self, time_period=20):
+        if time_period < 1:
+            raise ValueError('time_period must be at least 1, got %r' % (time_period,))
+        self.time_period = time_period
+        self.history = [0.0] * time_period # ring buffer of observed prices
+        self.head = 0 # slot of the oldest price once the buffer is full
+        self.count = 0
+        self.value = math.nan
+
+    def update(self, price):
+        price = float(price)
+        self.history[self.head] = price
+        self.head = (self.head + 1) % self.time_period
+        if self.count < self.time_period:
+            self.count += 1
+        oldest = self.history[self.head] if self.count == self.time_period else self.history[0]
+        self.value = price - oldest
+        return self.value
+
+
+class StdDev(_Streaming):
+    """Population standard deviation of the last 'time_period' prices."""
+
+    __slots__ = ('moments',)
+    _nested = {'moments': RollingMoments}
+
+    def __init__(self, time_period=20):
+        self.moments = RollingMoments(time_period)
+
+    @property
+    def sma(self):
+        return self.moments.mean
+
+    @property
+    def value(self):
+        return self.moments.stdev
+
+    def update(self, price):
+        return self.moments.update(price)[1]
+
+
+class BollingerBands(_Streaming):
+    """Middle, upper and lower Bollinger Band, update() returns all three."""
+
+    __slots__ = ('stdev_factor', 'moments')
+    _nested = {'moments': RollingMoments}
+
+    def __init__(self, time_period=20, stdev_factor=2):
+        self.stdev_factor = stdev_factor
+        self.moments = RollingMoments(time_period)
+
+    def update(self, price):
+        sma, stdev = self.moments.update(price)
+        return sma, sma + self.stdev_factor * stdev, sma - self.stdev_factor * stdev
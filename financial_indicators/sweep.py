@@ -0,0 +1,128 @@
+# EMA parameter sweeps for APO and MACD
+#
+# Instead of hand tuning the fast and slow periods (the APO script declares 20
+# and 50 and then uses 10 and 40), every span of a grid is computed in the same
+# pass over the prices, and APO / MACD follow for every (fast, slow) and
+# (fast, slow, signal) combination by broadcasting. Combinations where the fast
+# span is not shorter than the slow one are computed too, so the grids stay
+# dense; they are easy to mask afterwards.
+#
+# The numbers are the same as apo() and macd() give for a single combination.
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from . import metrics
+from .ema import ema_kernel, smoothing_factor
+from .universe import Universe
+
+SPANS = tuple(range(2, 201))
+CHUNK_BYTES = 256 << 20 # working memory per symbol while writing a grid
+
+
+def ema_grid(prices, spans=SPANS):
+    """EMAs for every span, an array of shape (len(spans),) + prices.shape."""
+    return ema_kernel(prices, [smoothing_factor(span) for span in spans])
+
+
+def apo_grid(prices, fast_spans=SPANS, slow_spans=SPANS):
+    """APO (the MACD line) for every (fast, slow) pair, shape (F, S) + prices.shape."""
+    spans = sorted(set(fast_spans) | set(slow_spans))
+    position = {span: i for i, span in enumerate(spans)}
+    emas = ema_grid(prices, spans) # each distinct span once
+    fast = emas[[position[span] for span in fast_spans]]
+    slow = emas[[position[span] for span in slow_spans]]
+    return fast[:, None] - slow[None, :]
+
+
+def macd_grid(prices, fast_spans=(12,), slow_spans=(26,), signal_spans=(9,)):
+    """MACD for every (fast, slow, signal) combination.
+
+    Returns (macd_line, signal_line, macd_histogram) where macd_line has shape
+    (F, S) + prices.shape and the other two (F, S, G) + prices.shape.
+    """
+    line = apo_grid(prices, fast_spans, slow_spans)
+    signal = ema_kernel(line, [smoothing_factor(span) for span in signal_spans])
+    signal = np.moveaxis(signal, 0, 2)
+    return line, signal, line[:, :, None] - signal
+
+
+def write_macd_grid(prices, symbol_dir, fast_spans, slow_spans, signal_spans, tail=None,
+                    chunk_bytes=CHUNK_BYTES):
+    """macd_grid() of one series written straight to .npy files in `symbol_dir`.
+
+    The slow EMAs are computed once, the fast EMAs and everything that follows
+    from them a chunk of fast spans at a time into memory-mapped outputs, so
+    memory stays around `chunk_bytes` (or one fast span, if that is larger)
+    however large the grid is.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    n = prices.shape[-1]
+    kept = min(tail, n) if tail else n
+    F, S, G = len(fast_spans), len(slow_spans), len(signal_spans)
+    os.makedirs(symbol_dir, exist_ok=True)
+    outputs = {}
+    for name, shape in (('apo', (F, S, kept)), ('macd_signal', (F, S, G, kept)),
+                        ('macd_histogram', (F, S, G, kept))):
+        outputs[name] = np.lib.format.open_memmap(os.path.join(symbol_dir, name + '.npy'),
+                                                  mode='w+', dtype=np.float64, shape=shape)
+
+    slow = ema_grid(prices, slow_spans) # kept for every chunk
+    alphas = [smoothing_factor(span) for span in signal_spans]
+    # per fast span: its EMA, the line, the signal and the histogram
+    step = max(1, (chunk_bytes - slow.nbytes) // max(1, (1 + S * (2 * G + 1)) * n * 8))
+    for f0 in range(0, F, step):
+        fast = ema_grid(prices, fast_spans[f0:f0 + step])
+        line = fast[:, None] - slow[None, :]
+        signal = np.moveaxis(ema_kernel(line, alphas), 0, 2)
+        outputs['apo'][f0:f0 + step] = line[..., n - kept:]
+        outputs['macd_signal'][f0:f0 + step] = signal[..., n - kept:]
+        outputs['macd_histogram'][f0:f0 + step] = (line[:, :, None] - signal)[..., n - kept:]
+    for out in outputs.values():
+        out.flush()
+
+
+def _sweep_shard(path, positions, out_dir, column, fast_spans, slow_spans, signal_spans, tail):
+    universe = Universe(path)
+    prices = universe.column(column)
+    for i in positions:
+        start, stop = universe.span(universe.symbols[i])
+        with metrics.span('sweep.symbol', rows=stop - start):
+            write_macd_grid(prices[start:stop], os.path.join(out_dir, universe.symbols[i]),
+                            fast_spans, slow_spans, signal_spans, tail)
+    return len(positions)
+
+
+def _sweep_shard_args(args):
+    return _sweep_shard(*args), metrics.collect() # the worker's metrics go to the parent
+
+
+def sweep_universe(universe, out_dir, fast_spans=SPANS, slow_spans=SPANS, signal_spans=(9,),
+                   symbols=None, column='Close', processes=None, tail=None):
+    """Sweep every symbol of a Universe and write the grids to `out_dir`.
+
+    Each symbol gets a directory with apo.npy (F x S x bars, which is also the
+    MACD line), macd_signal.npy and macd_histogram.npy (F x S x G x bars),
+    written by the worker chunk by chunk as the symbol is done. tail=N keeps
+    only the last N bars of each grid. Returns the spans used on every axis.
+    """
+    if not isinstance(universe, Universe):
+        universe = Universe(universe)
+    positions = (list(range(len(universe))) if symbols is None
+                 else universe.positions(symbols))
+    processes = processes or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    grid = (list(fast_spans), list(slow_spans), list(signal_spans))
+
+    jobs = [(universe.path, shard, out_dir, column) + grid + (tail,)
+            for shard in universe.shards(positions, processes * 4)]
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            _sweep_shard(*job)
+    else:
+        with Pool(processes, metrics.worker_init, (metrics.enabled(),)) as pool:
+            for _, totals in pool.imap_unordered(_sweep_shard_args, jobs):
+                metrics.merge(totals)
+    return {'fast_spans': grid[0], 'slow_spans': grid[1], 'signal_spans': grid[2]}
@@ -0,0 +1,240 @@
+# Memory-mapped price columns for a whole universe of symbols
+#
+# A universe directory holds one flat binary file per column (dates.bin and
+# e.g. close.bin), with the bars of every symbol stored back to back, and an
+# index.json with the symbol list and each symbol's offset and length in those
+# files. Columns are opened with np.memmap, so a symbol's prices are a
+# zero-copy view into the file and only the pages that are touched are read.
+#
+# Indicator results go to output columns with the same layout under out/,
+# written one symbol at a time and flushed as they are done, so memory use is
+# bounded by the largest single symbol rather than by the size of the universe.
+
+import json
+import os
+
+import numpy as np
+
+from .ema import ema
+from .momentum import momentum
+from .precision import FLOAT64_COLUMNS
+from .rolling import rolling_moments
+from .rsi import rsi
+
+INDEX_FILE = 'index.json'
+DATES_COLUMN = 'dates'
+OUTPUT_DIR = 'out'
+FLUSH_ROWS = 1 << 20
+
+
+def _column_file(column):
+    return column.lower().replace(' ', '_') + '.bin'
+
+
+class UniverseWriter:
+    """Writes a universe directory one symbol at a time."""
+
+    def __init__(self, path, columns=('Close',), dtype=np.float64):
+        self.path = path
+        self.columns = list(columns)
+        self.dtype = np.dtype(dtype)
+        self.symbols = []
+        self.offsets = []
+        self.lengths = []
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        self._files = {column: open(os.path.join(path, _column_file(column)), 'wb')
+                       for column in [DATES_COLUMN] + self.columns}
+
+    def append(self, symbol, dates, values):
+        """Add the bars of one symbol, `values` maps column name to array."""
+        n = len(dates)
+        self._files[DATES_COLUMN].write(
+            np.asarray(dates, dtype='datetime64[ns]').view(np.int64).tobytes())
+        for column in self.columns:
+            array = np.asarray(values[column], dtype=np.float64 if column in FLOAT64_COLUMNS
+                               else self.dtype)
+            if len(array) != n:
+                raise ValueError('%s: %s has %d bars, dates has %d'
+                                 % (symbol, column, len(array), n))
+            self._files[column].write(array.tobytes())
+        self.symbols.append(symbol)
+        self.offsets.append(self.rows)
+        self.lengths.append(n)
+        self.rows += n
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        index = {'symbols': self.symbols, 'offsets': self.offsets, 'lengths': self.lengths,
+                 'columns': self.columns, 'dtype': self.dtype.str, 'rows': self.rows,
+                 'float64_columns': [c for c in self.columns if c in FLOAT64_COLUMNS]}
+        with open(os.path.join(self.path, INDEX_FILE), 'w') as f:
+            json.dump(index, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_universe(store, symbols, path, columns=('Close',), dtype=np.float64):
+    """Copy every symbol's stored bars from a PriceStore into a universe directory."""
+    with UniverseWriter(path, columns, dtype) as writer:
+        for symbol in symbols:
+            dates, values = store.load(symbol, columns, mmap_mode='r')
+            writer.append(symbol, dates, values)
+    return Universe(path)
+
+
+class Universe:
+    """Read side of a universe directory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.symbols = index['symbols']
+        self.offsets = np.asarray(index['offsets'], dtype=np.int64)
+        self.lengths = np.asarray(index['lengths'], dtype=np.int64)
+        self.columns = index['columns']
+        self.dtype = np.dtype(index['dtype'])
+        self.rows = index['rows']
+        self.float64_columns = index.get('float64_columns', [])
+        self._position = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _open(self, path, dtype, mode='r'):
+        if self.rows == 0: # np.memmap cannot map an empty file
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode=mode, shape=(self.rows,))
+
+    def column(self, column):
+        """The whole column for every symbol as one read-only memory map."""
+        if column not in self._columns:
+            if column == DATES_COLUMN:
+                dates = self._open(os.path.join(self.path, _column_file(column)), np.int64)
+                self._columns[column] = dates.view('datetime64[ns]')
+            else:
+                self._columns[column] = self._open(
+                    os.path.join(self.path, _column_file(column)),
+                    np.float64 if column in self.float64_columns else self.dtype)
+        return self._columns[column]
+
+    def positions(self, symbols):
+        """Index of each of `symbols` in the symbol list, through a dict lookup."""
+        try:
+            return [self._position[symbol] for symbol in symbols]
+        except KeyError as error:
+            raise KeyError('%s is not in the universe' % (error.args[0],)) from None
+
+    def span(self, symbol):
+        """(start, stop) rows of `symbol` in every column."""
+        i = self._position[symbol]
+        return int(self.offsets[i]), int(self.offsets[i] + self.lengths[i])
+
+    def shards(self, positions, count):
+        """Split symbol positions into up to `count` contiguous runs of about equal bars."""
+        lengths = self.lengths[positions]
+        bounds = np.searchsorted(np.cumsum(lengths),
+                                 np.linspace(0, lengths.sum(), count + 1)[1:-1])
+        return [[int(i) for i in shard]
+                for shard in np.split(np.asarray(positions, dtype=np.int64), bounds) if len(shard)]
+
+    def series(self, symbol, column='Close'):
+        """Zero-copy view of one symbol's column."""
+        start, stop = self.span(symbol)
+        return self.column(column)[start:stop]
+
+    def dates(self, symbol):
+        return self.series(symbol, DATES_COLUMN)
+
+    def _output_path(self, name):
+        return os.path.join(self.path, OUTPUT_DIR, _column_file(name))
+
+    def create_output(self, name, dtype=None, fill=np.nan):
+        """Preallocate a writable output column laid out like the price columns.
+
+        Every row starts as `fill`, so symbols that are not computed read NaN.
+        """
+        os.makedirs(os.path.join(self.path, OUTPUT_DIR), exist_ok=True)
+        dtype = self.dtype if dtype is None else dtype
+        block = np.full(min(self.rows, FLUSH_ROWS), fill, dtype=dtype).tobytes()
+        with open(self._output_path(name), 'wb') as f:
+            for start in range(0, self.rows, FLUSH_ROWS): # written through, no dirty pages
+                f.write(block[:min(self.rows - start, FLUSH_ROWS) * np.dtype(dtype).itemsize])
+        return self._open(self._output_path(name), dtype, mode='r+')
+
+    def output(self, name, symbol=None, dtype=None, mode='r'):
+        """View of an output column, or of one symbol's part of it."""
+        out = self._open(self._output_path(name), self.dtype if dtype is None else dtype, mode)
+        if symbol is None:
+            return out
+        start, stop = self.span(symbol)
+        return out[start:stop]
+
+    def create_table(self, name, width, fill=np.nan):
+        """Preallocate a writable symbols x width float64 output table."""
+        os.makedirs(os.path.join(self.path, OUTPUT_DIR), exist_ok=True)
+        table = np.lib.format.open_memmap(self._table_path(name), mode='w+', dtype=np.float64,
+                                          shape=(len(self.symbols), width))
+        table[:] = fill
+        table.flush()
+        return table
+
+    def table(self, name, mode='r'):
+        """A symbols x width output table created by create_table()."""
+        return np.load(self._table_path(name), mmap_mode=mode)
+
+    def _table_path(self, name):
+        return os.path.join(self.path, OUTPUT_DIR, name.lower().replace(' ', '_') + '.npy')
+
+    def compute(self, name, kernel, column='Close', symbols=None, **params):
+        """Run `kernel` over each symbol's column and store it as output `name`.
+
+        `kernel` is a name from KERNELS or a function taking a price array and
+        keyword parameters and returning an array of the same length.
+        """
+        kernel = KERNELS[kernel] if isinstance(kernel, str) else kernel
+        out = self.create_output(name)
+        prices = self.column(column)
+        pending = 0 # rows written since the last flush
+        for symbol in self.symbols if symbols is None else symbols:
+            start, stop = self.span(symbol)
+            if stop > start:
+                out[start:stop] = kernel(prices[start:stop], **params)
+                pending += stop - start
+            if pending >= FLUSH_ROWS: # hand dirty pages back to the OS as we go
+                out.flush()
+                pending = 0
+        if self.rows:
+            out.flush()
+        return out
+
+
+def _ema(prices, span=20):
+    return ema(prices, span)
+
+
+def _rsi(prices, time_period=20, mode='simple'):
+    return rsi(prices, time_period, mode)[2]
+
+
+def _momentum(prices, time_period=20):
+    return momentum(prices, time_period)
+
+
+def _stddev(prices, time_period=20):
+    return rolling_moments(prices, time_period)[1]
+
+
+KERNELS = {
+    'ema': _ema,
+    'rsi': _rsi,
+    'momentum': _momentum,
+    'stddev': _stddev,
+}
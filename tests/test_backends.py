@@ -0,0 +1,16 @@
+import pytest
+
+from financial_indicators import backends
+from financial_indicators.backends import KERNELS, NUMBA_MIN, PYTHON_MAX, conformance, select
+
+
+def test_backends_conform_to_python_reference():
+    assert conformance() == []
+
+
+@pytest.mark.parametrize('kernel', KERNELS)
+def test_select_dispatches_by_size(kernel):
+    assert select(kernel, PYTHON_MAX[kernel]).name == 'python'
+    assert select(kernel, NUMBA_MIN[kernel] - 1).name in ('python', 'numpy')
+    big = select(kernel, NUMBA_MIN[kernel]).name
+    assert big == ('numba' if backends.BACKENDS['numba'].available() else 'numpy')
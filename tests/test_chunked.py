@@ -0,0 +1,112 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from financial_indicators.chunked import CALCULATORS, ChunkedIndicators, main
+from financial_indicators.scan import INDICATORS
+
+# every calculator, with parameters that give short windows and both RSI modes
+SPEC = {'APO': {}, 'EMA': {'span': 7}, 'MACD': {}, 'RSI': {'time_period': 14},
+        'MOM': {'time_period': 5}, 'STDDEV': {'time_period': 20},
+        'BBANDS': {'time_period': 9, 'stdev_factor': 2}}
+
+
+def _prices(n=1000, seed=0, nan_fraction=0.05):
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 1, n))
+    prices[rng.random(n) < nan_fraction] = np.nan
+    return prices
+
+
+def _expected(prices, spec=SPEC):
+    out = {}
+    for name, params in spec.items():
+        out.update(INDICATORS[name][0](prices, **params))
+    return out
+
+
+def _run(indicators, prices, chunk_rows):
+    chunks = [indicators.update(prices[i:i + chunk_rows]) for i in range(0, len(prices), chunk_rows)]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def _assert_same(outputs, expected):
+    assert outputs.keys() == expected.keys()
+    for name, values in expected.items():
+        assert np.array_equal(outputs[name], values, equal_nan=True), name
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 2, 3, 7, 13, 19, 20, 21, 40, 64, 333, 999, 1000])
+@pytest.mark.parametrize('mode', ['simple', 'wilder'])
+def test_chunks_match_the_whole_series(chunk_rows, mode):
+    prices = _prices()
+    spec = dict(SPEC, RSI={'time_period': 14, 'mode': mode})
+    _assert_same(_run(ChunkedIndicators(spec), prices, chunk_rows), _expected(prices, spec))
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 17, 100])
+def test_adf_chunks_match_the_whole_series(chunk_rows):
+    prices = _prices(160, nan_fraction=0)
+    spec = {'ADF': {'window': 40, 'maxlag': 2}}
+    _assert_same(_run(ChunkedIndicators(spec), prices, chunk_rows), _expected(prices, spec))
+
+
+@pytest.mark.parametrize('split', [1, 13, 500, 999])
+def test_resume_from_state(split):
+    prices = _prices()
+    first = ChunkedIndicators(SPEC)
+    head = _run(first, prices[:split], 37)
+    state = json.loads(json.dumps(first.get_state()))
+    tail = _run(ChunkedIndicators.from_state(state), prices[split:], 37)
+    outputs = {name: np.concatenate((head[name], tail[name])) for name in head}
+    _assert_same(outputs, _expected(prices))
+
+
+def test_unknown_indicator():
+    with pytest.raises(ValueError):
+        ChunkedIndicators(['NOPE'])
+    assert set(SPEC) | {'ADF'} == set(CALCULATORS)
+
+
+def _write_input(path, prices):
+    dates = pd.bdate_range('2000-01-03', periods=len(prices)).strftime('%Y-%m-%d')
+    pd.DataFrame({'Date': dates, 'Close': prices}).to_csv(path, index=False)
+    return np.asarray(dates)
+
+
+def _cli_args(spec=SPEC):
+    args = ['--indicators'] + list(spec)
+    for name, params in spec.items():
+        for param, value in params.items():
+            args += ['-p', '%s.%s=%s' % (name, param, json.dumps(value))]
+    return args
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_cli_csv(tmp_path, dtype):
+    prices = _prices(500)
+    dates = _write_input(tmp_path / 'in.csv', prices)
+    out = tmp_path / 'out.csv'
+    assert main([str(tmp_path / 'in.csv'), '--chunk-rows', '37', '--dtype', dtype, '-o', str(out)]
+                + _cli_args()) == 0
+    frame = pd.read_csv(out, dtype={'Date': str}, float_precision='round_trip')
+    assert np.array_equal(frame['Date'].to_numpy(), dates)
+    expected = _expected(pd.read_csv(tmp_path / 'in.csv')['Close'].to_numpy()) # parsed as the CLI does
+    for name, values in expected.items():
+        values = values.astype(dtype) # float32 writes the float64 results rounded
+        assert np.array_equal(frame[name].to_numpy(dtype=dtype), values, equal_nan=True), name
+
+
+def test_cli_npy(tmp_path, capsys):
+    prices = _prices(300)
+    np.save(tmp_path / 'close.npy', prices)
+    assert main([str(tmp_path / 'close.npy'), '--date-column', '', '--chunk-rows', '50',
+                 '--indicators', 'EMA', 'RSI']) == 0
+    frame = pd.read_csv(io.StringIO(capsys.readouterr().out), float_precision='round_trip')
+    assert list(frame.columns) == ['ema', 'rsi']
+    expected = _expected(prices, {'EMA': {}, 'RSI': {}})
+    for name, values in expected.items():
+        assert np.array_equal(frame[name].to_numpy(), values, equal_nan=True), name
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from financial_indicators.fetch import BulkFetcher, StandInServer, SyntheticProvider, read_bars
+from financial_indicators.store import PriceStore
+
+START, END = '2024-01-01', '2024-03-01'
+SYMBOLS = ['S%d' % i for i in range(40)]
+
+
+@pytest.fixture
+def server(request):
+    params = getattr(request, 'param', {})
+    provider = SyntheticProvider(params.get('seed', 0), histories=4) # quicker to build than 64
+    with StandInServer(provider=provider, **params) as server:
+        yield server
+
+
+def _assert_stored(store, server, symbols):
+    provider = server.provider
+    for symbol in symbols:
+        expected = provider.fetch(symbol, START, END)
+        dates, values = store.load(symbol)
+        assert np.array_equal(dates, expected.index.values), symbol
+        for column in expected.columns:
+            assert np.array_equal(values[column], expected[column].values), (symbol, column)
+
+
+@pytest.mark.parametrize('server', [{'failure_rate': 0.3, 'seed': 1}], indirect=True)
+def test_failures_are_retried(tmp_path, server):
+    fetcher = BulkFetcher(server.url, retries=20, backoff=0.001, max_backoff=0.01)
+    store = PriceStore(str(tmp_path))
+    results = fetcher.refresh(store, SYMBOLS, START, END)
+    assert all(result['error'] is None for result in results.values())
+    assert server.counters['failed'] > 0
+    assert fetcher.retried == server.counters['failed']
+    assert fetcher.requests == server.counters['requests']
+    _assert_stored(store, server, SYMBOLS)
+    # the store is complete, a second refresh has nothing to ask for
+    results = fetcher.refresh(store, SYMBOLS, START, END)
+    assert all(result['fetches'] == 0 for result in results.values())
+
+
+@pytest.mark.parametrize('server', [{'failure_rate': 1.0}], indirect=True)
+def test_exhausted_retries_are_reported(tmp_path, server):
+    fetcher = BulkFetcher(server.url, retries=2, backoff=0.001)
+    results = fetcher.refresh(PriceStore(str(tmp_path)), ['AAA'], START, END)
+    assert results['AAA']['error'] == 'AAA: HTTP 503'
+    assert server.counters['requests'] == 3
+
+
+@pytest.mark.parametrize('server', [{'rate': 1}], indirect=True)
+def test_retry_after_pauses_the_host(tmp_path, server):
+    # the server allows one request a second and answers 429 with Retry-After: 1
+    fetcher = BulkFetcher(server.url, per_host=1)
+    started = time.monotonic()
+    results = fetcher.refresh(PriceStore(str(tmp_path)), ['AAA', 'BBB'], START, END)
+    assert all(result['error'] is None for result in results.values())
+    assert time.monotonic() - started >= 0.9
+    assert server.counters['throttled'] == fetcher.retried == 1
+
+
+@pytest.mark.parametrize('server', [{'rate': 1}], indirect=True)
+def test_retry_after_is_capped_by_max_backoff(tmp_path, server):
+    fetcher = BulkFetcher(server.url, per_host=1, retries=50, max_backoff=0.1)
+    results = fetcher.refresh(PriceStore(str(tmp_path)), ['AAA', 'BBB'], START, END)
+    assert all(result['error'] is None for result in results.values())
+    # retried every 0.1 s instead of once after a second
+    assert fetcher.retried == server.counters['throttled'] >= 4
+
+
+@pytest.mark.parametrize('server', [{'latency': 0.01}], indirect=True)
+@pytest.mark.parametrize('connections, per_host', [(64, 3), (2, 8)])
+def test_concurrency_limits(tmp_path, server, connections, per_host):
+    fetcher = BulkFetcher(server.url, connections=connections, per_host=per_host)
+    store = PriceStore(str(tmp_path))
+    fetcher.refresh(store, SYMBOLS, START, END)
+    assert server.counters['max_concurrent'] == min(connections, per_host)
+    # connections are reused, not opened per request
+    assert server.counters['connections'] <= min(connections, per_host)
+    _assert_stored(store, server, SYMBOLS)
+
+
+@pytest.mark.parametrize('server', [{'latency': 0.01}], indirect=True)
+def test_fetch_on_a_new_loop_after_refresh(tmp_path, server):
+    fetcher = BulkFetcher(server.url, per_host=2)
+    fetcher.refresh(PriceStore(str(tmp_path)), SYMBOLS[:10], START, END)
+
+    async def fetch_all():
+        try:
+            return await asyncio.gather(*(fetcher.fetch(symbol, START, END) for symbol in SYMBOLS))
+        finally:
+            fetcher.close()
+
+    bodies = asyncio.run(fetch_all()) # more requests than slots, they wait on the semaphores
+    for symbol, body in zip(SYMBOLS, bodies):
+        assert read_bars(body).equals(server.provider.fetch(symbol, START, END))
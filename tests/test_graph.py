@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from financial_indicators import graph
+from financial_indicators.graph import Plan
+from financial_indicators.precision import float32_blocks, use_dtype
+from financial_indicators.scan import INDICATORS
+
+SPEC = {'MACD': {}, 'EMA': {'span': 12}, 'APO': {'fast_span': 12, 'slow_span': 26},
+        'BBANDS': {}, 'STDDEV': {}, 'RSI': {'mode': 'wilder'}, 'MOM': {}}
+
+
+def _prices(shape=(3, 400), seed=0):
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 1, shape), axis=-1)
+    prices[..., [5, 6, 50]] = np.nan
+    return prices
+
+
+def _counting(monkeypatch, name):
+    calls = []
+    kernel = getattr(graph, name)
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return kernel(*args, **kwargs)
+
+    monkeypatch.setattr(graph, name, counted)
+    return calls
+
+
+def test_shared_nodes_run_once(monkeypatch):
+    ema_calls = _counting(monkeypatch, 'ema_kernel')
+    moments_calls = _counting(monkeypatch, 'rolling_moments')
+    returns_calls = _counting(monkeypatch, 'daily_returns')
+    prices = _prices()
+    plan = Plan(dict(SPEC, SEASONALITY={}))
+    dates = np.datetime64('2020-01-01') + np.arange(prices.shape[-1])
+    outputs = plan.run(prices, dates)
+
+    # one EMA group over the prices (12, 26 and the EMA's 12 once) and one over the MACD line
+    assert len(ema_calls) == 2
+    assert len(ema_calls[0][1]) == 2
+    # STDDEV and BBANDS share their rolling moments
+    assert len(moments_calls) == 1
+    assert len(returns_calls) == 1
+    assert plan.outputs['apo'] == plan.outputs['macd']
+
+    for name, params in SPEC.items():
+        for output, values in INDICATORS[name][0](prices, **params).items():
+            assert np.array_equal(outputs[output], values, equal_nan=True), output
+
+
+def test_repeated_indicator_adds_no_node():
+    plan = Plan(SPEC)
+    size = len(plan)
+    plan.add('EMA', span=26) # the MACD's slow EMA
+    plan.add('STDDEV')
+    assert len(plan) == size
+
+
+def test_function_node_runs_once():
+    calls = []
+
+    def pair(prices, scale=1):
+        calls.append(scale)
+        return {'low': prices * scale, 'high': prices * scale + 1}
+
+    plan = Plan({'PAIR': {'scale': 2}, 'EMA': {}}, {'PAIR': (pair, ('low', 'high'))})
+    prices = _prices()
+    outputs = plan.run(prices)
+    assert calls == [2]
+    assert np.array_equal(outputs['high'], prices * 2 + 1, equal_nan=True)
+
+
+def test_function_outputs_in_float32_mode():
+    @float32_blocks()
+    def third(prices):
+        return np.asarray(prices, dtype=np.float64) / 3
+
+    def indicator(prices):
+        return {'value': third(prices)}
+
+    def statistic(prices):
+        return {'statistic': np.asarray(prices, dtype=np.float64) / 3}
+
+    functions = {'IND': (indicator, ('value',)), 'STAT': (statistic, ('statistic',))}
+    prices = _prices()
+    with use_dtype('float32'):
+        outputs = Plan(['IND', 'STAT', 'EMA'], functions).run(prices)
+        expected = indicator(prices)['value']
+    # each function returns what it returns on its own, the plan's outputs are rounded
+    assert outputs['value'].dtype == np.float32
+    assert np.array_equal(outputs['value'], expected, equal_nan=True)
+    assert outputs['statistic'].dtype == np.float64
+    assert outputs['ema'].dtype == np.float32
+
+
+def test_unknown_indicator():
+    with pytest.raises(ValueError):
+        Plan(['NOPE'])
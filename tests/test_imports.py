@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from financial_indicators.bench import HEAVY_MODULES, IMPORT_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('module', IMPORT_MODULES)
+def test_import_does_not_load_heavy_modules(module):
+    code = ('import importlib, json, sys; importlib.import_module(%r); '
+            'print(json.dumps(sorted(sys.modules)))' % module)
+    path = [ROOT] + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else [])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+    loaded = json.loads(subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                                       capture_output=True, text=True).stdout)
+    heavy = [name for name in loaded if name.split('.')[0] in HEAVY_MODULES]
+    assert heavy == []
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from financial_indicators.incremental import IndicatorStore
+from financial_indicators.store import PriceStore
+
+
+def _bars(close, start='2020-01-01'):
+    return pd.DataFrame({'Close': close},
+                        index=pd.bdate_range(start, periods=len(close), name='Date'))
+
+
+def _assert_same_as_rebuild(tmp_path, store, prices, verify):
+    dates, outputs = store.load('AAA')
+    fresh = IndicatorStore(str(tmp_path / 'fresh'), prices, verify=verify)
+    fresh.update('AAA')
+    fresh_dates, expected = fresh.load('AAA')
+    assert np.array_equal(dates, fresh_dates)
+    for output, values in expected.items():
+        assert np.array_equal(outputs[output], values, equal_nan=True), output
+
+
+@pytest.mark.parametrize('verify', ['sample', 'full'])
+def test_revised_last_bar_is_recomputed_not_rebuilt(tmp_path, verify):
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, 300))
+    prices = PriceStore(str(tmp_path / 'prices'), provider=object())
+    day = pd.Timestamp('2020-01-01')
+    prices.merge('AAA', _bars(close[:200]), day, day)
+    store = IndicatorStore(str(tmp_path / 'indicators'), prices, verify=verify)
+    assert store.update('AAA') == (200, 'not computed')
+
+    frame = _bars(close[:200])
+    for revision in (0.5, -0.25, 1.0): # the open session's bar moves
+        frame.iloc[-1, 0] = close[199] + revision
+        prices.merge('AAA', frame.iloc[-1:], day, day)
+        assert store.update('AAA') == (1, None)
+        _assert_same_as_rebuild(tmp_path / str(revision), store, prices, verify)
+
+    prices.merge('AAA', _bars(close, '2020-01-01').iloc[200:], day, day) # the next sessions
+    assert store.update('AAA') == (100, None)
+    _assert_same_as_rebuild(tmp_path / 'next', store, prices, verify)
+
+
+def test_revised_history_is_rebuilt(tmp_path):
+    close = np.linspace(100, 130, 150)
+    prices = PriceStore(str(tmp_path / 'prices'), provider=object())
+    day = pd.Timestamp('2020-01-01')
+    prices.merge('AAA', _bars(close), day, day)
+    store = IndicatorStore(str(tmp_path / 'indicators'), prices)
+    store.update('AAA')
+    prices.merge('AAA', _bars(close * 0.5), day, day) # a split adjusts every price
+    assert store.update('AAA') == (150, 'history revised')
+    _assert_same_as_rebuild(tmp_path, store, prices, 'sample')
@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+import pytest
+
+from financial_indicators.ema import ema
+from financial_indicators.graph import Plan
+from financial_indicators.precision import (ABSOLUTE, MAX_DEVIATIONS, deviations, get_dtype,
+                                            use_dtype)
+
+
+def test_use_dtype_is_local_to_the_thread():
+    inside = threading.Event()
+    done = threading.Event()
+    seen = {}
+
+    def other():
+        inside.wait()
+        with use_dtype('float64'): # as Plan.run does in float32 mode
+            seen['other'] = get_dtype()
+            done.wait()
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    with use_dtype('float32'):
+        inside.set()
+        while 'other' not in seen:
+            thread.join(0.01)
+        seen['main'] = get_dtype()
+        seen['ema'] = ema(np.linspace(1, 2, 50), 10).dtype
+        done.set()
+    thread.join()
+    assert seen['other'] == np.float64
+    assert seen['main'] == np.float32
+    assert seen['ema'] == np.float32
+    assert get_dtype() == np.float64
+
+
+def test_plan_in_float32_mode_keeps_the_dtype_of_the_caller():
+    prices = np.linspace(1, 2, 300)
+    with use_dtype('float32'):
+        outputs = Plan(('MACD', 'RSI')).run(prices)
+        assert get_dtype() == np.float32
+    assert all(values.dtype == np.float32 for values in outputs.values())
+
+
+@pytest.mark.parametrize('stored', [False, True])
+def test_float32_deviations_within_documented_bounds(stored):
+    # seeds 0 to 3 were measured for the bounds, this one was not
+    for output, (absolute, relative) in deviations(seed=4, stored=stored).items():
+        error = absolute if output in ABSOLUTE else relative
+        assert error <= MAX_DEVIATIONS[output][stored], output
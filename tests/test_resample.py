@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from financial_indicators.resample import FIELDS, MultiTimeframe, resample_all
+
+AGGREGATE = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+RULES = {'1mo': 'MS', '3mo': 'QS-JAN'}
+
+
+def _daily_bars(seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2019-01-01', '2023-12-31').values.astype('datetime64[ns]')
+    n = len(dates)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    open_ = close + rng.normal(0, 0.5, n)
+    return {'time': dates, 'open': open_, 'high': np.maximum(open_, close) + rng.random(n),
+            'low': np.minimum(open_, close) - rng.random(n), 'close': close,
+            'volume': np.floor(rng.random(n) * 1e6)}
+
+
+def _pandas(bars, timeframe):
+    frame = pd.DataFrame(bars).set_index('time')
+    return frame.resample(RULES[timeframe]).agg(AGGREGATE).dropna()
+
+
+def _assert_matches(bars, expected):
+    assert np.array_equal(bars['time'], expected.index.values.astype('datetime64[ns]'))
+    for field in FIELDS[1:]:
+        assert np.array_equal(bars[field], expected[field].values), field
+
+
+def test_month_timeframes_match_pandas():
+    bars = _daily_bars()
+    out = resample_all(bars, ('1d', '1mo', '3mo'))
+    for timeframe in ('1mo', '3mo'):
+        _assert_matches(out[timeframe], _pandas(bars, timeframe))
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 40, 500])
+def test_streamed_month_timeframes_match_pandas(chunk):
+    bars = _daily_bars(1)
+    stream = MultiTimeframe(('1d', '1mo', '3mo'), base='1d')
+    parts = {timeframe: [] for timeframe in stream.timeframes}
+    for start in range(0, len(bars['time']), chunk):
+        for timeframe, (done, _) in stream.update({f: v[start:start + chunk]
+                                                   for f, v in bars.items()}).items():
+            parts[timeframe].append(done)
+    for timeframe, (done, _) in stream.flush().items():
+        parts[timeframe].append(done)
+    for timeframe in ('1mo', '3mo'):
+        streamed = {field: np.concatenate([part[field] for part in parts[timeframe]])
+                    for field in FIELDS}
+        _assert_matches(streamed, _pandas(bars, timeframe))
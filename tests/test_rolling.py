@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from financial_indicators.backends import available, use_backend
+from financial_indicators.rolling import rolling_mean, rolling_moments
+
+
+def _direct(prices, window):
+    # mean and population stddev of every window, partial ones at the start
+    mean = np.empty(len(prices))
+    stdev = np.empty(len(prices))
+    for t in range(len(prices)):
+        values = prices[max(0, t - window + 1):t + 1]
+        mean[t] = np.mean(values)
+        stdev[t] = np.std(values)
+    return mean, stdev
+
+
+def _prices(seed, nan_positions):
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 1, 120))
+    prices[list(nan_positions)] = np.nan
+    return prices
+
+
+@pytest.mark.parametrize('backend', available())
+@pytest.mark.parametrize('window', [1, 2, 5, 7, 30])
+@pytest.mark.parametrize('nan_positions', [(), (6,), (0,), (5, 10, 11, 40), (35,), tuple(range(50, 60))])
+def test_rolling_moments_match_direct_windows(backend, window, nan_positions):
+    prices = _prices(window, nan_positions)
+    expected_mean, expected_stdev = _direct(prices, window)
+    with use_backend(backend):
+        mean, stdev = rolling_moments(prices, window)
+        only_mean = rolling_mean(prices, window)
+    # NaN exactly where the window holds a NaN price
+    assert np.array_equal(np.isnan(mean), np.isnan(expected_mean))
+    assert np.array_equal(np.isnan(stdev), np.isnan(expected_stdev))
+    assert np.allclose(mean, expected_mean, rtol=1e-12, atol=0, equal_nan=True)
+    assert np.allclose(stdev, expected_stdev, rtol=1e-9, atol=1e-9, equal_nan=True)
+    assert np.array_equal(only_mean, mean, equal_nan=True)
+
+
+def test_nan_only_spoils_the_windows_that_hold_it():
+    prices = np.arange(20.0)
+    prices[6] = np.nan
+    mean, stdev = rolling_moments(prices, 5)
+    assert np.flatnonzero(np.isnan(mean)).tolist() == [6, 7, 8, 9, 10]
+    assert np.flatnonzero(np.isnan(stdev)).tolist() == [6, 7, 8, 9, 10]
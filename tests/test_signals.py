@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from financial_indicators import signals
+from financial_indicators.scan import INDICATORS
+from financial_indicators.signals import (EVENTS, Signals, crosses_above, crosses_below, detect,
+                                          extract_signals)
+from financial_indicators.universe import Universe, UniverseWriter
+
+NAN = np.nan
+# lengths around the block size, with empty and one-bar symbols in between
+LENGTHS = (0, 1, 3, 40, 0, 7, 61, 2, 95, 1, 33)
+
+
+def test_crosses_above():
+    a = np.array([1.0, 2.0, 3.0, 2.0, 4.0, 4.0])
+    b = np.array([2.0, 2.0, 2.0, 2.0, 2.0, 5.0])
+    # 2 -> 3 crosses from == b to > b, 2 -> 4 from == b again
+    assert crosses_above(a, b).tolist() == [False, False, True, False, True, False]
+    assert crosses_above(a, 2.0).tolist() == [False, False, True, False, True, False]
+
+
+def test_crosses_below():
+    a = np.array([3.0, 2.0, 1.0, 2.0, 0.0, 5.0])
+    assert crosses_below(a, 2.0).tolist() == [False, False, True, False, True, False]
+
+
+def test_crosses_skip_nan_warm_up():
+    a = np.array([NAN, NAN, 3.0, 1.0, NAN, 3.0, 1.0])
+    # the first value after a NaN is no cross, nor is the one around a gap
+    assert crosses_above(a, 2.0).tolist() == [False] * 7
+    assert crosses_below(a, 2.0).tolist() == [False, False, False, True, False, False, True]
+    assert crosses_below(a, np.full(7, NAN)).tolist() == [False] * 7
+
+
+def test_crosses_along_last_axis():
+    a = np.array([[1.0, 3.0, 1.0], [3.0, 1.0, 3.0]])
+    assert crosses_above(a, 2.0).tolist() == [[False, True, False], [False, False, True]]
+    assert crosses_below(a, 2.0).tolist() == [[False, False, True], [False, True, False]]
+
+
+def _universe(path, lengths=LENGTHS, seed=0):
+    rng = np.random.default_rng(seed)
+    with UniverseWriter(str(path)) as writer:
+        for i, length in enumerate(lengths):
+            dates = np.datetime64('2020-01-01') + np.arange(length)
+            writer.append('S%02d' % i, dates, {'Close': 100 + np.cumsum(rng.normal(0, 1, length))})
+    return Universe(str(path))
+
+
+def _detect(prices):
+    outputs = {}
+    for name in signals.INDICATORS:
+        outputs.update(INDICATORS[name][0](prices))
+    return detect(prices, outputs)
+
+
+@pytest.mark.parametrize('block_rows', [8, 16, 1 << 20])
+def test_extract_signals_matches_detect_per_symbol(tmp_path, monkeypatch, block_rows):
+    monkeypatch.setattr(signals, 'BLOCK_ROWS', block_rows)
+    universe = _universe(tmp_path)
+    stored = extract_signals(universe, processes=1)
+    for symbol in universe.symbols:
+        expected = _detect(np.asarray(universe.series(symbol)))
+        for event in EVENTS:
+            assert np.array_equal(stored.flags(event, symbol), expected[event]), (symbol, event)
+
+
+def test_no_cross_between_symbols(tmp_path, monkeypatch):
+    monkeypatch.setattr(signals, 'BLOCK_ROWS', 16)
+    universe = _universe(tmp_path)
+    stored = extract_signals(universe, processes=1)
+    # the flat columns do cross at some symbol starts, the first RSI of a symbol is 0
+    flat = detect(universe.column('Close'), {output: universe.output(output)
+                                             for output in signals.OUTPUTS})
+    starts = universe.offsets[universe.lengths > 0]
+    assert flat['rsi_oversold'][starts].any()
+    for event in EVENTS:
+        assert not np.isin(stored.rows(event), starts).any(), event
+
+
+def test_rows_and_recent(tmp_path):
+    universe = _universe(tmp_path)
+    stored = extract_signals(universe, processes=1)
+    for event in EVENTS:
+        flags = np.concatenate([stored.flags(event, symbol) for symbol in universe.symbols])
+        assert np.array_equal(stored.rows(event), np.flatnonzero(flags))
+
+        symbols, ago = stored.recent(event, 5)
+        expected = [(symbol, n) for symbol in universe.symbols
+                    for n in range(min(5, len(universe.series(symbol))))
+                    if stored.flags(event, symbol)[-1 - n]]
+        assert list(zip(symbols, ago.tolist())) == expected
+        assert stored.latest(event) == [symbol for symbol, n in expected if n == 0]
+
+
+def test_empty_and_short_symbols(tmp_path):
+    universe = _universe(tmp_path, lengths=(0, 1, 2, 0))
+    stored = extract_signals(universe, processes=1)
+    for event in EVENTS:
+        assert stored.flags(event, 'S00').tolist() == []
+        assert stored.flags(event, 'S01').tolist() == [False]
+        # only the second bar of S02 can hold an event
+        assert set(stored.rows(event).tolist()) <= {2}
+        symbols, ago = stored.recent(event, 5)
+        assert 'S00' not in symbols and 'S03' not in symbols
+        assert len(symbols) == len(ago)
+
+
+def test_empty_universe(tmp_path):
+    stored = extract_signals(_universe(tmp_path, lengths=(0, 0)), processes=1)
+    for event in EVENTS:
+        assert stored.rows(event).tolist() == []
+        symbols, ago = stored.recent(event, 5)
+        assert symbols == [] and len(ago) == 0
+
+
+def test_signals_reopen(tmp_path):
+    universe = _universe(tmp_path)
+    stored = extract_signals(universe, processes=1)
+    reopened = Signals(str(tmp_path))
+    for event in EVENTS:
+        assert np.array_equal(reopened.rows(event), stored.rows(event))
+    with pytest.raises(KeyError):
+        reopened.bits('unknown')
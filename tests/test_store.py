@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from financial_indicators import universe as universe_module
+from financial_indicators.ema import ema
+from financial_indicators.scan import scan
+from financial_indicators.store import CsvProvider, PriceStore
+from financial_indicators.universe import build_universe
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def _write_csv(directory, symbol, start='2024-01-01', periods=30, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=periods, name='Date')
+    close = 100 + np.cumsum(rng.normal(0, 1, periods))
+    frame = pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close,
+                          'Adj Close': close, 'Volume': 123456789.0 + np.arange(periods)},
+                         index=dates)
+    frame.to_csv(directory / (symbol + '.csv'))
+    return pd.read_csv(directory / (symbol + '.csv'), index_col=0, parse_dates=True) # as stored
+
+
+def test_float32_store_keeps_volume_exact(tmp_path):
+    (tmp_path / 'csv').mkdir()
+    frame = _write_csv(tmp_path / 'csv', 'AAA')
+    store = PriceStore(str(tmp_path / 'store'), CsvProvider(str(tmp_path / 'csv')), np.float32)
+    store.ensure('AAA', '2024-01-01', '2024-03-01')
+    _, values = store.load('AAA')
+    assert values['Close'].dtype == np.float32
+    assert values['Volume'].dtype == np.float64
+    assert np.array_equal(values['Volume'], frame['Volume'].values)
+
+    universe = build_universe(store, ['AAA'], str(tmp_path / 'universe'), ('Close', 'Volume'),
+                              np.float32)
+    assert universe.series('AAA', 'Close').dtype == np.float32
+    assert np.array_equal(universe.series('AAA', 'Volume'), frame['Volume'].values)
+
+
+def _assert_same(a, b):
+    dates_a, values_a = a
+    dates_b, values_b = b
+    assert np.array_equal(dates_a, dates_b)
+    assert values_a.keys() == values_b.keys()
+    for column in values_a:
+        assert np.array_equal(values_a[column], values_b[column]), column
+
+
+def test_new_bars_are_appended_in_place(tmp_path):
+    (tmp_path / 'csv').mkdir()
+    _write_csv(tmp_path / 'csv', 'AAA', periods=60)
+    provider = CsvProvider(str(tmp_path / 'csv'))
+    store = PriceStore(str(tmp_path / 'store'), provider)
+    store.ensure('AAA', '2024-01-01', '2024-01-15')
+    inode = (tmp_path / 'store' / 'AAA' / 'close.npy').stat().st_ino
+    for end in ('2024-01-16', '2024-01-17', '2024-02-20', '2024-04-01'):
+        store.ensure('AAA', '2024-01-01', end)
+    assert (tmp_path / 'store' / 'AAA' / 'close.npy').stat().st_ino == inode # not rewritten
+
+    full = PriceStore(str(tmp_path / 'full'), provider)
+    full.ensure('AAA', '2024-01-01', '2024-04-01')
+    _assert_same(store.load('AAA'), full.load('AAA'))
+    _assert_same(store.load('AAA', mmap_mode='r'), full.load('AAA'))
+
+
+def test_overlapping_bars_rewrite_the_columns(tmp_path):
+    (tmp_path / 'csv').mkdir()
+    frame = _write_csv(tmp_path / 'csv', 'AAA', periods=40)
+    store = PriceStore(str(tmp_path / 'store'), CsvProvider(str(tmp_path / 'csv')))
+    store.ensure('AAA', '2024-01-10', '2024-02-01')
+    store.ensure('AAA', '2024-01-01', '2024-02-01') # bars before the stored ones
+    revised = frame.iloc[5:15].copy()
+    revised['Close'] += 1
+    store.merge('AAA', revised, pd.Timestamp('2024-01-08'), pd.Timestamp('2024-01-20'))
+    dates, values = store.load('AAA')
+    expected = frame[frame.index < '2024-02-01'].copy()
+    expected.iloc[5:15] = revised
+    assert np.array_equal(dates, expected.index.values)
+    assert np.array_equal(values['Close'], expected['Close'].values)
+
+
+def test_interrupted_append_is_ignored(tmp_path):
+    (tmp_path / 'csv').mkdir()
+    _write_csv(tmp_path / 'csv', 'AAA')
+    store = PriceStore(str(tmp_path / 'store'), CsvProvider(str(tmp_path / 'csv')))
+    store.ensure('AAA', '2024-01-01', '2024-01-20')
+    before = store.load('AAA')
+    with open(tmp_path / 'store' / 'AAA' / 'close.npy', 'ab') as f:
+        f.write(np.ones(3).tobytes()) # rows written before the dates were
+    _assert_same(store.load('AAA'), before)
+    store.ensure('AAA', '2024-01-01', '2024-03-01')
+    dates, values = store.load('AAA')
+    assert len(values['Close']) == len(dates) == 30
+
+
+def test_append_after_interrupted_grown_header(tmp_path):
+    # an append that wrote the columns, data and header, but not the dates
+    (tmp_path / 'csv').mkdir()
+    _write_csv(tmp_path / 'csv', 'AAA')
+    provider = CsvProvider(str(tmp_path / 'csv'))
+    store = PriceStore(str(tmp_path / 'store'), provider)
+    store.ensure('AAA', '2024-01-01', '2024-01-10')
+    before = store.load('AAA')
+    for column, values in before[1].items():
+        path = tmp_path / 'store' / 'AAA' / (column.lower().replace(' ', '_') + '.npy')
+        np.save(path, np.r_[values, -1.0])
+    _assert_same(store.load('AAA'), before)
+    store.ensure('AAA', '2024-01-01', '2024-03-01')
+
+    full = PriceStore(str(tmp_path / 'full'), provider)
+    full.ensure('AAA', '2024-01-01', '2024-03-01')
+    _assert_same(store.load('AAA'), full.load('AAA'))
+    _assert_same(PriceStore(str(tmp_path / 'store')).load('AAA', mmap_mode='r'), full.load('AAA'))
+    for column in before[1]:
+        path = tmp_path / 'store' / 'AAA' / (column.lower().replace(' ', '_') + '.npy')
+        assert len(np.load(path)) == 30, column # headers rebuilt from the committed rows
+
+
+def test_universe_positions(tmp_path):
+    (tmp_path / 'csv').mkdir()
+    for symbol in ('AAA', 'BBB', 'CCC'):
+        _write_csv(tmp_path / 'csv', symbol)
+    store = PriceStore(str(tmp_path / 'store'), CsvProvider(str(tmp_path / 'csv')))
+    store.refresh(['AAA', 'BBB', 'CCC'], '2024-01-01', '2024-03-01')
+    universe = build_universe(store, ['AAA', 'BBB', 'CCC'], str(tmp_path / 'universe'))
+    assert universe.positions(['CCC', 'AAA']) == [2, 0]
+    with pytest.raises(KeyError, match='DDD'):
+        universe.positions(['AAA', 'DDD'])
+
+
+def test_scan_of_some_symbols_leaves_the_others_nan(tmp_path, monkeypatch):
+    (tmp_path / 'csv').mkdir()
+    for symbol in ('AAA', 'BBB', 'CCC'):
+        _write_csv(tmp_path / 'csv', symbol)
+    store = PriceStore(str(tmp_path / 'store'), CsvProvider(str(tmp_path / 'csv')))
+    store.refresh(['AAA', 'BBB', 'CCC'], '2024-01-01', '2024-03-01')
+    universe = build_universe(store, ['AAA', 'BBB', 'CCC'], str(tmp_path / 'universe'))
+    monkeypatch.setattr(universe_module, 'FLUSH_ROWS', 7) # fill in several blocks
+    result = scan(universe, ['EMA'], symbols=['BBB'], processes=1)
+    latest = result.latest('ema')
+    assert np.isnan(latest[[0, 2]]).all()
+    assert latest[1] == ema(universe.series('BBB'), 20)[-1]
+    assert np.isnan(universe.output('ema', 'AAA')).all()
+    assert np.isnan(universe.output('ema', 'CCC')).all()
@@ -0,0 +1,119 @@
+import json
+
+import numpy as np
+import pytest
+
+from financial_indicators.ema import apo, ema, macd
+from financial_indicators.momentum import momentum
+from financial_indicators.rolling import RollingMoments, bollinger_bands, rolling_moments
+from financial_indicators.rsi import rsi
+from financial_indicators.streaming import (APO, EMA, MACD, RSI, BollingerBands, Momentum,
+                                            StdDev)
+
+
+def _prices(seed, n=600, nan_fraction=0.05):
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 1, n))
+    prices[rng.random(n) < nan_fraction] = np.nan
+    return prices
+
+
+def _stream(calculator, prices, seed):
+    # bar by bar, with checkpoint round trips through JSON at random bars
+    rng = np.random.default_rng(seed)
+    out = []
+    for price in prices:
+        if rng.random() < 0.1:
+            calculator = type(calculator).from_state(json.loads(json.dumps(calculator.get_state())))
+        out.append(calculator.update(price))
+    return np.array(out, dtype=np.float64).T
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('window', [1, 2, 5, 20])
+@pytest.mark.parametrize('nan_fraction', [0.0, 0.05, 0.3])
+def test_rolling_moments_matches_batch(seed, window, nan_fraction):
+    prices = _prices(seed, nan_fraction=nan_fraction)
+    mean, stdev = _stream(RollingMoments(window), prices, seed)
+    expected_mean, expected_stdev = rolling_moments(prices, window)
+    assert np.array_equal(mean, expected_mean, equal_nan=True)
+    assert np.array_equal(stdev, expected_stdev, equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('window', [2, 20])
+def test_stddev_matches_batch(seed, window):
+    prices = _prices(seed)
+    stdev = _stream(StdDev(window), prices, seed)
+    assert np.array_equal(stdev, rolling_moments(prices, window)[1], equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('window', [2, 20])
+def test_bollinger_bands_match_batch(seed, window):
+    prices = _prices(seed)
+    bands = _stream(BollingerBands(window, 2), prices, seed)
+    for streamed, expected in zip(bands, bollinger_bands(prices, window, 2)):
+        assert np.array_equal(streamed, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('span', [1, 10, 40])
+@pytest.mark.parametrize('nan_fraction', [0.0, 0.05, 0.3])
+def test_ema_matches_batch(seed, span, nan_fraction):
+    prices = _prices(seed, nan_fraction=nan_fraction)
+    assert np.array_equal(_stream(EMA(span), prices, seed), ema(prices, span), equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('nan_fraction', [0.0, 0.05, 0.3])
+def test_apo_matches_batch(seed, nan_fraction):
+    prices = _prices(seed, nan_fraction=nan_fraction)
+    streamed = _stream(APO(10, 40), prices, seed)
+    assert np.array_equal(streamed, apo(prices, 10, 40)[2], equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('nan_fraction', [0.0, 0.05, 0.3])
+def test_macd_matches_batch(seed, nan_fraction):
+    prices = _prices(seed, nan_fraction=nan_fraction)
+    streamed = _stream(MACD(12, 26, 9), prices, seed)
+    for values, expected in zip(streamed, macd(prices, 12, 26, 9)):
+        assert np.array_equal(values, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('mode', ['simple', 'wilder'])
+@pytest.mark.parametrize('window', [1, 14])
+@pytest.mark.parametrize('nan_fraction', [0.0, 0.05, 0.3])
+def test_rsi_matches_batch(seed, mode, window, nan_fraction):
+    prices = _prices(seed, nan_fraction=nan_fraction)
+    streamed = _stream(RSI(window, mode), prices, seed)
+    assert np.array_equal(streamed, rsi(prices, window, mode)[2], equal_nan=True)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('window', [1, 2, 20])
+@pytest.mark.parametrize('nan_fraction', [0.0, 0.05, 0.3])
+def test_momentum_matches_batch(seed, window, nan_fraction):
+    prices = _prices(seed, nan_fraction=nan_fraction)
+    streamed = _stream(Momentum(window), prices, seed)
+    assert np.array_equal(streamed, momentum(prices, window), equal_nan=True)
+
+
+@pytest.mark.parametrize('make', [lambda: EMA(10), lambda: APO(10, 40), lambda: MACD(12, 26, 9),
+                                  lambda: RSI(14, 'simple'), lambda: RSI(14, 'wilder'),
+                                  lambda: Momentum(20), lambda: RollingMoments(20),
+                                  lambda: StdDev(20), lambda: BollingerBands(20, 2)])
+def test_checkpoint_mid_stream_resumes_identically(make):
+    prices = _prices(7, nan_fraction=0.05)
+    whole, first = make(), make()
+    expected = [whole.update(price) for price in prices]
+    for price in prices[:300]:
+        first.update(price)
+    state = json.loads(json.dumps(first.get_state()))
+    resumed = type(first).from_state(state)
+    for calculator in (resumed, first): # taking the checkpoint leaves the original running
+        tail = [calculator.update(price) for price in prices[300:]]
+        assert np.array_equal(np.array(tail, dtype=np.float64),
+                              np.array(expected[300:], dtype=np.float64), equal_nan=True)
@@ -0,0 +1,98 @@
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from financial_indicators import metrics
+from financial_indicators.ema import apo, macd
+from financial_indicators.sweep import apo_grid, macd_grid, sweep_universe, write_macd_grid
+from financial_indicators.universe import Universe, UniverseWriter
+
+FAST, SLOW, SIGNAL = [3, 5, 12, 26], [5, 26, 40], [4, 9]
+
+
+def _prices(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    prices = 100 + np.cumsum(rng.normal(0, 1, n))
+    prices[[0, 17, 18]] = np.nan
+    return prices
+
+
+def _load(symbol_dir):
+    return [np.load(os.path.join(symbol_dir, name + '.npy'))
+            for name in ('apo', 'macd_signal', 'macd_histogram')]
+
+
+def test_grids_match_single_combinations():
+    prices = _prices()
+    grid = apo_grid(prices, FAST, SLOW)
+    line, signal, histogram = macd_grid(prices, FAST, SLOW, SIGNAL)
+    for i, fast in enumerate(FAST):
+        for j, slow in enumerate(SLOW):
+            assert np.array_equal(grid[i, j], apo(prices, fast, slow)[2], equal_nan=True)
+            assert np.array_equal(line[i, j], grid[i, j], equal_nan=True)
+            for k, span in enumerate(SIGNAL):
+                expected = macd(prices, fast, slow, span)
+                assert np.array_equal(signal[i, j, k], expected[1], equal_nan=True)
+                assert np.array_equal(histogram[i, j, k], expected[2], equal_nan=True)
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 20000, 1 << 30])
+@pytest.mark.parametrize('tail', [None, 50])
+def test_write_macd_grid_matches_macd_grid(tmp_path, chunk_bytes, tail):
+    prices = _prices()
+    write_macd_grid(prices, str(tmp_path), FAST, SLOW, SIGNAL, tail, chunk_bytes)
+    kept = slice(-tail if tail else None, None)
+    for stored, expected in zip(_load(str(tmp_path)), macd_grid(prices, FAST, SLOW, SIGNAL)):
+        assert np.array_equal(stored, expected[..., kept], equal_nan=True)
+
+
+@pytest.mark.parametrize('chunk_bytes', [4 << 20, 16 << 20])
+def test_write_macd_grid_memory_is_bounded(tmp_path, chunk_bytes):
+    prices = _prices(2000)
+    fast, slow = list(range(2, 201)), list(range(20, 60, 2))
+    write_macd_grid(prices, str(tmp_path), fast, slow, [9], chunk_bytes=chunk_bytes) # warm up
+    tracemalloc.start()
+    try:
+        write_macd_grid(prices, str(tmp_path), fast, slow, [9], chunk_bytes=chunk_bytes)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak <= chunk_bytes
+
+
+def _universe(path, lengths=(120, 0, 80, 200, 60)):
+    rng = np.random.default_rng(1)
+    with UniverseWriter(str(path)) as writer:
+        for i, length in enumerate(lengths):
+            dates = np.datetime64('2020-01-01') + np.arange(length)
+            writer.append('S%d' % i, dates, {'Close': 100 + np.cumsum(rng.normal(0, 1, length))})
+    return str(path)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_sweep_universe(tmp_path, processes):
+    path = _universe(tmp_path / 'universe')
+    out_dir = str(tmp_path / 'sweep')
+    was = metrics.enabled()
+    metrics.enable()
+    metrics.reset()
+    try:
+        spans = sweep_universe(path, out_dir, FAST, SLOW, SIGNAL, processes=processes, tail=40)
+        totals = metrics.snapshot()
+    finally:
+        metrics.enable(was)
+        metrics.reset()
+    assert spans == {'fast_spans': FAST, 'slow_spans': SLOW, 'signal_spans': SIGNAL}
+    # the workers' metrics reach the parent
+    assert totals['sweep.symbol']['calls'] == 5
+    assert totals['sweep.symbol']['rows'] == 460
+    assert totals['kernel.ema_kernel']['calls'] > 0
+
+    universe = Universe(path)
+    for symbol in universe.symbols:
+        prices = np.asarray(universe.series(symbol))
+        expected = macd_grid(prices, FAST, SLOW, SIGNAL)
+        for stored, values in zip(_load(os.path.join(out_dir, symbol)), expected):
+            assert np.array_equal(stored, values[..., -40:], equal_nan=True), symbol